@@ -1,5 +1,6 @@
 # backend/agents/orchestrator.py
 import json
+import functools
 from .biology_agent import BiologyAgent
 from .engineering_agent import EngineeringAgent
 from .tutor_agent import TutorAgent
@@ -14,6 +15,7 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from rag_service import rag_service
+from context_compressor import context_compressor
 
 import logging
 logger = logging.getLogger(__name__)
@@ -93,17 +95,19 @@ class OrchestratorAgent:
         intent = self._classify_intent(query, history)
         logger.info(f"Classified Intent: {intent}")
         
-        # Retrieve context from RAG Service
-        rag_contexts = rag_service.retrieve_context(query, top_k=2)
-        background_knowledge = "\n\n".join([
-            f"Excerpt from {c['metadata'].get('filename', 'Textbook')}:\n{c['content']}" 
-            for c in rag_contexts
-        ]) if rag_contexts else ""
+        # Retrieval is a lazy dependency: "evaluate" and "help" never read background
+        # knowledge, so the RAG lookup (and its embedding call) only runs on first use.
+        @functools.lru_cache(maxsize=None)
+        def background_knowledge() -> str:
+            # MMR keeps the two excerpts from being near-duplicates of each other
+            rag_contexts = rag_service.retrieve_context(query, top_k=2, filters={"course": course}, mmr_lambda=0.7)
+            # Keep only the passages relevant to the query, within the context token budget
+            return context_compressor.compress(query, rag_contexts) if rag_contexts else ""
         
         # Branch for non-bio courses
         if course != "bio-inspired":
             logger.info(f"Routing to general_tutor for course: {course}")
-            final_summary_dict = self.tutor_agent.general_tutor(query, course, current_content, background_knowledge, history)
+            final_summary_dict = self.tutor_agent.general_tutor(query, course, current_content, background_knowledge(), history)
             return {
                 "intent": "learn", # Fallback to learn card for generic content
                 "query": query,
@@ -133,7 +137,7 @@ class OrchestratorAgent:
             if not current_bio_context:
                 logger.info("Brainstorm intent missing bio context. Fetching from BiologyAgent...")
                 bio_response_dict = self.biology_agent.analyze_biology(
-                    query, grade_level, history=history, background_knowledge=background_knowledge
+                    query, grade_level, history=history, background_knowledge=background_knowledge()
                 )
                 current_bio_context = json.dumps(bio_response_dict, indent=2) if isinstance(bio_response_dict, dict) else str(bio_response_dict)
                 
@@ -149,7 +153,7 @@ class OrchestratorAgent:
             if not current_bio_context:
                 logger.info("Illustrate intent missing context. Fetching from BiologyAgent and EngineeringAgent...")
                 bio_response_dict = self.biology_agent.analyze_biology(
-                    query, grade_level, history=history, background_knowledge=background_knowledge
+                    query, grade_level, history=history, background_knowledge=background_knowledge()
                 )
                 current_bio_context = json.dumps(bio_response_dict, indent=2) if isinstance(bio_response_dict, dict) else str(bio_response_dict)
                 eng_response_dict = self.engineering_agent.analyze_engineering(query, interest, current_bio_context, history=history)
@@ -170,7 +174,7 @@ class OrchestratorAgent:
             if not current_bio_context:
                 logger.info("Simulate intent missing context. Fetching from BiologyAgent and EngineeringAgent...")
                 bio_response_dict = self.biology_agent.analyze_biology(
-                    query, grade_level, history=history, background_knowledge=background_knowledge
+                    query, grade_level, history=history, background_knowledge=background_knowledge()
                 )
                 current_bio_context = json.dumps(bio_response_dict, indent=2) if isinstance(bio_response_dict, dict) else str(bio_response_dict)
                 eng_response_dict = self.engineering_agent.analyze_engineering(query, interest, current_bio_context, history=history)
@@ -196,7 +200,7 @@ class OrchestratorAgent:
         else: # Default to "learn"
             # 1. Biology Expert Agent
             bio_response_dict = self.biology_agent.analyze_biology(
-                query, grade_level, history=history, background_knowledge=background_knowledge
+                query, grade_level, history=history, background_knowledge=background_knowledge()
             )
             logger.info("Biology Agent complete.")
             
@@ -0,0 +1,125 @@
+# backend/benchmarks/ann_recall.py - ANN vs Exact Search Benchmark
+"""
+Measures recall@k and query latency of the IVF approximate index against
+exact search on a synthetic clustered corpus (default: 100k chunks), then
+times end-to-end RAGService.upsert_document ingestion (hashing, dedup, local
+embedding, index write, snapshot publish) at doubling corpus sizes, so
+per-document costs that grow with the corpus show up as falling docs/s.
+Ingestion is timed both one snapshot per document and batched the way
+load_curriculum / sync_directory publish (one snapshot per INGEST_BATCH_SIZE).
+
+Usage:
+    python benchmarks/ann_recall.py --n 100000 --dim 768 --nlist 512 --nprobe 1 4 8 16 32
+    python benchmarks/ann_recall.py --n 0 --ingest 2000 4000 8000
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vector_index import ExactIndex, IVFIndex
+from rag_service import INGEST_BATCH_SIZE, RAGService
+
+
+def make_corpus(n: int, dim: int, n_topics: int, noise: float, seed: int):
+    """Clustered vectors roughly shaped like chunk embeddings of a multi-course corpus."""
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    labels = rng.integers(0, n_topics, size=n)
+    vectors = topics[labels] + noise * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors, topics
+
+
+def make_queries(topics: np.ndarray, n_queries: int, noise: float, seed: int):
+    rng = np.random.default_rng(seed + 1)
+    labels = rng.integers(0, len(topics), size=n_queries)
+    return topics[labels] + noise * rng.standard_normal((n_queries, topics.shape[1])).astype(np.float32)
+
+
+def timed_search(index, queries, k):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits = index.search(query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append({doc_id for doc_id, _ in hits})
+    return results, np.array(latencies)
+
+
+def timed_ingest(n_docs: int, backend: str, seed: int, batch_size: int = 1) -> float:
+    """Seconds to upsert n_docs synthetic sections into a fresh RAGService, publishing every batch_size."""
+    rng = np.random.default_rng(seed)
+    vocabulary = [f"term{i}" for i in range(5000)]
+    texts = [" ".join(rng.choice(vocabulary, size=80)) for _ in range(n_docs)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        service = RAGService(index_backend=backend, embedding_provider="local")
+        service.index_dir = None
+        start = time.perf_counter()
+        for first in range(0, n_docs, batch_size):
+            with service.batch_writes():
+                for i in range(first, min(first + batch_size, n_docs)):
+                    service.upsert_document(f"course{i % 4}/ch{i % 25}/s{i}.mdx", texts[i],
+                                            {"course": f"course{i % 4}", "chapter": f"ch{i % 25}"})
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=100_000, help="number of indexed chunks")
+    parser.add_argument("--dim", type=int, default=768, help="embedding dimension")
+    parser.add_argument("--topics", type=int, default=2000, help="latent topic clusters in the synthetic corpus")
+    parser.add_argument("--noise", type=float, default=1.5, help="within-topic spread (higher = harder for ANN)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=512)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--ingest", type=int, nargs="*", default=[2000, 4000, 8000],
+                        help="corpus sizes for the end-to-end upsert_document timing (none to skip)")
+    parser.add_argument("--backend", default="exact", help="index backend used for the ingestion timing")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.n > 0:
+        search_benchmark(args)
+    if args.ingest:
+        print(f"{'upserted docs':<22}{'publish every':>14}{'seconds':>10}{'docs/s':>10}")
+        for n_docs in args.ingest:
+            for batch_size in (1, INGEST_BATCH_SIZE):
+                seconds = timed_ingest(n_docs, args.backend, args.seed, batch_size)
+                print(f"{n_docs:<22}{batch_size:>14}{seconds:>10.2f}{n_docs / seconds:>10,.0f}")
+
+
+def search_benchmark(args):
+    print(f"Building corpus: {args.n} x {args.dim} ...")
+    vectors, topics = make_corpus(args.n, args.dim, args.topics, args.noise, args.seed)
+    queries = make_queries(topics, args.queries, args.noise, args.seed)
+    ids = [f"chunk-{i}" for i in range(args.n)]
+
+    exact = ExactIndex()
+    exact.add(ids, vectors)
+    truth, exact_ms = timed_search(exact, queries, args.k)
+    print(f"{'backend':<22}{'recall@' + str(args.k):>10}{'p50 ms':>10}{'p99 ms':>10}")
+    print(f"{'exact':<22}{1.0:>10.3f}{np.percentile(exact_ms, 50):>10.2f}{np.percentile(exact_ms, 99):>10.2f}")
+
+    ivf = IVFIndex(nlist=args.nlist, nprobe=args.nprobe[0], seed=args.seed)
+    ivf.add(ids, vectors)
+    start = time.perf_counter()
+    ivf.train()
+    print(f"(IVF training with nlist={args.nlist}: {time.perf_counter() - start:.1f}s)")
+
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        found, ivf_ms = timed_search(ivf, queries, args.k)
+        recall = np.mean([len(f & t) / len(t) for f, t in zip(found, truth)])
+        label = f"ivf nprobe={nprobe}"
+        print(f"{label:<22}{recall:>10.3f}{np.percentile(ivf_ms, 50):>10.2f}{np.percentile(ivf_ms, 99):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
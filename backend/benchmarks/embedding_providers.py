@@ -0,0 +1,94 @@
+# backend/benchmarks/embedding_providers.py - Embedding Provider Comparison
+"""
+Compares retrieval quality and latency of the lexical fallback, the local
+hashing provider and (when GEMINI_API_KEY is set) the remote Gemini provider.
+
+Queries are each section's title + learning objectives from *.meta.json; the
+relevant document is that section's .mdx.
+
+Usage:
+    python benchmarks/embedding_providers.py [--providers lexical local gemini]
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from content_service import CONTENT_DIR
+from rag_service import RAGService
+
+
+def load_queries(content_dir: str):
+    queries = []
+    for meta_path in glob.glob(os.path.join(content_dir, "**", "*.meta.json"), recursive=True):
+        mdx_path = meta_path.replace(".meta.json", ".mdx")
+        if not os.path.exists(mdx_path):
+            continue
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        text = " ".join([meta.get("title", "")] + list(meta.get("learning_objectives") or []))
+        if text.strip():
+            doc_id = os.path.relpath(mdx_path, content_dir).replace(os.sep, "/")
+            queries.append((text, doc_id))
+    return queries
+
+
+def build_service(provider: str) -> RAGService:
+    if provider == "lexical":
+        service = RAGService(embedding_provider="gemini", api_key="")
+        service.embedder = None
+        return service
+    return RAGService(embedding_provider=provider, index_dir="")
+
+
+def evaluate(provider: str, content_dir: str, queries, k: int):
+    service = build_service(provider)
+    if provider == "gemini" and service.embedder is None:
+        return None
+    start = time.perf_counter()
+    service.load_curriculum(content_dir)
+    build_s = time.perf_counter() - start
+
+    ranks, latencies = [], []
+    for text, relevant in queries:
+        start = time.perf_counter()
+        results = service.retrieve_context(text, top_k=k, reuse_results=False)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids = [doc["doc_id"] for doc in results]
+        ranks.append(ids.index(relevant) + 1 if relevant in ids else None)
+
+    return {
+        "provider": service.embedding_model if service.embedder else "lexical",
+        "recall@1": float(np.mean([r is not None and r <= 1 for r in ranks])),
+        f"recall@{k}": float(np.mean([r is not None for r in ranks])),
+        "mrr": float(np.mean([1.0 / r if r else 0.0 for r in ranks])),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "build_s": build_s,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--providers", nargs="+", default=["lexical", "local", "gemini"])
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    content_dir = str(CONTENT_DIR)
+    queries = load_queries(content_dir)
+    rows = [row for row in (evaluate(p, content_dir, queries, args.k) for p in args.providers) if row]
+
+    print(f"\n{len(queries)} queries")
+    print(f"{'provider':<24}{'recall@1':>10}{'recall@' + str(args.k):>10}{'MRR':>8}{'p50 ms':>10}{'build s':>10}")
+    for row in rows:
+        print(f"{row['provider']:<24}{row['recall@1']:>10.2f}{row[f'recall@{args.k}']:>10.2f}"
+              f"{row['mrr']:>8.2f}{row['p50_ms']:>10.2f}{row['build_s']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+# backend/benchmarks/pfa_vs_bkt.py - PFA vs BKT Prediction Benchmark
+"""
+Generates a synthetic classroom history with multi-concept items and student
+ability differences (which neither model has a term for), fits both engines on
+80% of the students, and replays the other 20%, predicting every attempt from
+the state before it. Reports prediction quality (AUC, log loss, RMSE,
+accuracy), fit time, replay throughput, and the time to predict P(correct)
+for a whole roster x item matrix from current state.
+
+BKT: per-concept parameters fitted by bkt_fitting (its default single-concept
+view: attempts with weight >= 0.5), replayed with BatchKnowledgeTracing and
+Q-matrix blending; an item's prediction is the weight-averaged per-concept
+P(correct), as the recommender computes it. PFA: pfa.PerformanceFactorsAnalysis.
+
+Usage:
+    python benchmarks/pfa_vs_bkt.py --students 2000 --attempts 60 --concepts 40 --workers 4
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bkt_fitting import build_sequences, fit_all
+from knowledge_tracing import BatchKnowledgeTracing
+from pfa import PerformanceFactorsAnalysis, sigmoid
+
+
+def make_history(n_students: int, n_attempts: int, n_concepts: int, n_problems: int, seed: int = 0):
+    """(student_ids, problem_ids, correct) in per-student time order, and {problem_id: q_matrix}."""
+    rng = np.random.default_rng(seed)
+    p_init = rng.uniform(0.05, 0.4, n_concepts)
+    guess = rng.uniform(0.1, 0.3, n_concepts)
+    slip = rng.uniform(0.05, 0.15, n_concepts)
+    transit = rng.uniform(0.05, 0.25, n_concepts)
+    primary = rng.integers(0, n_concepts, n_problems)
+    secondary = np.where(rng.random(n_problems) < 0.3, (primary + 1 + rng.integers(0, n_concepts - 1, n_problems))
+                         % n_concepts, -1)
+    q_matrices = {f"p{j}": ({f"c{primary[j]}": 1.0, f"c{secondary[j]}": 0.5} if secondary[j] >= 0
+                            else {f"c{primary[j]}": 1.0}) for j in range(n_problems)}
+
+    ability = rng.normal(0.0, 0.5, n_students)
+    learned = rng.random((n_students, n_concepts)) < p_init
+    students = np.repeat(np.arange(n_students), n_attempts)
+    problems = rng.integers(0, n_problems, n_students * n_attempts)
+    correct = np.empty(n_students * n_attempts, dtype=bool)
+    for t in range(n_attempts):
+        idx = np.arange(n_students) * n_attempts + t
+        j, k = problems[idx], primary[problems[idx]]
+        p = np.where(learned[np.arange(n_students), k], 1 - slip[k], guess[k])
+        has_secondary = secondary[j] >= 0
+        k2 = np.where(has_secondary, secondary[j], 0)
+        p = np.where(has_secondary & ~learned[np.arange(n_students), k2], p * 0.75, p)
+        p = sigmoid(np.log(p / (1 - p)) + ability)
+        correct[idx] = rng.random(n_students) < p
+        learned[np.arange(n_students), k] |= rng.random(n_students) < transit[k]
+        learned[np.arange(n_students), k2] |= has_secondary & (rng.random(n_students) < transit[k2] / 2)
+    student_ids = np.array([f"s{i}" for i in range(n_students)])[students]
+    problem_ids = np.array([f"p{j}" for j in range(n_problems)])[problems]
+    return student_ids, problem_ids, correct, q_matrices
+
+
+def auc(y: np.ndarray, p: np.ndarray) -> float:
+    """Rank-based ROC AUC (ties get average ranks)."""
+    order = np.argsort(p, kind="stable")
+    ranks = np.empty(len(p))
+    ranks[order] = np.arange(1, len(p) + 1)
+    _, inverse, counts = np.unique(p, return_inverse=True, return_counts=True)
+    ranks = (np.bincount(inverse, weights=ranks) / counts)[inverse]
+    positives = y.sum()
+    return float((ranks[y].sum() - positives * (positives + 1) / 2) / (positives * (len(y) - positives)))
+
+
+def metrics(y: np.ndarray, p: np.ndarray) -> dict:
+    p = np.clip(p, 1e-6, 1 - 1e-6)
+    return {
+        "auc": auc(y, p),
+        "log_loss": float(-np.mean(y * np.log(p) + (1 - y) * np.log(1 - p))),
+        "rmse": float(np.sqrt(np.mean((p - y) ** 2))),
+        "accuracy": float(np.mean((p >= 0.5) == y)),
+    }
+
+
+def bkt_replay_predictions(engine: BatchKnowledgeTracing, student_ids, attempt_q, correct) -> np.ndarray:
+    """Weight-averaged per-concept P(correct) before each attempt, via replay_indexed(priors_out=...)."""
+    attempt, concept_ids, weight = [], [], []
+    for i, q_matrix in enumerate(attempt_q):
+        for concept_id, w in q_matrix.items():
+            attempt.append(i)
+            concept_ids.append(concept_id)
+            weight.append(w)
+    attempt, weight = np.array(attempt), np.array(weight)
+    concepts, concept_codes = np.unique(concept_ids, return_inverse=True)
+    _, student_codes = np.unique(student_ids, return_inverse=True)
+    _, key = np.unique(student_codes[attempt] * len(concepts) + concept_codes, return_inverse=True)
+    fitted = [engine.concept_params.get(c, {}) for c in concepts.tolist()]
+    params = np.array([[f.get("p_init", engine.p_init_default), f.get("p_guess", engine.p_guess_default),
+                        f.get("p_slip", engine.p_slip_default), f.get("p_transit", engine.p_transit_default)]
+                       for f in fitted])[concept_codes]
+    p = np.zeros(key.max() + 1)
+    p[key] = params[:, 0]
+    priors = np.empty(len(key))
+    engine.replay_indexed(key, p, correct[attempt], params[:, 1], params[:, 2], params[:, 3], weight,
+                          priors_out=priors)
+    p_correct = priors * (1 - params[:, 2]) + (1 - priors) * params[:, 1]
+    return np.bincount(attempt, weights=weight * p_correct) / np.bincount(attempt, weights=weight)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--attempts", type=int, default=60, help="attempts per student")
+    parser.add_argument("--concepts", type=int, default=40)
+    parser.add_argument("--problems", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=None, help="process pool size for BKT fitting")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    student_ids, problem_ids, correct, q_matrices = make_history(args.students, args.attempts, args.concepts,
+                                                                 args.problems, args.seed)
+    test = np.array([int(s[1:]) % 5 == 0 for s in student_ids.tolist()])
+    train = ~test
+    attempt_q = [q_matrices[j] for j in problem_ids.tolist()]
+    train_q = [q for q, keep in zip(attempt_q, train.tolist()) if keep]
+    test_q = [q for q, keep in zip(attempt_q, test.tolist()) if keep]
+
+    start = time.perf_counter()
+    events = ((s, i, 1, "attempt", (j, bool(ok))) for i, (s, j, ok) in
+              enumerate(zip(student_ids[train].tolist(), problem_ids[train].tolist(), correct[train].tolist())))
+    bkt_params = fit_all(build_sequences(events, q_matrices, 0.5, 200), min_students=20, workers=args.workers)
+    bkt_fit_s = time.perf_counter() - start
+
+    pfa = PerformanceFactorsAnalysis(concept_params={})
+    start = time.perf_counter()
+    pfa.fit(student_ids[train], train_q, correct[train])
+    pfa_fit_s = time.perf_counter() - start
+
+    y = correct[test]
+    results = {}
+    for label, engine in (("BKT (defaults)", BatchKnowledgeTracing(concept_params={})),
+                          ("BKT (fitted)", BatchKnowledgeTracing(concept_params=bkt_params))):
+        start = time.perf_counter()
+        predictions = bkt_replay_predictions(engine, student_ids[test], test_q, y)
+        results[label] = (metrics(y, predictions), time.perf_counter() - start)
+    start = time.perf_counter()
+    predictions = pfa.replay_predictions(student_ids[test], test_q, y)
+    results["PFA (fitted)"] = (metrics(y, predictions), time.perf_counter() - start)
+
+    print(f"{args.students} students x {args.attempts} attempts, {args.concepts} concepts, {args.problems} problems "
+          f"(~30% two-concept); {train.sum()} training / {test.sum()} held-out attempts")
+    print(f"fit: BKT grid search {bkt_fit_s:.2f}s, PFA Newton {pfa_fit_s:.2f}s")
+    print(f"{'engine':<16}{'AUC':>8}{'log loss':>10}{'RMSE':>8}{'acc':>7}{'replay s':>10}{'attempts/s':>13}")
+    for label, (m, seconds) in results.items():
+        print(f"{label:<16}{m['auc']:>8.4f}{m['log_loss']:>10.4f}{m['rmse']:>8.4f}{m['accuracy']:>7.3f}"
+              f"{seconds:>10.3f}{len(y) / seconds:>13,.0f}")
+
+    # Live prediction: P(correct) for every (student, problem) from current per-concept state
+    concepts = [f"c{k}" for k in range(args.concepts)]
+    problems = list(q_matrices.values())
+    rng = np.random.default_rng(args.seed + 1)
+    attempts = rng.integers(0, 8, (args.students, args.concepts))
+    successes = rng.binomial(attempts, 0.6)
+    roster_rows = [{c: {"attempts_count": int(a), "correct_count": int(s)} for c, a, s in zip(concepts, a_row, s_row)
+                    if a} for a_row, s_row in zip(attempts, successes)]
+    counts = pfa.count_matrix(concepts, roster_rows)
+    start = time.perf_counter()
+    pfa.predict_correct(counts, concepts, problems)
+    pfa_live_s = time.perf_counter() - start
+
+    engine = BatchKnowledgeTracing(concept_params=bkt_params)
+    p_known = rng.random((args.students, args.concepts))
+    q = np.zeros((args.concepts, len(problems)))
+    for j, q_matrix in enumerate(problems):
+        for c, w in q_matrix.items():
+            q[int(c[1:]), j] = w
+    start = time.perf_counter()
+    guess = np.array([bkt_params.get(c, {}).get("p_guess", engine.p_guess_default) for c in concepts])
+    slip = np.array([bkt_params.get(c, {}).get("p_slip", engine.p_slip_default) for c in concepts])
+    (p_known * (1 - slip) + (1 - p_known) * guess) @ q / q.sum(axis=0)
+    bkt_live_s = time.perf_counter() - start
+    cells = args.students * len(problems)
+    print(f"live roster x problem P(correct), {cells:,} cells: PFA sparse matmul {pfa_live_s * 1000:.1f} ms, "
+          f"BKT dense matmul {bkt_live_s * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# backend/benchmarks/quantization.py - Quantized Index Benchmark
+"""
+Measures scan memory, query latency and recall@k of int8 / binary quantized
+indexes (with float32 rescoring of a shortlist) against exact float32 search.
+
+Usage:
+    python benchmarks/quantization.py --n 100000 --dim 768 --rescore 64 256 1024
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vector_index import ExactIndex, QuantizedIndex
+from benchmarks.ann_recall import make_corpus, make_queries, timed_search
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--topics", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=1.5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore", type=int, nargs="+", default=[64, 256, 1024])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"Building corpus: {args.n} x {args.dim} ...")
+    vectors, topics = make_corpus(args.n, args.dim, args.topics, args.noise, args.seed)
+    queries = make_queries(topics, args.queries, args.noise, args.seed)
+    ids = [f"chunk-{i}" for i in range(args.n)]
+
+    exact = ExactIndex()
+    exact.add(ids, vectors)
+    truth, exact_ms = timed_search(exact, queries, args.k)
+    exact_mb = exact.matrix.nbytes / 2**20
+    exact_p50 = np.percentile(exact_ms, 50)
+
+    print(f"{'backend':<26}{'scan MB':>10}{'mem x':>8}{'p50 ms':>10}{'speedup':>9}{'recall@' + str(args.k):>11}")
+    print(f"{'exact float32':<26}{exact_mb:>10.1f}{1.0:>8.1f}{exact_p50:>10.2f}{1.0:>9.2f}{1.0:>11.3f}")
+
+    for quantization in ("int8", "binary"):
+        index = QuantizedIndex(quantization=quantization)
+        index.add(ids, vectors)
+        scan_mb = index.code_bytes() / 2**20
+        for rescore in args.rescore:
+            index.rescore = rescore
+            found, ms = timed_search(index, queries, args.k)
+            recall = np.mean([len(f & t) / len(t) for f, t in zip(found, truth)])
+            p50 = np.percentile(ms, 50)
+            label = f"{quantization} rescore={rescore}"
+            print(f"{label:<26}{scan_mb:>10.1f}{exact_mb / scan_mb:>8.1f}{p50:>10.2f}"
+                  f"{exact_p50 / p50:>9.2f}{recall:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# backend/benchmarks/retrieval.py - RAG Retrieval Benchmark Harness
+"""
+Builds a RAGService with a chosen configuration, runs the versioned gold set of
+(query, relevant section) pairs against it, and reports recall@k, MRR, p50/p99
+query latency, index build time and memory. Results are written as JSON so runs
+can be compared (e.g. before/after a retrieval change).
+
+The gold set lives in benchmarks/gold/retrieval_v<N>.jsonl: one query per
+learning objective in frontend/content/**/*.meta.json, with that section's
+.mdx as the relevant document. Objectives are short and often share little
+vocabulary with their section, so this is harder than title-based queries.
+Regenerate it (as a new version) with --write-gold when the curriculum changes.
+
+Usage:
+    python benchmarks/retrieval.py --provider local --backend exact
+    python benchmarks/retrieval.py --provider local --backend ivf --param nlist=8 --param nprobe=2 \\
+        --course-filter --output results/ivf.json
+    python benchmarks/retrieval.py --write-gold benchmarks/gold/retrieval_v2.jsonl
+"""
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from content_service import CONTENT_DIR
+from rag_service import RAGService
+
+GOLD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gold")
+DEFAULT_GOLD = os.path.join(GOLD_DIR, "retrieval_v1.jsonl")
+
+
+def build_gold(content_dir: str):
+    """One query per learning objective; the relevant doc is the objective's section."""
+    rows = []
+    for meta_path in sorted(glob.glob(os.path.join(content_dir, "**", "*.meta.json"), recursive=True)):
+        mdx_path = meta_path.replace(".meta.json", ".mdx")
+        if not os.path.exists(mdx_path):
+            continue
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        doc_id = os.path.relpath(mdx_path, content_dir).replace(os.sep, "/")
+        for objective in meta.get("learning_objectives") or []:
+            if objective.strip():
+                rows.append({"query": objective.strip(), "relevant": [doc_id], "course": doc_id.split("/")[0]})
+    return rows
+
+
+def load_gold(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def parse_params(pairs):
+    params = {}
+    for pair in pairs or []:
+        key, _, value = pair.partition("=")
+        try:
+            params[key] = int(value)
+        except ValueError:
+            params[key] = float(value) if value.replace(".", "", 1).isdigit() else value
+    return params
+
+
+def index_bytes(index) -> int:
+    if hasattr(index, "code_bytes"):
+        return int(index.code_bytes())
+    matrix = getattr(index, "matrix", None)
+    return int(matrix.nbytes) if matrix is not None else 0
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(gold, provider: str, backend: str, params: dict, ks, course_filter: bool, content_dir: str,
+        mmr_lambda: float = None) -> dict:
+    if provider == "lexical":
+        service = RAGService(embedding_provider="gemini", api_key="", index_dir="")
+        service.embedder = None
+    else:
+        service = RAGService(embedding_provider=provider, index_backend=backend, index_params=params, index_dir="")
+        if service.embedder is None:
+            raise SystemExit(f"Provider '{provider}' is unavailable (is GEMINI_API_KEY set?)")
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    service.load_curriculum(content_dir)
+    build_s = time.perf_counter() - start
+    _, build_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    max_k = max(ks)
+    ranks, latencies = [], []
+    for row in gold:
+        filters = {"course": row["course"]} if course_filter else None
+        start = time.perf_counter()
+        results = service.retrieve_context(row["query"], top_k=max_k, reuse_results=False, filters=filters,
+                                           mmr_lambda=mmr_lambda)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids = [doc["doc_id"] for doc in results]
+        hits = [i + 1 for i, doc_id in enumerate(ids) if doc_id in row["relevant"]]
+        ranks.append(hits[0] if hits else None)
+
+    metrics = {f"recall@{k}": float(np.mean([r is not None and r <= k for r in ranks])) for k in ks}
+    metrics["mrr"] = float(np.mean([1.0 / r if r else 0.0 for r in ranks]))
+    metrics["latency_ms"] = {
+        "p50": float(np.percentile(latencies, 50)),
+        "p99": float(np.percentile(latencies, 99)),
+        "mean": float(np.mean(latencies)),
+    }
+    metrics["build_s"] = build_s
+    metrics["memory"] = {
+        "build_peak_mb": build_peak / 2**20,
+        "index_mb": index_bytes(service.vector_index) / 2**20,
+    }
+    return {
+        "config": {
+            "provider": service.embedding_model if service.embedder else "lexical",
+            "backend": backend if service.embedder else None,
+            "index_params": params,
+            "course_filter": course_filter,
+            "mmr_lambda": mmr_lambda,
+            "documents": len(service.knowledge_base) or len(service.lexical_corpus),
+        },
+        "metrics": metrics,
+        "misses": [row["query"] for row, r in zip(gold, ranks) if r is None],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gold", default=DEFAULT_GOLD)
+    parser.add_argument("--provider", default="local", choices=["lexical", "local", "gemini"])
+    parser.add_argument("--backend", default="exact", choices=["exact", "ivf", "int8", "binary"])
+    parser.add_argument("--param", action="append", help="index parameter key=value (repeatable)")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5, 10])
+    parser.add_argument("--mmr-lambda", type=float, help="enable MMR diversity re-ranking")
+    parser.add_argument("--course-filter", action="store_true", help="pre-filter each query to its course")
+    parser.add_argument("--output", help="write the JSON result here (default: stdout only)")
+    parser.add_argument("--write-gold", metavar="PATH", help="regenerate the gold set to PATH and exit")
+    args = parser.parse_args()
+
+    content_dir = str(CONTENT_DIR)
+    if args.write_gold:
+        rows = build_gold(content_dir)
+        os.makedirs(os.path.dirname(os.path.abspath(args.write_gold)), exist_ok=True)
+        with open(args.write_gold, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        print(f"Wrote {len(rows)} gold queries to {args.write_gold}")
+        return
+
+    gold = load_gold(args.gold)
+    result = run(gold, args.provider, args.backend, parse_params(args.param), sorted(args.k),
+                 args.course_filter, content_dir, args.mmr_lambda)
+    result["gold"] = {"path": os.path.relpath(args.gold), "queries": len(gold)}
+    result["revision"] = git_revision()
+    result["timestamp"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# backend/bkt_fitting.py - Offline Per-Concept BKT Parameter Fitting
+"""
+Estimates p_init / p_guess / p_slip / p_transit for every concept from the
+attempts history and writes them to the lookup the online path reads
+(knowledge_tracing.BKT_PARAMS_PATH, default backend/bkt_params.json).
+
+Fitting is a vectorized maximum-likelihood grid search: for one concept, all
+students' answer sequences are padded into an (N, T) matrix, and the BKT
+forward pass runs for every grid point at once as a (K, N) array per time
+step. A coarse grid is followed by a finer grid around the best point.
+Guess and slip are capped below 0.5 so "knowing" stays the state that answers
+correctly, which rules out the degenerate BKT solutions. Concepts run in
+parallel in a process pool.
+
+Usage:
+    python bkt_fitting.py --attempts attempts.csv --problems problems.json --workers 4
+    SUPABASE_URL=... SUPABASE_SERVICE_KEY=... python bkt_fitting.py --supabase
+"""
+
+import argparse
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from knowledge_tracing import BKT_PARAMS_PATH
+from mastery_replay import add_attempts_arguments, atomic_write_json, load_attempts_input
+
+COARSE_GRID = {
+    "p_init": np.linspace(0.05, 0.8, 8),
+    "p_guess": np.linspace(0.05, 0.35, 7),
+    "p_slip": np.linspace(0.02, 0.3, 8),
+    "p_transit": np.linspace(0.02, 0.4, 8),
+}
+PARAM_BOUNDS = {"p_init": (0.01, 0.95), "p_guess": (0.01, 0.45), "p_slip": (0.01, 0.45), "p_transit": (0.005, 0.6)}
+GRID_CHUNK = 512
+
+
+def log_likelihood(obs: np.ndarray, mask: np.ndarray, p_init, p_guess, p_slip, p_transit) -> np.ndarray:
+    """
+    Total log-likelihood of the sequences under each of K parameter sets.
+    obs/mask: (N, T) bool; parameter arrays: (K,). Returns (K,).
+    """
+    init, guess, slip, transit = (np.asarray(v, dtype=np.float64)[:, None] for v in (p_init, p_guess, p_slip, p_transit))
+    p = np.broadcast_to(init, (len(init), obs.shape[0])).copy()
+    total = np.zeros(len(init))
+    for t in range(obs.shape[1]):
+        correct, active = obs[:, t], mask[:, t]
+        p_correct = p * (1 - slip) + (1 - p) * guess
+        likelihood = np.where(correct, p_correct, 1 - p_correct)
+        total += np.log(likelihood, where=active, out=np.zeros_like(likelihood)).sum(axis=1)
+        posterior = np.where(correct, p * (1 - slip) / p_correct, p * slip / (1 - p_correct))
+        p = np.where(active, posterior + (1 - posterior) * transit, p)
+    return total
+
+
+def grid_search(obs: np.ndarray, mask: np.ndarray, grid: Dict[str, np.ndarray]) -> Tuple[Dict[str, float], float]:
+    names = list(grid)
+    points = np.array(list(itertools.product(*(grid[n] for n in names))))
+    scores = np.concatenate([
+        log_likelihood(obs, mask, *points[start:start + GRID_CHUNK].T)
+        for start in range(0, len(points), GRID_CHUNK)
+    ])
+    best = int(np.argmax(scores))
+    return dict(zip(names, points[best].tolist())), float(scores[best])
+
+
+def fit_concept(task) -> Tuple[str, Dict]:
+    """Coarse grid, then a 5-point-per-parameter grid one coarse step around the best point."""
+    concept_id, obs, mask = task
+    best, _ = grid_search(obs, mask, COARSE_GRID)
+    fine = {}
+    for name, value in best.items():
+        step = COARSE_GRID[name][1] - COARSE_GRID[name][0]
+        low, high = PARAM_BOUNDS[name]
+        fine[name] = np.unique(np.clip(np.linspace(value - step, value + step, 5), low, high))
+    best, ll = grid_search(obs, mask, fine)
+    result = {name: round(value, 4) for name, value in best.items()}
+    result.update(students=int(obs.shape[0]), attempts=int(mask.sum()), log_likelihood=round(ll, 3))
+    return concept_id, result
+
+
+def build_sequences(events, q_matrices: Dict[str, Dict[str, float]], min_weight: float,
+                    max_length: int) -> Dict[str, List[List[bool]]]:
+    """concept_id -> one answer sequence per student, from attempts sorted by (user_id, created_at)."""
+    sequences: Dict[str, Dict[str, List[bool]]] = {}
+    for user_id, _, _, _, (problem_id, is_correct) in events:
+        for concept_id, weight in (q_matrices.get(problem_id) or {}).items():
+            if weight >= min_weight:
+                history = sequences.setdefault(concept_id, {}).setdefault(user_id, [])
+                if len(history) < max_length:
+                    history.append(is_correct)
+    return {concept_id: list(by_user.values()) for concept_id, by_user in sequences.items()}
+
+
+def pad(sequences: List[List[bool]]) -> Tuple[np.ndarray, np.ndarray]:
+    length = max(len(s) for s in sequences)
+    obs = np.zeros((len(sequences), length), dtype=bool)
+    mask = np.zeros((len(sequences), length), dtype=bool)
+    for row, sequence in enumerate(sequences):
+        obs[row, :len(sequence)] = sequence
+        mask[row, :len(sequence)] = True
+    return obs, mask
+
+
+def fit_all(sequences: Dict[str, List[List[bool]]], min_students: int, workers: int = None) -> Dict[str, Dict]:
+    tasks = [(concept_id, *pad(seqs)) for concept_id, seqs in sorted(sequences.items()) if len(seqs) >= min_students]
+    if not tasks:
+        return {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Largest concepts first so one big concept does not finish last on an idle pool
+        tasks.sort(key=lambda task: -task[2].sum())
+        return dict(pool.map(fit_concept, tasks))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_attempts_arguments(parser)
+    parser.add_argument("--output", default=BKT_PARAMS_PATH)
+    parser.add_argument("--workers", type=int, default=None, help="process pool size (default: CPU count)")
+    parser.add_argument("--min-students", type=int, default=20, help="concepts with fewer keep the defaults")
+    parser.add_argument("--min-weight", type=float, default=0.5, help="q_matrix weight for an attempt to count")
+    parser.add_argument("--max-length", type=int, default=200, help="attempts per student and concept to use")
+    args = parser.parse_args()
+
+    q_matrices, events = load_attempts_input(parser, args)
+
+    start = time.perf_counter()
+    sequences = build_sequences(events, q_matrices, args.min_weight, args.max_length)
+    concepts = fit_all(sequences, args.min_students, args.workers)
+    elapsed = time.perf_counter() - start
+
+    lookup = {
+        "fitted_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "method": "grid-search MLE (coarse + fine)",
+        "concepts": concepts,
+    }
+    atomic_write_json(args.output, lookup, indent=2)
+    skipped = len(sequences) - len(concepts)
+    print(f"[BKT Fitting] Fitted {len(concepts)} concepts ({skipped} below --min-students) in {elapsed:.1f}s "
+          f"-> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# backend/context_compressor.py - Extractive Context Compression
+"""
+Packs the passages of retrieved documents that are most relevant to a query
+into a fixed token budget, instead of concatenating or blindly truncating them.
+
+Passages (paragraphs, tables, list blocks) are scored with a blend of
+IDF-weighted lexical overlap and embedding cosine similarity, picked greedily
+by score until the budget is full, then emitted in their original reading
+order under their nearest section heading.
+"""
+
+import math
+import os
+import re
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from embedding_providers import EmbeddingProvider, HashingEmbeddingProvider
+
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("RAG_CONTEXT_TOKEN_BUDGET", "1500"))
+
+_HEADING = re.compile(r"^\s{0,3}#{1,6}\s+(.*)$")
+_TAG = re.compile(r"<[^>]+>")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English prose)."""
+    return max(1, len(text) // 4)
+
+
+def _terms(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def split_passages(text: str) -> List[Dict[str, str]]:
+    """Splits markdown/MDX into blank-line separated passages tagged with their heading."""
+    passages = []
+    heading = ""
+    for block in re.split(r"\n\s*\n", text):
+        # JSX/HTML wrappers carry no meaning for the model, only tokens
+        block = re.sub(r"[ \t]+", " ", _TAG.sub(" ", block)).strip()
+        if not block or set(block) <= set("-*_ "):
+            continue
+        match = _HEADING.match(block.splitlines()[0])
+        if match:
+            heading = match.group(1).strip()
+            body = "\n".join(block.splitlines()[1:]).strip()
+            if not body:
+                continue
+            block = body
+        passages.append({"heading": heading, "text": block})
+    return passages
+
+
+def truncate_passage(passage: Dict, token_budget: int) -> Dict:
+    """Cuts a passage's text at a word boundary so text plus heading fit token_budget."""
+    heading_cost = estimate_tokens(passage["heading"]) if passage["heading"] else 0
+    max_chars = max(0, token_budget - heading_cost) * 4
+    text = passage["text"]
+    if len(text) > max_chars:
+        cut = text[:max_chars]
+        text = cut.rsplit(None, 1)[0] if " " in cut.strip() else cut
+    return {**passage, "text": text}
+
+
+class ContextCompressor:
+    """
+    token_budget:   maximum estimated tokens of the packed context.
+    embedder:       provider used for passage/query similarity. Defaults to the
+                    local hashing provider so compression adds no API calls.
+    lexical_weight: share of the score from lexical overlap (rest is embedding).
+    """
+
+    def __init__(self, token_budget: int = None, embedder: Optional[EmbeddingProvider] = None,
+                 lexical_weight: float = 0.5):
+        self.token_budget = token_budget or DEFAULT_TOKEN_BUDGET
+        self.embedder = embedder or HashingEmbeddingProvider()
+        self.lexical_weight = lexical_weight
+
+    def _lexical_scores(self, query: str, passages: List[Dict]) -> np.ndarray:
+        query_terms = set(_terms(query))
+        passage_terms = [_terms(p["heading"] + " " + p["text"]) for p in passages]
+        doc_freq = {t: sum(1 for terms in passage_terms if t in terms) for t in query_terms}
+        scores = np.zeros(len(passages), dtype=np.float32)
+        for i, terms in enumerate(passage_terms):
+            if not terms:
+                continue
+            counts = {}
+            for term in terms:
+                if term in query_terms:
+                    counts[term] = counts.get(term, 0) + 1
+            scores[i] = sum(
+                (1 + math.log(count)) * math.log(1 + len(passages) / doc_freq[term])
+                for term, count in counts.items()
+            )
+        peak = scores.max() if len(scores) else 0
+        return scores / peak if peak > 0 else scores
+
+    def _embedding_scores(self, query: str, passages: List[Dict]) -> np.ndarray:
+        vectors = np.asarray(self.embedder.embed([query] + [p["heading"] + "\n" + p["text"] for p in passages]),
+                             dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1)
+        norms[norms == 0] = 1.0
+        vectors /= norms[:, None]
+        return np.clip(vectors[1:] @ vectors[0], 0.0, 1.0)
+
+    def compress(self, query: str, documents: Sequence[Dict], token_budget: int = None) -> str:
+        """
+        documents: dicts with "content" and an optional "source" label (RAG results
+        also work: their metadata filename is used as the label).
+        Returns the packed context string, at most ~token_budget tokens.
+        """
+        budget = token_budget or self.token_budget
+        passages = []
+        for doc_index, doc in enumerate(documents):
+            source = doc.get("source") or doc.get("metadata", {}).get("filename", "Textbook")
+            for position, passage in enumerate(split_passages(doc.get("content", ""))):
+                passages.append({**passage, "source": source, "doc": doc_index, "position": position})
+        if not passages:
+            return ""
+
+        # Charging each passage for its heading keeps the emitted text within budget
+        costs = [estimate_tokens(p["text"]) + (estimate_tokens(p["heading"]) if p["heading"] else 0)
+                 for p in passages]
+        if sum(costs) <= budget:
+            selected = passages
+        else:
+            scores = self.lexical_weight * self._lexical_scores(query, passages)
+            if self.lexical_weight < 1.0:
+                scores += (1 - self.lexical_weight) * self._embedding_scores(query, passages)
+            ranked = np.argsort(-scores, kind="stable")
+            selected, used = [], 0
+            for i in ranked:
+                if used + costs[i] <= budget:
+                    selected.append(passages[i])
+                    used += costs[i]
+            if not selected:
+                # Every passage alone exceeds the budget: a cut best passage beats no context
+                selected = [truncate_passage(passages[ranked[0]], budget)]
+            selected.sort(key=lambda p: (p["doc"], p["position"]))
+
+        parts, current_doc, current_heading = [], None, None
+        for passage in selected:
+            if passage["doc"] != current_doc:
+                parts.append(f"Excerpt from {passage['source']}:")
+                current_doc, current_heading = passage["doc"], None
+            if passage["heading"] and passage["heading"] != current_heading:
+                parts.append(f"## {passage['heading']}")
+                current_heading = passage["heading"]
+            parts.append(passage["text"])
+        return "\n\n".join(parts)
+
+
+context_compressor = ContextCompressor()
@@ -0,0 +1,207 @@
+# backend/curriculum_graph.py - Concept Prerequisite Graph from the Content Tree
+"""
+Builds each course's concept DAG from frontend/content/<course>/**/*.meta.json:
+
+- Nodes are the sections' `concept_ids`; a concept listed by several sections
+  is one node that belongs to all of them.
+- Edges come from `prerequisites` / `physics_prereqs` (concept ids a section's
+  concepts need) and `prereq_section_ids` ("chapter/section" whose concepts are
+  needed). A prerequisite concept no section teaches becomes an "external" node.
+- `math_prereqs` are background skills, not curriculum concepts, and are ignored.
+- Optional `concept_labels` ({concept_id: label}) name nodes; otherwise ids are title-cased.
+
+Graphs are cached per course and rebuilt only when a meta file is added,
+removed or modified (mtime), like the fitted BKT parameter lookup.
+The mastery overlay is vectorized: node mastery is one array gather, and
+transitive prerequisite readiness (the weakest mastery along any prerequisite
+chain) is propagated one topological level at a time with np.minimum.at.
+"""
+
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from content_service import CONTENT_DIR
+
+MASTERED_THRESHOLD = 0.8
+EMERGING_THRESHOLD = 0.5
+PREREQ_FIELDS = ("prerequisites", "physics_prereqs")
+
+
+def mastery_status(p_known: float) -> str:
+    if p_known > MASTERED_THRESHOLD:
+        return "mastered"
+    if p_known > EMERGING_THRESHOLD:
+        return "emerging"
+    return "novice"
+
+
+class CurriculumGraph:
+    def __init__(self, course: str, sections: List[dict]):
+        """sections: parsed metas in reading order, each with "id" ("chapter/section") added."""
+        self.course = course
+        self.concepts: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.labels: Dict[str, str] = {}
+        self.concept_sections: Dict[str, List[str]] = {}
+        self.sections = []
+
+        def node(concept_id: str) -> int:
+            if concept_id not in self.index:
+                self.index[concept_id] = len(self.concepts)
+                self.concepts.append(concept_id)
+                self.concept_sections[concept_id] = []
+            return self.index[concept_id]
+
+        for meta in sections:
+            concept_ids = [c for c in meta.get("concept_ids") or [] if c]
+            for concept_id in concept_ids:
+                node(concept_id)
+                self.concept_sections[concept_id].append(meta["id"])
+            self.labels.update(meta.get("concept_labels") or {})
+            self.sections.append({"id": meta["id"], "title": meta.get("title", meta["id"]), "concept_ids": concept_ids})
+
+        section_concepts = {section["id"]: section["concept_ids"] for section in self.sections}
+        edges = set()
+        for meta, section in zip(sections, self.sections):
+            required = [c for field in PREREQ_FIELDS for c in meta.get(field) or [] if c]
+            for section_id in meta.get("prereq_section_ids") or []:
+                # Accept "chapter/section" or "course/chapter/section"
+                required.extend(section_concepts.get(section_id.split(f"{self.course}/", 1)[-1], []))
+            for prereq in required:
+                source = node(prereq)
+                for concept_id in section["concept_ids"]:
+                    target = self.index[concept_id]
+                    if source != target:
+                        edges.add((source, target))
+
+        n = len(self.concepts)
+        edge_array = np.array(sorted(edges), dtype=np.int64).reshape(-1, 2)
+        self.source, self.target = edge_array[:, 0], edge_array[:, 1]
+        self.level, acyclic = self._levels(n)
+        if not acyclic.all():
+            # Content error: drop edges among the nodes left in a cycle instead of failing the endpoint
+            cyclic = [self.concepts[i] for i in np.flatnonzero(~acyclic)]
+            print(f"[Curriculum Graph] {course}: prerequisite cycle at or upstream of {cyclic}; "
+                  f"ignoring edges among them")
+            keep = acyclic[self.source] | acyclic[self.target]
+            self.source, self.target = self.source[keep], self.target[keep]
+            self.level, _ = self._levels(n)
+
+    def _levels(self, n: int):
+        """Longest-path depth per node (Kahn's algorithm) and which nodes were reached (False = on a cycle)."""
+        indegree = np.bincount(self.target, minlength=n)
+        level = np.zeros(n, dtype=np.int64)
+        done = np.zeros(n, dtype=bool)
+        frontier = np.flatnonzero(indegree == 0)
+        depth = 0
+        while len(frontier):
+            level[frontier] = depth
+            done[frontier] = True
+            outgoing = np.isin(self.source, frontier)
+            np.subtract.at(indegree, self.target[outgoing], 1)
+            frontier = np.setdiff1d(np.flatnonzero(indegree == 0), np.flatnonzero(done))
+            depth += 1
+        return level, done
+
+    def label(self, concept_id: str) -> str:
+        return self.labels.get(concept_id) or concept_id.replace("_", " ").title()
+
+    def readiness(self, p_known: np.ndarray) -> np.ndarray:
+        """
+        Per node, the lowest mastery among all transitive prerequisites (1.0 with none):
+        ready[v] = min over edges u->v of min(p_known[u], ready[u]).
+        """
+        ready = np.ones(len(self.concepts), dtype=np.float64)
+        if len(self.source) == 0:
+            return ready
+        edge_level = self.level[self.target]
+        for depth in range(1, int(self.level.max()) + 1):
+            at_level = edge_level == depth
+            source = self.source[at_level]
+            np.minimum.at(ready, self.target[at_level], np.minimum(p_known[source], ready[source]))
+        return ready
+
+    def overlay(self, mastery: Dict[str, float], default_p: Dict[str, float] = None,
+                fallback: float = 0.1) -> dict:
+        """Node-link JSON with mastery, status and readiness per concept, plus per-section rollups."""
+        default_p = default_p or {}
+        p_known = np.array([mastery.get(c, default_p.get(c, fallback)) for c in self.concepts], dtype=np.float64)
+        ready = self.readiness(p_known)
+        nodes = [
+            {
+                "id": concept_id,
+                "label": self.label(concept_id),
+                "group": (self.concept_sections[concept_id] or ["external"])[0].split("/")[0],
+                "sections": self.concept_sections[concept_id],
+                "level": int(level),
+                "p_known": round(float(p), 2),
+                "status": mastery_status(float(p)),
+                "readiness": round(float(r), 2),
+                "ready": bool(r > MASTERED_THRESHOLD),
+            }
+            for concept_id, level, p, r in zip(self.concepts, self.level.tolist(), p_known.tolist(), ready.tolist())
+        ]
+        links = [{"source": self.concepts[s], "target": self.concepts[t]}
+                 for s, t in zip(self.source.tolist(), self.target.tolist())]
+        sections = []
+        for section in self.sections:
+            idx = [self.index[c] for c in section["concept_ids"]]
+            sections.append({
+                **section,
+                "p_known": round(float(p_known[idx].mean()), 2) if idx else None,
+                "readiness": round(float(ready[idx].min()), 2) if idx else None,
+            })
+        return {"course": self.course, "nodes": nodes, "links": links, "sections": sections}
+
+
+_graph_cache: Dict[str, tuple] = {}
+_graph_lock = threading.Lock()
+
+
+def course_dir_for(course: str, content_dir: str = None) -> Optional[str]:
+    """The course's content directory, or None if it does not exist (or the name is not a plain directory name)."""
+    course_dir = os.path.join(str(content_dir or CONTENT_DIR), course)
+    if not os.path.isdir(course_dir) or os.path.basename(os.path.normpath(course_dir)) != course:
+        return None
+    return course_dir
+
+
+def course_files(course_dir: str, suffix: str) -> List[str]:
+    """Files ending in suffix under the course, in reading order (chapter, then section)."""
+    paths = []
+    for root, dirs, files in os.walk(course_dir):
+        dirs.sort()
+        paths.extend(os.path.join(root, name) for name in sorted(files) if name.endswith(suffix))
+    return paths
+
+
+def section_id(path: str, suffix: str) -> str:
+    """"chapter/section" for content/<course>/<chapter>/<section><suffix>."""
+    return f"{os.path.basename(os.path.dirname(path))}/{os.path.basename(path)[:-len(suffix)]}"
+
+
+def get_course_graph(course: str, content_dir: str = None) -> Optional[CurriculumGraph]:
+    """The course's graph, rebuilt only when its meta files change. None for an unknown course."""
+    course_dir = course_dir_for(course, content_dir)
+    if course_dir is None:
+        return None
+    paths = course_files(course_dir, ".meta.json")
+    signature = tuple((path, os.path.getmtime(path)) for path in paths)
+    with _graph_lock:
+        cached = _graph_cache.get(course_dir)
+        if cached and cached[0] == signature:
+            return cached[1]
+    sections = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        meta["id"] = section_id(path, ".meta.json")
+        sections.append(meta)
+    graph = CurriculumGraph(course, sections)
+    with _graph_lock:
+        _graph_cache[course_dir] = (signature, graph)
+    return graph
@@ -1,14 +1,130 @@
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
+import json
 import math
+import os
+import threading
+import time
+
+import numpy as np
+
+# Per-concept parameters fitted offline by bkt_fitting.py; concepts not in the file use the defaults
+BKT_PARAMS_PATH = os.environ.get(
+    "BKT_PARAMS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "bkt_params.json")
+)
+# Forgetting: without practice, p_known above the concept's prior halves every this many days
+# (per concept via "half_life_days" in the fitted lookup; 0 disables decay)
+MASTERY_HALF_LIFE_DAYS = float(os.environ.get("MASTERY_HALF_LIFE_DAYS", "30"))
+# Engines read the lookup on every access; the file's mtime is checked at most this often
+PARAMS_RECHECK_SECONDS = 1.0
+_params_cache: Dict[str, dict] = {}  # path -> {"mtime", "checked", "params"}
+_params_lock = threading.Lock()
+
+
+def load_json_params(path: str) -> Dict[str, Dict[str, float]]:
+    """
+    The "concepts" mapping of a fitted lookup file ({"concepts": {concept_id: {...}}}),
+    re-reading it only when the file's mtime changes. Missing file = {}.
+    """
+    now = time.monotonic()
+    with _params_lock:
+        cached = _params_cache.get(path)
+        if cached is not None and now - cached["checked"] < PARAMS_RECHECK_SECONDS:
+            return cached["params"]
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    with _params_lock:
+        cached = _params_cache.get(path)
+        if cached is None or cached["mtime"] != mtime:
+            params = {}
+            if mtime is not None:
+                with open(path, "r", encoding="utf-8") as f:
+                    params = json.load(f).get("concepts", {})
+            cached = _params_cache[path] = {"mtime": mtime, "params": params}
+        cached["checked"] = now
+        return cached["params"]
+
+
+def load_concept_params(path: str = None) -> Dict[str, Dict[str, float]]:
+    """{concept_id: {"p_init", "p_guess", "p_slip", "p_transit", ...}} from the fitted BKT lookup."""
+    return load_json_params(path or BKT_PARAMS_PATH)
+
+
+def decayed_p_known(p_known, elapsed_days, p_floor, half_life_days=MASTERY_HALF_LIFE_DAYS) -> np.ndarray:
+    """
+    Effective mastery after elapsed_days without practice, element-wise:
+    p_floor + (p_known - p_floor) * 2^(-elapsed / half_life). Computed when read
+    from the stored value and last_practiced_at, so rows are never rewritten to
+    decay. Values at or below the floor, unknown elapsed times (NaN) and
+    half-lives <= 0 are left unchanged.
+    """
+    p_known = np.asarray(p_known, dtype=np.float64)
+    p_floor = np.asarray(p_floor, dtype=np.float64)
+    elapsed = np.clip(np.nan_to_num(np.asarray(elapsed_days, dtype=np.float64), nan=0.0), 0.0, None)
+    half_life = np.asarray(half_life_days, dtype=np.float64)
+    retention = np.exp2(-elapsed / np.where(half_life > 0, half_life, np.inf))
+    return np.where(p_known > p_floor, p_floor + (p_known - p_floor) * retention, p_known)
+
+# interaction_type -> ((slip_delta, slip_bound), (transit_delta, transit_bound)); None leaves that prior alone.
+# Each delta is scaled by intensity; a positive delta is capped at its bound, a negative one floored at it.
+TELEMETRY_RULES = {
+    # They needed a nudge, maybe they know it but slipped.
+    'hint_request': ((0.05, 0.5), (0.02, 0.8)),
+    # Deep reflection => high probability of learning
+    'chat_engagement': (None, (0.1, 0.9)),
+    # Active learning reduces careless errors later
+    'simulation_play': ((-0.05, 0.01), (0.05, 0.8)),
+    # They explicitly indicated confusion (🤔)
+    'affect_confused': ((0.1, 0.6), (-0.02, 0.01)),
+    # They implicitly indicated a lightbulb moment (💡)
+    'affect_insight': ((-0.05, 0.01), (0.15, 0.95)),
+    # Engaged (🤩) indicates flow and focus
+    'affect_engaged': ((-0.02, 0.01), (0.05, 0.85)),
+    # Disengaged/bored (🥱) indicates potential for careless errors
+    'affect_disengaged': ((0.15, 0.7), (-0.05, 0.01)),
+}
+
+
+def _telemetry_step(value: float, rule, intensity: float) -> float:
+    if rule is None:
+        return value
+    delta, bound = rule
+    moved = value + (delta * intensity)
+    return min(bound, moved) if delta > 0 else max(bound, moved)
+
 
 class BayesianKnowledgeTracing:
     """
     Implements Bayesian Knowledge Tracing (BKT) calculation for mastery updates.
     """
-    def __init__(self, p_guess_default=0.2, p_slip_default=0.1, p_transit_default=0.1):
+    def __init__(self, p_guess_default=0.2, p_slip_default=0.1, p_transit_default=0.1,
+                 p_init_default=0.1, concept_params: Dict[str, Dict[str, float]] = None,
+                 half_life_days_default: float = MASTERY_HALF_LIFE_DAYS):
         self.p_guess_default = p_guess_default
         self.p_slip_default = p_slip_default
         self.p_transit_default = p_transit_default
+        self.p_init_default = p_init_default
+        self.half_life_days_default = half_life_days_default
+        # Explicit parameters stay fixed; None follows the fitted file as bkt_fitting rewrites it
+        self.pinned_params = concept_params
+
+    @property
+    def concept_params(self) -> Dict[str, Dict[str, float]]:
+        return self.pinned_params if self.pinned_params is not None else load_concept_params()
+
+    def half_life_for(self, concept_id: str) -> float:
+        return self.concept_params.get(concept_id, {}).get("half_life_days", self.half_life_days_default)
+
+    def params_for(self, concept_id: str) -> Tuple[float, float, float, float]:
+        """(p_init, p_guess, p_slip, p_transit) for a concept: fitted if available, else the defaults."""
+        fitted = self.concept_params.get(concept_id, {})
+        return (
+            fitted.get("p_init", self.p_init_default),
+            fitted.get("p_guess", self.p_guess_default),
+            fitted.get("p_slip", self.p_slip_default),
+            fitted.get("p_transit", self.p_transit_default),
+        )
 
     def update_p_known(self, p_known: float, is_correct: bool, 
                        p_guess: float = None, p_slip: float = None, p_transit: float = None) -> float:
@@ -41,7 +157,64 @@ class BayesianKnowledgeTracing:
         # Bound limits
         return max(0.0001, min(0.9999, new_p_known))
 
-    def process_q_matrix_update(self, current_states: Dict[str, float], 
+    def forecast_attempts_to_mastery(self, p_known, p_transit=None, threshold: float = 0.8, p_guess=None,
+                                     p_slip=None, method: str = "closed_form", n_sims: int = 200,
+                                     max_attempts: int = 100, seed: int = None) -> np.ndarray:
+        """
+        Expected further attempts until mastery, element-wise over arrays of any shape
+        (e.g. roster x concept); parameters broadcast against p_known, None uses the defaults.
+
+        - closed_form: attempts until P(learned) >= threshold. Evidence does not move the
+          expectation (the posterior is a martingale), only learning does:
+          1 - p_n = (1 - p) * (1 - p_transit)^n, so n = ceil(log((1 - threshold) / (1 - p)) / log(1 - p_transit)).
+          inf where p_transit is 0.
+        - simulation: mean over n_sims simulated students (latent state drawn from p, answers
+          from guess/slip, learning from p_transit) of the attempts until the traced
+          estimate reaches the threshold, as the mastery display would see it. Runs that
+          have not crossed by max_attempts count as max_attempts.
+
+        Already-mastered entries (p >= threshold) need 0.
+        """
+        p_known = np.asarray(p_known, dtype=np.float64)
+        transit = np.broadcast_to(np.asarray(self.p_transit_default if p_transit is None else p_transit,
+                                             dtype=np.float64), p_known.shape)
+        if method == "closed_form":
+            with np.errstate(divide="ignore", invalid="ignore"):
+                n = np.log((1 - threshold) / (1 - p_known)) / np.log1p(-np.minimum(transit, 1 - 1e-12))
+            n = np.where(transit > 0, np.ceil(np.maximum(n, 1.0)), np.inf)
+            return np.where(p_known >= threshold, 0.0, n)
+        if method != "simulation":
+            raise ValueError(f"Unknown forecast method '{method}'")
+
+        guess = np.broadcast_to(np.asarray(self.p_guess_default if p_guess is None else p_guess,
+                                           dtype=np.float64), p_known.shape)
+        slip = np.broadcast_to(np.asarray(self.p_slip_default if p_slip is None else p_slip,
+                                          dtype=np.float64), p_known.shape)
+        rng = np.random.default_rng(seed)
+        # Flat (sim, entry) runs; only the runs still below the threshold are carried to the next step
+        size = p_known.size
+        attempts = np.full(n_sims * size, float(max_attempts))
+        entry = np.tile(np.arange(size), n_sims)
+        estimate = p_known.ravel()[entry]
+        learned = rng.random(len(entry)) < estimate
+        active = np.flatnonzero(estimate < threshold)
+        attempts[estimate >= threshold] = 0.0
+        entry, estimate, learned = entry[active], estimate[active], learned[active]
+        guess, slip, transit = guess.ravel(), slip.ravel(), transit.ravel()
+        for step in range(1, max_attempts + 1):
+            if len(active) == 0:
+                break
+            g, sl, tr = guess[entry], slip[entry], transit[entry]
+            correct = rng.random(len(active)) < np.where(learned, 1 - sl, g)
+            estimate = bkt_posterior(estimate, correct, g, sl, tr)
+            learned |= rng.random(len(active)) < tr
+            crossed = estimate >= threshold
+            attempts[active[crossed]] = step
+            keep = ~crossed
+            active, entry, estimate, learned = active[keep], entry[keep], estimate[keep], learned[keep]
+        return attempts.reshape((n_sims,) + p_known.shape).mean(axis=0)
+
+    def process_q_matrix_update(self, current_states: Dict[str, float],
                                 q_matrix_weights: Dict[str, float], 
                                 is_correct: bool) -> Dict[str, float]:
         """
@@ -53,10 +226,11 @@ class BayesianKnowledgeTracing:
         """
         new_states = {}
         for concept_id, weight in q_matrix_weights.items():
-            current_p = current_states.get(concept_id, 0.1) # Default initial prior
+            p_init, p_guess, p_slip, p_transit = self.params_for(concept_id)
+            current_p = current_states.get(concept_id, p_init) # Default initial prior
             
             # Full BKT update
-            full_updated_p = self.update_p_known(current_p, is_correct)
+            full_updated_p = self.update_p_known(current_p, is_correct, p_guess, p_slip, p_transit)
             
             # Modulate by weight (simple interpolation for partial mapping)
             # If weight = 1.0, full update applied. If weight = 0, no update applied.
@@ -79,42 +253,214 @@ class BayesianKnowledgeTracing:
           the hint is a learning opportunity.
         - 'chat_engagement': Deep Socratic chat interaction. Significantly increases p_transit.
         - 'simulation_play': Active interaction with a dynamic component. Reduces p_slip.
+        - 'affect_*': Explicit affect reactions (confused, insight, engaged, disengaged).
+        The per-type deltas and bounds live in TELEMETRY_RULES, shared with the batch path.
         """
-        new_slip = current_p_slip
-        new_transit = current_p_transit
-        
-        if interaction_type == 'hint_request':
-            # They needed a nudge, maybe they know it but slipped.
-            new_slip = min(0.5, current_p_slip + (0.05 * intensity))
-            new_transit = min(0.8, current_p_transit + (0.02 * intensity))
-            
-        elif interaction_type == 'chat_engagement':
-            # Deep reflection => high probability of learning
-            new_transit = min(0.9, current_p_transit + (0.1 * intensity))
-            
-        elif interaction_type == 'simulation_play':
-            # Active learning reduces careless errors later
-            new_slip = max(0.01, current_p_slip - (0.05 * intensity))
-            new_transit = min(0.8, current_p_transit + (0.05 * intensity))
-            
-        elif interaction_type == 'affect_confused':
-            # They explicitly indicated confusion (🤔)
-            new_slip = min(0.6, current_p_slip + (0.1 * intensity))
-            new_transit = max(0.01, current_p_transit - (0.02 * intensity))
-            
-        elif interaction_type == 'affect_insight':
-            # They implicitly indicated a lightbulb moment (💡)
-            new_transit = min(0.95, current_p_transit + (0.15 * intensity))
-            new_slip = max(0.01, current_p_slip - (0.05 * intensity))
-            
-        elif interaction_type == 'affect_engaged':
-            # Engaged (🤩) indicates flow and focus
-            new_transit = min(0.85, current_p_transit + (0.05 * intensity))
-            new_slip = max(0.01, current_p_slip - (0.02 * intensity))
-            
-        elif interaction_type == 'affect_disengaged':
-            # Disengaged/bored (🥱) indicates potential for careless errors
-            new_slip = min(0.7, current_p_slip + (0.15 * intensity))
-            new_transit = max(0.01, current_p_transit - (0.05 * intensity))
-            
-        return new_slip, new_transit
+        rule = TELEMETRY_RULES.get(interaction_type)
+        if rule is None:
+            return current_p_slip, current_p_transit
+        slip_rule, transit_rule = rule
+        return (_telemetry_step(current_p_slip, slip_rule, intensity),
+                _telemetry_step(current_p_transit, transit_rule, intensity))
+
+
+def bkt_posterior(p_known, is_correct, p_guess, p_slip, p_transit) -> np.ndarray:
+    """
+    Element-wise BKT update over arrays; the same arithmetic (and bounds) as
+    BayesianKnowledgeTracing.update_p_known, so results match the scalar path.
+    """
+    p_known = np.asarray(p_known, dtype=np.float64)
+    is_correct = np.asarray(is_correct, dtype=bool)
+    known_term = np.where(is_correct, p_known * (1 - p_slip), p_known * p_slip)
+    prob_evidence = known_term + np.where(is_correct, (1 - p_known) * p_guess, (1 - p_known) * (1 - p_guess))
+    p_known_given_evidence = np.divide(known_term, prob_evidence,
+                                       out=np.zeros_like(known_term), where=prob_evidence != 0)
+    new_p_known = p_known_given_evidence + ((1 - p_known_given_evidence) * p_transit)
+    return np.clip(new_p_known, 0.0001, 0.9999)
+
+
+class BatchKnowledgeTracing:
+    """
+    Vectorized BKT for whole classrooms or replayed histories.
+    Updates are (student, concept, correct[, guess, slip, transit, weight]) columns.
+    Attempts on the same (student, concept) depend on each other, so replay() runs
+    them in rounds: round r applies every key's r-th attempt in one NumPy pass.
+    The number of passes is the longest per-key history, not the number of updates.
+    """
+
+    def __init__(self, p_guess_default=0.2, p_slip_default=0.1, p_transit_default=0.1, p_init_default=0.1,
+                 concept_params: Dict[str, Dict[str, float]] = None):
+        self.p_guess_default = p_guess_default
+        self.p_slip_default = p_slip_default
+        self.p_transit_default = p_transit_default
+        self.p_init_default = p_init_default
+        self.pinned_params = concept_params
+
+    @property
+    def concept_params(self) -> Dict[str, Dict[str, float]]:
+        """The explicit parameters, or the fitted file as of now (see BayesianKnowledgeTracing)."""
+        return self.pinned_params if self.pinned_params is not None else load_concept_params()
+
+    def _concept_column(self, values, field: str, default: float, concept_codes, concept_index) -> np.ndarray:
+        """An explicit column wins; otherwise each update gets its concept's fitted value (or the default)."""
+        if values is not None:
+            return np.asarray(values, dtype=np.float64)
+        concept_params = self.concept_params
+        per_concept = np.array([concept_params.get(c, {}).get(field, default) for c in concept_codes.tolist()],
+                               dtype=np.float64)
+        return per_concept[concept_index]
+
+    def _column(self, values, default: float, n: int) -> np.ndarray:
+        if values is None:
+            return np.full(n, default, dtype=np.float64)
+        return np.asarray(values, dtype=np.float64)
+
+    @staticmethod
+    def _rounds(key: np.ndarray):
+        """Yields, per round r, the indices of every key's r-th update (each key at most once per round)."""
+        n = len(key)
+        # Stable sort groups each key's updates contiguously, in input order
+        order = np.argsort(key, kind="stable")
+        sorted_keys = key[order]
+        group_start = np.r_[0, np.flatnonzero(np.diff(sorted_keys)) + 1]
+        group_size = np.diff(np.r_[group_start, n])
+        # Longest histories first, so the groups still active in round r are a prefix
+        by_size = np.argsort(-group_size, kind="stable")
+        group_start, group_size = group_start[by_size], group_size[by_size]
+        ascending_sizes = group_size[::-1]
+        for r in range(int(group_size[0])):
+            active = len(group_size) - np.searchsorted(ascending_sizes, r, side="right")
+            yield order[group_start[:active] + r]
+
+    @staticmethod
+    def _factorize(student_ids: Sequence, concept_ids: Sequence):
+        """Dense key per update plus, per key, its (student, concept) and concept code index."""
+        student_codes, student_index = np.unique(np.asarray(student_ids), return_inverse=True)
+        concept_codes, concept_index = np.unique(np.asarray(concept_ids), return_inverse=True)
+        pair = student_index.astype(np.int64) * len(concept_codes) + concept_index
+        unique_pairs, key = np.unique(pair, return_inverse=True)
+        pair_keys = list(zip(student_codes[unique_pairs // len(concept_codes)].tolist(),
+                             concept_codes[unique_pairs % len(concept_codes)].tolist()))
+        return key, pair_keys, concept_codes, concept_index, unique_pairs % len(concept_codes)
+
+    def replay_indexed(self, key: np.ndarray, p: np.ndarray, is_correct, p_guess=None, p_slip=None,
+                       p_transit=None, weights=None, retention=None, p_floor=None,
+                       priors_out: np.ndarray = None) -> np.ndarray:
+        """
+        Core kernel: key[i] is the dense index into p of update i. p is updated in
+        place (and returned), applying each key's updates in input order.
+        retention[i] (with p_floor[i]) decays the prior of update i toward the floor
+        first, like decayed_p_known, for time elapsed since the key's previous update.
+        priors_out (length n), if given, receives the p_known each update started from,
+        i.e. the state a prediction for that attempt would have used.
+        """
+        n = len(key)
+        if n == 0:
+            return p
+        correct = np.asarray(is_correct, dtype=bool)
+        guess = self._column(p_guess, self.p_guess_default, n)
+        slip = self._column(p_slip, self.p_slip_default, n)
+        transit = self._column(p_transit, self.p_transit_default, n)
+        weight = self._column(weights, 1.0, n)
+        if retention is not None:
+            retention = np.asarray(retention, dtype=np.float64)
+            p_floor = self._column(p_floor, self.p_init_default, n)
+
+        for idx in self._rounds(key):
+            k = key[idx]
+            prior = p[k]
+            if retention is not None:
+                floor = p_floor[idx]
+                prior = np.where(prior > floor, floor + (prior - floor) * retention[idx], prior)
+            if priors_out is not None:
+                priors_out[idx] = prior
+            updated = bkt_posterior(prior, correct[idx], guess[idx], slip[idx], transit[idx])
+            p[k] = prior + weight[idx] * (updated - prior)
+        return p
+
+    def replay(self, student_ids: Sequence, concept_ids: Sequence, is_correct: Sequence[bool],
+               p_guess: Sequence[float] = None, p_slip: Sequence[float] = None,
+               p_transit: Sequence[float] = None, weights: Sequence[float] = None,
+               current_states: Optional[Dict[Tuple, float]] = None,
+               retention: Sequence[float] = None) -> Dict[Tuple, float]:
+        """
+        Applies updates in input order per (student, concept) and returns the final
+        {(student_id, concept_id): p_known} for current_states plus every updated key.
+        Keys missing from current_states start at their concept's fitted p_init (or
+        p_init_default), and parameter columns left as None use the fitted per-concept
+        values. weights < 1 blend the update toward the prior, like the Q-matrix
+        weights in process_q_matrix_update. retention (per update, see replay_indexed)
+        decays priors toward the concept's p_init for time since the previous update.
+        """
+        states = dict(current_states or {})
+        if len(concept_ids) == 0:
+            return states
+        key, pair_keys, concept_codes, concept_index, key_concept = self._factorize(student_ids, concept_ids)
+        concept_params = self.concept_params
+        init = np.array([concept_params.get(c, {}).get("p_init", self.p_init_default)
+                         for c in concept_codes.tolist()], dtype=np.float64)
+        p = init[key_concept]
+        if states:
+            for i, state_key in enumerate(pair_keys):
+                if state_key in states:
+                    p[i] = states[state_key]
+
+        if concept_params:
+            p_guess = self._concept_column(p_guess, "p_guess", self.p_guess_default, concept_codes, concept_index)
+            p_slip = self._concept_column(p_slip, "p_slip", self.p_slip_default, concept_codes, concept_index)
+            p_transit = self._concept_column(p_transit, "p_transit", self.p_transit_default,
+                                             concept_codes, concept_index)
+        p_floor = init[concept_index] if retention is not None else None
+        self.replay_indexed(key, p, is_correct, p_guess, p_slip, p_transit, weights, retention, p_floor)
+        states.update(zip(pair_keys, p.tolist()))
+        return states
+
+    def replay_telemetry(self, student_ids: Sequence, concept_ids: Sequence, interaction_types: Sequence[str],
+                         intensities: Sequence[float] = None,
+                         current_priors: Optional[Dict[Tuple, Tuple[float, float]]] = None,
+                         trajectory: bool = False):
+        """
+        Applies telemetry events in input order per (student, concept), with the same
+        TELEMETRY_RULES as apply_telemetry_fusion, in rounds like replay().
+        Returns ({(student_id, concept_id): (p_slip, p_transit)}, trajectory), where
+        trajectory is None or an (n, 2) array of the priors after each event, in input order.
+        Keys missing from current_priors start at their concept's fitted (or default) values.
+        Unknown interaction types leave the priors unchanged.
+        """
+        priors = dict(current_priors or {})
+        n = len(interaction_types)
+        if n == 0:
+            return priors, (np.empty((0, 2)) if trajectory else None)
+        key, pair_keys, concept_codes, _, key_concept = self._factorize(student_ids, concept_ids)
+        state = np.empty((len(pair_keys), 2), dtype=np.float64)
+        concept_params = self.concept_params
+        defaults = np.array([[concept_params.get(c, {}).get("p_slip", self.p_slip_default),
+                              concept_params.get(c, {}).get("p_transit", self.p_transit_default)]
+                             for c in concept_codes.tolist()], dtype=np.float64)
+        state[:] = defaults[key_concept]
+        if priors:
+            for i, state_key in enumerate(pair_keys):
+                if state_key in priors:
+                    state[i] = priors[state_key]
+
+        # Rule table as arrays: delta 0 marks "no change" (unknown type or a None rule component)
+        type_codes, type_index = np.unique(np.asarray(interaction_types), return_inverse=True)
+        table = np.zeros((len(type_codes), 2, 2), dtype=np.float64)  # [type, (slip, transit), (delta, bound)]
+        for t, interaction_type in enumerate(type_codes.tolist()):
+            for component, rule in enumerate(TELEMETRY_RULES.get(interaction_type, (None, None))):
+                if rule is not None:
+                    table[t, component] = rule
+        delta, bound = table[type_index, :, 0], table[type_index, :, 1]
+        intensity = self._column(intensities, 1.0, n)[:, None]
+
+        after = np.empty((n, 2), dtype=np.float64) if trajectory else None
+        for idx in self._rounds(key):
+            k = key[idx]
+            current, d = state[k], delta[idx]
+            moved = current + (d * intensity[idx])
+            clamped = np.where(d > 0, np.minimum(bound[idx], moved), np.maximum(bound[idx], moved))
+            state[k] = np.where(d != 0, clamped, current)
+            if after is not None:
+                after[idx] = state[k]
+        priors.update(zip(pair_keys, map(tuple, state.tolist())))
+        return priors, after
@@ -0,0 +1,385 @@
+# backend/mastery_replay.py - Streaming Mastery Rebuild
+"""
+Recomputes the `mastery` table from scratch by replaying history through the
+BKT engine, e.g. after changing BKT parameters or fixing an update bug.
+
+Inputs, each ordered by (user_id, timestamp):
+- attempts:   user_id, problem_id, is_correct, created_at
+- event_logs: rows with event_type 'telemetry_fusion' (event_data holds
+              concept_id, interaction_type, intensity) adjust p_slip/p_transit
+              exactly like /api/telemetry_fusion did at the time
+- problems:   id -> q_matrix ({concept_id: weight}) maps attempts to concepts
+
+Rows are streamed and merged, never loaded whole. Updates are buffered until
+`chunk_updates` is reached at a user boundary, then replayed with one
+BatchKnowledgeTracing pass and emitted as mastery rows, so memory is bounded
+by the chunk (plus one user's history), not by the table size.
+
+Usage:
+    # From exported files (CSV or JSONL, sorted by user_id, created_at/client_ts)
+    python mastery_replay.py --attempts attempts.csv --events event_logs.jsonl \\
+        --problems problems.json --output mastery.jsonl
+
+    # Straight from Supabase (needs a service-role key: RLS hides other users' rows)
+    SUPABASE_URL=... SUPABASE_SERVICE_KEY=... python mastery_replay.py --supabase --write-supabase
+"""
+
+import argparse
+import csv
+import heapq
+import json
+import os
+import sys
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from knowledge_tracing import BayesianKnowledgeTracing, BatchKnowledgeTracing
+
+PAGE_SIZE = 1000
+WRITE_BATCH_SIZE = 500
+
+
+def parse_timestamp(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def parse_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("true", "t", "1", "yes")
+
+
+def read_rows(path: str) -> Iterator[dict]:
+    """Streams rows from a .csv or .jsonl export."""
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def supabase_rows(url: str, key: str, table: str, select: str, ts_column: str,
+                  filters: Dict[str, str] = None, page_size: int = PAGE_SIZE) -> Iterator[dict]:
+    """
+    Streams a table ordered by (user_id, ts_column, id) with keyset pagination, so
+    each page is an index range scan instead of an ever-growing OFFSET.
+    """
+    headers = {"apikey": key, "Authorization": f"Bearer {key}"}
+    last = None
+    while True:
+        params = {"select": select, "order": f"user_id.asc,{ts_column}.asc,id.asc", "limit": str(page_size)}
+        params.update(filters or {})
+        if last is not None:
+            u, t, i = (json.dumps(v) if isinstance(v, str) else v for v in (last["user_id"], last[ts_column], last["id"]))
+            params["or"] = (f"(user_id.gt.{u},and(user_id.eq.{u},{ts_column}.gt.{t}),"
+                            f"and(user_id.eq.{u},{ts_column}.eq.{t},id.gt.{i}))")
+        request = urllib.request.Request(f"{url}/rest/v1/{table}?{urllib.parse.urlencode(params)}", headers=headers)
+        with urllib.request.urlopen(request) as response:
+            page = json.loads(response.read().decode("utf-8"))
+        yield from page
+        if len(page) < page_size:
+            return
+        last = page[-1]
+
+
+def supabase_problems(url: str, key: str) -> Iterator[dict]:
+    """The problems table is small; plain offset paging is fine."""
+    headers = {"apikey": key, "Authorization": f"Bearer {key}"}
+    offset = 0
+    while True:
+        params = {"select": "id,q_matrix", "order": "id.asc", "limit": str(PAGE_SIZE), "offset": str(offset)}
+        request = urllib.request.Request(f"{url}/rest/v1/problems?{urllib.parse.urlencode(params)}", headers=headers)
+        with urllib.request.urlopen(request) as response:
+            page = json.loads(response.read().decode("utf-8"))
+        yield from page
+        if len(page) < PAGE_SIZE:
+            return
+        offset += PAGE_SIZE
+
+
+def attempt_events(rows: Iterable[dict]) -> Iterator[Tuple]:
+    """(user_id, ts, 1, "attempt", (problem_id, is_correct)); checks the input order."""
+    previous = None
+    for row in rows:
+        if row.get("is_correct") in (None, ""):
+            continue
+        key = (str(row["user_id"]), parse_timestamp(row["created_at"]))
+        if previous is not None and key < previous:
+            raise ValueError(f"attempts are not sorted by (user_id, created_at) at {key}; "
+                             "export them with ORDER BY user_id, created_at")
+        previous = key
+        yield key + (1, "attempt", (row["problem_id"], parse_bool(row["is_correct"])))
+
+
+def telemetry_events(rows: Iterable[dict]) -> Iterator[Tuple]:
+    """(user_id, ts, 0, "telemetry", (concept_id, interaction_type, intensity)) for fusion events."""
+    previous = None
+    for row in rows:
+        ts = row.get("client_ts") or row.get("created_at")
+        key = (str(row["user_id"]), parse_timestamp(ts))
+        if previous is not None and key < previous:
+            raise ValueError(f"event_logs are not sorted by (user_id, client_ts) at {key}; "
+                             "export them with ORDER BY user_id, client_ts")
+        previous = key
+        data = row.get("event_data") or {}
+        if isinstance(data, str):
+            data = json.loads(data)
+        if row.get("event_type") != "telemetry_fusion" or not data.get("interaction_type"):
+            continue
+        concept_id = data.get("concept_id") or row.get("event_target")
+        if concept_id:
+            yield key + (0, "telemetry", (concept_id, data["interaction_type"], float(data.get("intensity", 1.0))))
+
+
+def confidence_level(p_known: float, attempts: int) -> str:
+    """Same banding the client uses when it writes mastery rows."""
+    if p_known > 0.8 and attempts > 2:
+        return "high"
+    if p_known > 0.5:
+        return "medium"
+    return "low"
+
+
+class MasteryReplay:
+    """
+    Replays merged attempt/telemetry events into mastery rows.
+    q_matrices: problem_id -> {concept_id: weight}.
+    """
+
+    def __init__(self, q_matrices: Dict[str, Dict[str, float]], chunk_updates: int = 200_000,
+                 engine: BayesianKnowledgeTracing = None):
+        self.q_matrices = q_matrices
+        self.chunk_updates = chunk_updates
+        self.engine = engine or BayesianKnowledgeTracing()
+        self.batch = BatchKnowledgeTracing(self.engine.p_guess_default, self.engine.p_slip_default,
+                                           self.engine.p_transit_default, self.engine.p_init_default,
+                                           concept_params=self.engine.pinned_params)
+        self.stats = {"attempts": 0, "telemetry": 0, "unmapped_attempts": 0, "updates": 0, "mastery_rows": 0}
+        self._reset_chunk()
+
+    def _reset_chunk(self):
+        self._columns = {"student": [], "concept": [], "correct": [], "guess": [], "slip": [], "transit": [],
+                         "weight": [], "retention": []}
+        # (user_id, concept_id) -> [p_guess, p_slip, p_transit, attempts, correct, last_practiced_at]
+        self._keys = {}
+
+    def _state(self, key):
+        state = self._keys.get(key)
+        if state is None:
+            # Start from the concept's fitted parameters when bkt_fitting.py has produced them
+            _, guess, slip, transit = self.engine.params_for(key[1])
+            state = self._keys[key] = [guess, slip, transit, 0, 0, None]
+        return state
+
+    def _apply(self, event):
+        user_id, ts, _, kind, payload = event
+        if kind == "telemetry":
+            concept_id, interaction_type, intensity = payload
+            state = self._state((user_id, concept_id))
+            state[1], state[2] = self.engine.apply_telemetry_fusion(state[1], state[2], interaction_type, intensity)
+            self.stats["telemetry"] += 1
+            return
+        problem_id, is_correct = payload
+        self.stats["attempts"] += 1
+        q_matrix = self.q_matrices.get(problem_id)
+        if not q_matrix:
+            self.stats["unmapped_attempts"] += 1
+            return
+        columns = self._columns
+        for concept_id, weight in q_matrix.items():
+            state = self._state((user_id, concept_id))
+            columns["student"].append(user_id)
+            columns["concept"].append(concept_id)
+            columns["correct"].append(is_correct)
+            columns["guess"].append(state[0])
+            columns["slip"].append(state[1])
+            columns["transit"].append(state[2])
+            columns["weight"].append(float(weight))
+            # Forgetting since the concept was last practiced, as MasteryStore applies it online
+            half_life = self.engine.half_life_for(concept_id)
+            elapsed_days = (ts - state[5]).total_seconds() / 86400 if state[5] else 0.0
+            columns["retention"].append(2.0 ** (-elapsed_days / half_life) if half_life > 0 else 1.0)
+            state[3] += 1
+            state[4] += int(is_correct)
+            state[5] = ts
+
+    def _flush(self) -> List[dict]:
+        columns = self._columns
+        p_known = self.batch.replay(columns["student"], columns["concept"], columns["correct"],
+                                    p_guess=columns["guess"], p_slip=columns["slip"],
+                                    p_transit=columns["transit"], weights=columns["weight"],
+                                    retention=columns["retention"])
+        now = datetime.now(timezone.utc).isoformat()
+        rows = []
+        for (user_id, concept_id), (guess, slip, transit, attempts, correct, last_ts) in self._keys.items():
+            p_init, _, base_slip, base_transit = self.engine.params_for(concept_id)
+            p = p_known.get((user_id, concept_id), p_init)
+            rows.append({
+                "user_id": user_id,
+                "concept_id": concept_id,
+                "p_known": p,
+                "mastery_score": p,
+                "p_guess": guess,
+                "p_slip": slip,
+                "p_transit": transit,
+                # Telemetry adjustments only; MasteryStore re-applies them to the current fitted values
+                "p_slip_offset": slip - base_slip,
+                "p_transit_offset": transit - base_transit,
+                "attempts_count": attempts,
+                "correct_count": correct,
+                "confidence_level": confidence_level(p, attempts),
+                "last_practiced_at": last_ts.isoformat() if last_ts else None,
+                "updated_at": now,
+            })
+        self.stats["updates"] += len(columns["student"])
+        self.stats["mastery_rows"] += len(rows)
+        self._reset_chunk()
+        return rows
+
+    def run(self, events: Iterable[Tuple]) -> Iterator[List[dict]]:
+        """Yields lists of mastery rows, one per chunk; a user never spans two chunks."""
+        current_user = None
+        for event in events:
+            if event[0] != current_user:
+                if len(self._columns["student"]) >= self.chunk_updates:
+                    yield self._flush()
+                current_user = event[0]
+            self._apply(event)
+        if self._keys:
+            yield self._flush()
+
+
+def merge_events(*streams: Iterable[Tuple]) -> Iterator[Tuple]:
+    """Merges sorted streams by (user_id, ts); telemetry sorts before an attempt at the same instant."""
+    return heapq.merge(*streams, key=lambda event: event[:3])
+
+
+def load_q_matrices(rows: Iterable[dict]) -> Dict[str, Dict[str, float]]:
+    q_matrices = {}
+    for row in rows:
+        q_matrix = row.get("q_matrix")
+        if isinstance(q_matrix, str):
+            q_matrix = json.loads(q_matrix) if q_matrix.strip() else None
+        if q_matrix:
+            q_matrices[str(row["id"])] = {k: float(v) for k, v in q_matrix.items()}
+    return q_matrices
+
+
+def read_q_matrices(path: str) -> Dict[str, Dict[str, float]]:
+    """q_matrices from a problems export: a .json array, or .jsonl / .csv rows."""
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            return load_q_matrices(json.load(f))
+    return load_q_matrices(read_rows(path))
+
+
+def add_attempts_arguments(parser: argparse.ArgumentParser):
+    """The attempts/problems input options shared by the offline fitting CLIs."""
+    parser.add_argument("--attempts", help="attempts export (.csv or .jsonl), sorted by user_id, created_at")
+    parser.add_argument("--problems", help="problems export with id and q_matrix")
+    parser.add_argument("--supabase", action="store_true", help="read inputs from SUPABASE_URL instead of files")
+
+
+def supabase_credentials(parser: argparse.ArgumentParser) -> Tuple[str, str]:
+    """(SUPABASE_URL, SUPABASE_SERVICE_KEY) from the environment; exits via parser when either is unset."""
+    url = os.environ.get("SUPABASE_URL", "").rstrip("/")
+    key = os.environ.get("SUPABASE_SERVICE_KEY", "")
+    if not (url and key):
+        parser.error("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set for Supabase input/output")
+    return url, key
+
+
+def load_attempts_input(parser: argparse.ArgumentParser, args) -> Tuple[Dict[str, Dict[str, float]], Iterator[Tuple]]:
+    """(q_matrices, attempt events) from the options of add_attempts_arguments; usage errors exit via parser."""
+    if args.supabase:
+        url, key = supabase_credentials(parser)
+        q_matrices = load_q_matrices(supabase_problems(url, key))
+        return q_matrices, attempt_events(supabase_rows(url, key, "attempts",
+                                                        "id,user_id,problem_id,is_correct,created_at", "created_at"))
+    if not (args.attempts and args.problems):
+        parser.error("--attempts and --problems are required without --supabase")
+    return read_q_matrices(args.problems), attempt_events(read_rows(args.attempts))
+
+
+def atomic_write_json(path: str, obj, indent: int = None):
+    """
+    Writes obj as JSON to path via a unique temp file and one os.replace: the server
+    re-reads these files by mtime and must never see a partial or interleaved write.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(obj, f, indent=indent)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_supabase(url: str, key: str, rows: List[dict]):
+    """Bulk upsert on the (user_id, concept_id) primary key."""
+    headers = {
+        "apikey": key,
+        "Authorization": f"Bearer {key}",
+        "Content-Type": "application/json",
+        "Prefer": "resolution=merge-duplicates,return=minimal",
+    }
+    for start in range(0, len(rows), WRITE_BATCH_SIZE):
+        body = json.dumps(rows[start:start + WRITE_BATCH_SIZE]).encode("utf-8")
+        request = urllib.request.Request(f"{url}/rest/v1/mastery?on_conflict=user_id,concept_id",
+                                         data=body, headers=headers, method="POST")
+        urllib.request.urlopen(request).close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_attempts_arguments(parser)
+    parser.add_argument("--events", help="event_logs export (.csv or .jsonl), optional")
+    parser.add_argument("--output", help="write mastery rows to this .jsonl file")
+    parser.add_argument("--write-supabase", action="store_true", help="bulk upsert mastery rows into Supabase")
+    parser.add_argument("--chunk-updates", type=int, default=200_000)
+    args = parser.parse_args()
+
+    if not args.output and not args.write_supabase:
+        parser.error("choose --output and/or --write-supabase")
+    url, key = supabase_credentials(parser) if args.write_supabase else ("", "")
+
+    q_matrices, attempts = load_attempts_input(parser, args)
+    streams = [attempts]
+    if args.supabase:
+        url, key = supabase_credentials(parser)
+        streams.append(telemetry_events(supabase_rows(url, key, "event_logs",
+                                                      "id,user_id,event_type,event_target,event_data,client_ts",
+                                                      "client_ts", filters={"event_type": "eq.telemetry_fusion"})))
+    elif args.events:
+        streams.append(telemetry_events(read_rows(args.events)))
+
+    replay = MasteryReplay(q_matrices, chunk_updates=args.chunk_updates)
+    start = time.perf_counter()
+    output = open(args.output, "w", encoding="utf-8") if args.output else None
+    try:
+        for rows in replay.run(merge_events(*streams)):
+            if output:
+                for row in rows:
+                    output.write(json.dumps(row) + "\n")
+            if args.write_supabase:
+                write_supabase(url, key, rows)
+            print(f"[Mastery Replay] {replay.stats}", file=sys.stderr)
+    finally:
+        if output:
+            output.close()
+    print(f"[Mastery Replay] Done in {time.perf_counter() - start:.1f}s: {replay.stats}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
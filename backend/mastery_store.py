@@ -0,0 +1,470 @@
+# backend/mastery_store.py - Server-Side Mastery State with Write-Behind Persistence
+"""
+The backend owns per-user mastery instead of the client reading rows, calling
+/api/grade and writing them back (two extra round trips, and racing tabs
+overwrite each other's updates).
+
+- A user's rows are loaded from the `mastery` table on first touch and kept in
+  memory; every later attempt/telemetry update is applied to that copy.
+- Changed (user_id, concept_id) rows are marked dirty. A background thread
+  flushes them every `flush_interval` seconds (sooner once `flush_batch` rows
+  are pending) as one bulk upsert, so ten updates to a row between flushes
+  cost one write.
+- A failed flush puts its rows back unless they were changed again meanwhile.
+- Users with nothing pending are evicted least-recently-used past `max_users`.
+- The cache is never invalidated, so the process that holds it must be the only
+  writer of the `mastery` table: another worker with its own copy would
+  overwrite these rows with stale p_known on its next flush. Deploy one
+  server process (`gunicorn -w 1`, one instance); requests still run
+  concurrently inside it. start() takes an exclusive lock on
+  MASTERY_LOCK_PATH and refuses to start a second flusher on the same host.
+  Offline jobs (mastery_replay, review_scheduler) only read the table or
+  rebuild it while the server is stopped.
+- Guess/slip/transit come from the concept's fitted parameters at every
+  update (bkt_params.json, reloaded when refit); a row only stores its
+  telemetry adjustments, as p_slip_offset/p_transit_offset.
+- Stored p_known is the state as of last_practiced_at. Reads add
+  `effective_p_known` (forgetting decay, see decayed_p_known), and an attempt
+  updates from the decayed value, so nothing is rewritten just to decay.
+
+Persistence is Supabase when SUPABASE_URL and SUPABASE_SERVICE_KEY are set
+(service role: RLS would hide other users' rows), otherwise a local SQLite
+file with the same columns (MASTERY_DB_PATH) for development. In production
+the fallback is refused (see supabase_auth.require_supabase_config). Because
+the service role bypasses RLS, callers must pass only user ids taken from a
+verified access token.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+from knowledge_tracing import BatchKnowledgeTracing, BayesianKnowledgeTracing, decayed_p_known
+from mastery_replay import PAGE_SIZE, confidence_level, parse_timestamp, write_supabase
+from supabase_auth import require_supabase_config
+
+MASTERY_COLUMNS = (
+    "user_id", "concept_id", "p_known", "mastery_score", "p_guess", "p_slip", "p_transit",
+    "p_slip_offset", "p_transit_offset", "attempts_count", "correct_count", "confidence_level", "last_practiced_at", "updated_at",
+)
+MASTERY_DB_PATH = os.environ.get(
+    "MASTERY_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "mastery.db")
+)
+MASTERY_LOCK_PATH = os.environ.get(
+    "MASTERY_LOCK_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "mastery.lock")
+)
+
+
+class SQLiteMasteryBackend:
+    """Local stand-in for the Supabase `mastery` table."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        # WAL: load_all streams on its own connection, and readers must not block graded-attempt writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS mastery ("
+                "user_id TEXT NOT NULL, concept_id TEXT NOT NULL, p_known REAL, mastery_score REAL, "
+                "p_guess REAL, p_slip REAL, p_transit REAL, p_slip_offset REAL, p_transit_offset REAL, "
+                "attempts_count INTEGER, correct_count INTEGER, "
+                "confidence_level TEXT, last_practiced_at TEXT, updated_at TEXT, "
+                "PRIMARY KEY (user_id, concept_id))"
+            )
+            # Databases created before the telemetry offset columns
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(mastery)")}
+            for column in ("p_slip_offset", "p_transit_offset"):
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE mastery ADD COLUMN {column} REAL")
+
+    def load(self, user_id: str) -> List[dict]:
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT {', '.join(MASTERY_COLUMNS)} FROM mastery WHERE user_id = ?", (user_id,)
+            )
+            return [dict(zip(MASTERY_COLUMNS, row)) for row in cursor.fetchall()]
+
+    def load_all(self) -> Iterator[dict]:
+        """Every row, ordered by user_id (for nightly jobs), streamed from the cursor."""
+        # A connection of its own: the shared one is locked per statement, and this read spans the whole job
+        conn = sqlite3.connect(self.path)
+        try:
+            for row in conn.execute(f"SELECT {', '.join(MASTERY_COLUMNS)} FROM mastery ORDER BY user_id, concept_id"):
+                yield dict(zip(MASTERY_COLUMNS, row))
+        finally:
+            conn.close()
+
+    def write(self, rows: List[dict]):
+        updates = ", ".join(f"{c} = excluded.{c}" for c in MASTERY_COLUMNS[2:])
+        sql = (f"INSERT INTO mastery ({', '.join(MASTERY_COLUMNS)}) VALUES ({', '.join('?' * len(MASTERY_COLUMNS))}) "
+               f"ON CONFLICT(user_id, concept_id) DO UPDATE SET {updates}")
+        with self._lock, self._conn:
+            self._conn.executemany(sql, [tuple(row.get(c) for c in MASTERY_COLUMNS) for row in rows])
+
+
+class SupabaseMasteryBackend:
+    def __init__(self, url: str, key: str):
+        self.url = url.rstrip("/")
+        self.key = key
+
+    def load(self, user_id: str) -> List[dict]:
+        params = urllib.parse.urlencode({"select": ",".join(MASTERY_COLUMNS), "user_id": f"eq.{user_id}"})
+        headers = {"apikey": self.key, "Authorization": f"Bearer {self.key}"}
+        request = urllib.request.Request(f"{self.url}/rest/v1/mastery?{params}", headers=headers)
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+    def load_all(self, page_size: int = PAGE_SIZE) -> Iterator[dict]:
+        """Every row, ordered by user_id, with keyset pagination on the (user_id, concept_id) key."""
+        headers = {"apikey": self.key, "Authorization": f"Bearer {self.key}"}
+        last = None
+        while True:
+            params = {"select": ",".join(MASTERY_COLUMNS), "order": "user_id.asc,concept_id.asc",
+                      "limit": str(page_size)}
+            if last is not None:
+                u, c = json.dumps(last["user_id"]), json.dumps(last["concept_id"])
+                params["or"] = f"(user_id.gt.{u},and(user_id.eq.{u},concept_id.gt.{c}))"
+            request = urllib.request.Request(f"{self.url}/rest/v1/mastery?{urllib.parse.urlencode(params)}",
+                                             headers=headers)
+            with urllib.request.urlopen(request) as response:
+                page = json.loads(response.read())
+            yield from page
+            if len(page) < page_size:
+                return
+            last = page[-1]
+
+    def write(self, rows: List[dict]):
+        write_supabase(self.url, self.key, rows)
+
+
+def backend_from_env():
+    url = os.environ.get("SUPABASE_URL", "")
+    key = os.environ.get("SUPABASE_SERVICE_KEY", "")
+    if not (url and key):
+        require_supabase_config()
+    return SupabaseMasteryBackend(url, key) if url and key else SQLiteMasteryBackend(MASTERY_DB_PATH)
+
+
+def adjusted_param(base: float, offset) -> float:
+    """A concept's fitted p_slip/p_transit plus a row's telemetry offset, kept inside (0.01, 0.99)."""
+    return min(0.99, max(0.01, base + (offset or 0.0)))
+
+
+def effective_mastery(rows: List[dict], engine: BayesianKnowledgeTracing, now: datetime = None) -> np.ndarray:
+    """
+    Decayed p_known for mastery rows (concept_id, p_known, last_practiced_at) in one
+    vectorized pass; floors and half-lives are per concept. Rows never practiced do not decay.
+    """
+    now = now or datetime.now(timezone.utc)
+    p_known = np.array([row["p_known"] for row in rows], dtype=np.float64)
+    elapsed_days = np.array([
+        (now - parse_timestamp(row["last_practiced_at"])).total_seconds() / 86400
+        if row.get("last_practiced_at") else np.nan
+        for row in rows
+    ], dtype=np.float64)
+    floors = np.array([engine.params_for(row["concept_id"])[0] for row in rows], dtype=np.float64)
+    half_lives = np.array([engine.half_life_for(row["concept_id"]) for row in rows], dtype=np.float64)
+    return decayed_p_known(p_known, elapsed_days, floors, half_lives)
+
+
+class MasteryStore:
+    def __init__(self, backend, engine: BayesianKnowledgeTracing = None, flush_interval: float = 2.0,
+                 flush_batch: int = 500, max_users: int = 10_000):
+        self.backend = backend
+        self.engine = engine or BayesianKnowledgeTracing()
+        self.batch = BatchKnowledgeTracing(self.engine.p_guess_default, self.engine.p_slip_default,
+                                           self.engine.p_transit_default, self.engine.p_init_default,
+                                           concept_params=self.engine.pinned_params)
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.max_users = max_users
+        self._users: "OrderedDict[str, Dict[str, dict]]" = OrderedDict()
+        self._dirty = set()  # (user_id, concept_id)
+        self._in_flight = set()  # taken by a running flush, may come back if it fails
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._writer_lock = None
+        self.stats = {"loads": 0, "updates": 0, "flushes": 0, "rows_written": 0, "flush_errors": 0}
+
+    @classmethod
+    def from_env(cls) -> "MasteryStore":
+        return cls(backend_from_env(), flush_interval=float(os.environ.get("MASTERY_FLUSH_INTERVAL", "2.0")))
+
+    # ------------------------------------------------------------------
+    # In-memory state
+    # ------------------------------------------------------------------
+
+    def _user(self, user_id: str) -> Dict[str, dict]:
+        """The user's rows by concept, loading them on first touch. Caller must not hold _lock."""
+        with self._lock:
+            rows = self._users.get(user_id)
+            if rows is not None:
+                self._users.move_to_end(user_id)
+                return rows
+        with self._load_lock:
+            # Another request may have loaded the user while this one waited
+            with self._lock:
+                if user_id in self._users:
+                    return self._users[user_id]
+            loaded = {row["concept_id"]: row for row in self.backend.load(user_id)}
+            with self._lock:
+                self._users[user_id] = loaded
+                self.stats["loads"] += 1
+                self._evict()
+                return loaded
+
+    def _evict(self):
+        """Drops least-recently-used users with no pending writes. Caller holds _lock."""
+        if len(self._users) <= self.max_users:
+            return
+        pending_users = {user_id for user_id, _ in self._dirty | self._in_flight}
+        for user_id in list(self._users):
+            if len(self._users) <= self.max_users:
+                break
+            if user_id not in pending_users:
+                del self._users[user_id]
+
+    def _attach(self, user_id: str, rows: Dict[str, dict]) -> Dict[str, dict]:
+        """
+        Caller holds _lock. The user may have been evicted (clean) or reloaded since
+        _user() returned; use whichever copy is cached now, re-caching ours if none is.
+        """
+        current = self._users.setdefault(user_id, rows)
+        self._users.move_to_end(user_id)
+        return current
+
+    def _row(self, rows: Dict[str, dict], user_id: str, concept_id: str) -> dict:
+        """Existing (or new) row with NULL counts filled and the BKT parameters in force now, see _resolve."""
+        row = rows.get(concept_id)
+        if row is None:
+            row = rows[concept_id] = {"user_id": user_id, "concept_id": concept_id, "attempts_count": 0,
+                                      "correct_count": 0}
+        for column in ("p_slip_offset", "p_transit_offset", "attempts_count", "correct_count"):
+            if row.get(column) is None:
+                row[column] = 0 if column.endswith("count") else 0.0
+        return self._resolve(row)
+
+    def _resolve(self, row: dict) -> dict:
+        """
+        Sets p_guess/p_slip/p_transit from the concept's current fitted (or default)
+        parameters plus the row's telemetry offsets, so a refit reaches every row on
+        its next update; the stored columns only record the values last used.
+        """
+        p_init, p_guess, p_slip, p_transit = self.engine.params_for(row["concept_id"])
+        if row.get("p_known") is None:
+            row["p_known"] = p_init
+        row["p_guess"] = p_guess
+        row["p_slip"] = adjusted_param(p_slip, row.get("p_slip_offset"))
+        row["p_transit"] = adjusted_param(p_transit, row.get("p_transit_offset"))
+        return row
+
+    def _set_telemetry(self, row: dict, p_slip: float, p_transit: float):
+        """Stores telemetry-adjusted priors as offsets from the concept's parameters."""
+        _, _, base_slip, base_transit = self.engine.params_for(row["concept_id"])
+        row["p_slip"], row["p_transit"] = p_slip, p_transit
+        row["p_slip_offset"], row["p_transit_offset"] = p_slip - base_slip, p_transit - base_transit
+
+    def _mark_dirty(self, user_id: str, concept_ids):
+        self._dirty.update((user_id, concept_id) for concept_id in concept_ids)
+        if len(self._dirty) >= self.flush_batch:
+            self._wake.set()
+
+    def get(self, user_id: str, now: datetime = None) -> Dict[str, dict]:
+        """The user's rows, each with `effective_p_known` as of now."""
+        rows = self._user(user_id)
+        with self._lock:
+            rows = self._attach(user_id, rows)
+            result = {concept_id: self._resolve(dict(row)) for concept_id, row in rows.items()}
+        effective = effective_mastery(list(result.values()), self.engine, now)
+        for row, p in zip(result.values(), effective.tolist()):
+            row["effective_p_known"] = p
+        return result
+
+    def apply_attempt(self, user_id: str, q_matrix: Dict[str, float], is_correct: bool) -> Dict[str, float]:
+        """
+        One graded attempt, with the same per-concept update and Q-matrix blending as
+        process_q_matrix_update, but starting from the decayed p_known and using the
+        concept's fitted guess/slip/transit with the row's telemetry offsets, as MasteryReplay does.
+        Returns {concept_id: new p_known}.
+        """
+        rows = self._user(user_id)
+        practiced_at = datetime.now(timezone.utc)
+        now = practiced_at.isoformat()
+        new_states = {}
+        with self._lock:
+            rows = self._attach(user_id, rows)
+            for concept_id, weight in q_matrix.items():
+                row = self._row(rows, user_id, concept_id)
+                current_p = float(effective_mastery([row], self.engine, practiced_at)[0])
+                full_updated_p = self.engine.update_p_known(current_p, is_correct, row["p_guess"], row["p_slip"],
+                                                            row["p_transit"])
+                p_known = current_p + float(weight) * (full_updated_p - current_p)
+                row["p_known"] = row["mastery_score"] = p_known
+                row["attempts_count"] += 1
+                row["correct_count"] += int(is_correct)
+                row["confidence_level"] = confidence_level(p_known, row["attempts_count"])
+                row["last_practiced_at"] = row["updated_at"] = now
+                new_states[concept_id] = p_known
+            self._mark_dirty(user_id, new_states)
+            self.stats["updates"] += len(new_states)
+        return new_states
+
+    def apply_placement(self, user_id: str, p_known: Dict[str, float]) -> Dict[str, float]:
+        """
+        Sets p_known directly, e.g. from a placement diagnostic, through the same cached
+        rows and write-behind flush as attempts (a direct client write would be
+        overwritten by the next flush of the cached copy). Returns {concept_id: p_known}.
+        """
+        rows = self._user(user_id)
+        practiced_at = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            rows = self._attach(user_id, rows)
+            for concept_id, p in p_known.items():
+                row = self._row(rows, user_id, concept_id)
+                row["p_known"] = row["mastery_score"] = float(p)
+                row["confidence_level"] = confidence_level(float(p), row["attempts_count"])
+                row["last_practiced_at"] = row["updated_at"] = practiced_at
+            self._mark_dirty(user_id, p_known)
+            self.stats["updates"] += len(p_known)
+        return {concept_id: float(p) for concept_id, p in p_known.items()}
+
+    def apply_telemetry(self, user_id: str, concept_id: str, interaction_type: str,
+                        intensity: float = 1.0) -> Tuple[float, float]:
+        rows = self._user(user_id)
+        with self._lock:
+            rows = self._attach(user_id, rows)
+            row = self._row(rows, user_id, concept_id)
+            self._set_telemetry(row, *self.engine.apply_telemetry_fusion(
+                row["p_slip"], row["p_transit"], interaction_type, intensity
+            ))
+            row["updated_at"] = datetime.now(timezone.utc).isoformat()
+            self._mark_dirty(user_id, [concept_id])
+            self.stats["updates"] += 1
+            return row["p_slip"], row["p_transit"]
+
+    def apply_telemetry_batch(self, user_id: str, concept_ids: List[str], interaction_types: List[str],
+                              intensities: List[float] = None, trajectory: bool = False):
+        """
+        An ordered batch of telemetry events for one user in one pass.
+        Returns ({concept_id: (p_slip, p_transit)}, trajectory or None), see replay_telemetry.
+        """
+        rows = self._user(user_id)
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            rows = self._attach(user_id, rows)
+            touched = {concept_id: self._row(rows, user_id, concept_id) for concept_id in concept_ids}
+            current = {(user_id, concept_id): (row["p_slip"], row["p_transit"]) for concept_id, row in touched.items()}
+            priors, after = self.batch.replay_telemetry([user_id] * len(concept_ids), concept_ids, interaction_types,
+                                                        intensities, current, trajectory)
+            result = {}
+            for concept_id, row in touched.items():
+                result[concept_id] = priors[(user_id, concept_id)]
+                self._set_telemetry(row, *result[concept_id])
+                row["updated_at"] = now
+            self._mark_dirty(user_id, touched)
+            self.stats["updates"] += len(concept_ids)
+        return result, after
+
+    # ------------------------------------------------------------------
+    # Write-behind
+    # ------------------------------------------------------------------
+
+    def flush(self) -> int:
+        """Writes every pending row in one bulk upsert. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return 0
+                pending, self._dirty = self._dirty, set()
+                self._in_flight = pending
+                rows = [dict(self._users[user_id][concept_id]) for user_id, concept_id in pending]
+            for row in rows:
+                row.setdefault("mastery_score", row["p_known"])
+                row.setdefault("confidence_level", confidence_level(row["p_known"], row["attempts_count"]))
+            try:
+                self.backend.write(rows)
+            except Exception as e:
+                with self._lock:
+                    # Rows changed since the snapshot are already dirty again with newer values
+                    self._dirty |= pending
+                    self._in_flight = set()
+                    self.stats["flush_errors"] += 1
+                print(f"[Mastery Store] Flush of {len(rows)} rows failed, will retry: {e}")
+                return 0
+            with self._lock:
+                self._in_flight = set()
+                self.stats["flushes"] += 1
+                self.stats["rows_written"] += len(rows)
+            return len(rows)
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _acquire_writer_lock(self):
+        """
+        Exclusive lock for the lifetime of the flusher: a second server process on this
+        host (e.g. gunicorn -w 2) fails here instead of overwriting this cache's rows.
+        """
+        if not FCNTL_AVAILABLE or self._writer_lock is not None:
+            return
+        handle = open(MASTERY_LOCK_PATH, "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            raise RuntimeError(
+                f"Another process holds {MASTERY_LOCK_PATH}: the mastery store's write-behind cache "
+                "needs a single writer, run one server worker (gunicorn -w 1)"
+            )
+        self._writer_lock = handle
+
+    def _release_writer_lock(self):
+        if self._writer_lock is not None:
+            self._writer_lock.close()  # closing the descriptor releases the flock
+            self._writer_lock = None
+
+    def start(self):
+        if self._thread is None:
+            self._acquire_writer_lock()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="mastery-write-behind", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops the flusher and writes whatever is still pending."""
+        if self._thread is not None:
+            self._stopping = True
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        self._release_writer_lock()
+
+    def status(self) -> dict:
+        with self._lock:
+            return {"backend": type(self.backend).__name__, "cached_users": len(self._users),
+                    "pending_writes": len(self._dirty), **self.stats}
+
@@ -0,0 +1,293 @@
+# backend/pfa.py - Performance Factors Analysis (Logistic Knowledge Tracing)
+"""
+A second knowledge-tracing engine next to BKT. Performance Factors Analysis
+models an attempt on an item with Q-matrix weights w_k as
+
+    logit P(correct) = sum_k w_k * (beta_k + gamma_k * s_k + rho_k * f_k)
+
+where s_k / f_k are the student's earlier successes and failures on concept
+k. Unlike BKT's per-concept updates blended by weight, every concept of a
+multi-concept item contributes to one prediction, and a student's state is
+just counts, which the mastery table already keeps (correct_count and
+attempts_count - correct_count, counted the same way: one opportunity per
+concept in the item's Q-matrix).
+
+- Fitting is L2-regularized logistic regression by Newton's method over a
+  sparse (attempts x 3C) design matrix: columns beta | gamma | rho per concept.
+  The gradient is one sparse product per iteration. The 3C x 3C Hessian sums
+  only the nonzero pairs of each row (one bincount).
+- Prediction for a roster is one sparse matmul: the (students x 2C)
+  success/failure count matrix times a (2C x items) weight matrix, plus the
+  items' beta terms. Per-attempt replay predictions are one sparse matvec.
+
+Sparse matrices are a small NumPy-only CSR class (the backend depends on NumPy
+alone). Fitted parameters go to PFA_PARAMS_PATH (backend/pfa_params.json),
+in the same {"concepts": {...}} shape as bkt_params.json.
+
+Usage:
+    python pfa.py --attempts attempts.csv --problems problems.json
+    SUPABASE_URL=... SUPABASE_SERVICE_KEY=... python pfa.py --supabase
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from knowledge_tracing import load_json_params
+from mastery_replay import add_attempts_arguments, atomic_write_json, load_attempts_input
+
+PFA_PARAMS_PATH = os.environ.get(
+    "PFA_PARAMS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "pfa_params.json")
+)
+L2_PENALTY = 1.0
+
+
+def load_pfa_params(path: str = None) -> Dict[str, Dict[str, float]]:
+    """{concept_id: {"beta", "gamma", "rho", ...}} from the fitted PFA lookup."""
+    return load_json_params(path or PFA_PARAMS_PATH)
+
+
+def sigmoid(z: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -35.0, 35.0)))
+
+
+class CSRMatrix:
+    """Compressed sparse rows: row i holds indices/data[indptr[i]:indptr[i + 1]]."""
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, shape: Tuple[int, int]):
+        self.indptr, self.indices, self.data, self.shape = indptr, indices, data, shape
+        self.row_of = np.repeat(np.arange(shape[0]), np.diff(indptr))
+
+    @classmethod
+    def from_coo(cls, rows, cols, values, shape: Tuple[int, int]) -> "CSRMatrix":
+        rows, cols = np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+        order = np.lexsort((cols, rows))
+        indptr = np.r_[0, np.cumsum(np.bincount(rows, minlength=shape[0]))]
+        return cls(indptr, cols[order], np.asarray(values, dtype=np.float64)[order], shape)
+
+    def dot(self, dense: np.ndarray, block_cells: int = 1 << 20) -> np.ndarray:
+        """
+        self @ dense for a vector (one bincount) or a (columns x m) matrix. For a matrix the
+        output is dense anyway, so row blocks of about block_cells cells are expanded and
+        multiplied with BLAS instead of materializing an (nnz x m) temporary.
+        """
+        dense = np.asarray(dense, dtype=np.float64)
+        if dense.ndim == 1:
+            return np.bincount(self.row_of, weights=self.data * dense[self.indices], minlength=self.shape[0])
+        n_rows, n_cols = self.shape
+        out = np.empty((n_rows, dense.shape[1]), dtype=np.float64)
+        step = max(1, block_cells // max(1, n_cols))
+        for start in range(0, n_rows, step):
+            stop = min(n_rows, start + step)
+            lo, hi = self.indptr[start], self.indptr[stop]
+            block = np.bincount((self.row_of[lo:hi] - start) * n_cols + self.indices[lo:hi],
+                                weights=self.data[lo:hi], minlength=(stop - start) * n_cols)
+            out[start:stop] = block.reshape(stop - start, n_cols) @ dense
+        return out
+
+    def rdot(self, vector: np.ndarray) -> np.ndarray:
+        """self.T @ vector."""
+        return np.bincount(self.indices, weights=self.data * vector[self.row_of], minlength=self.shape[1])
+
+    def gram(self, row_weights: np.ndarray) -> np.ndarray:
+        """self.T @ diag(row_weights) @ self, from the nonzero pairs within each row."""
+        n_cols = self.shape[1]
+        gram = np.zeros(n_cols * n_cols, dtype=np.float64)
+        counts = np.diff(self.indptr)
+        for m in np.unique(counts[counts > 0]).tolist():
+            # Rows with m nonzeros as (R, m) blocks: R*m*m pairs in one bincount
+            slots = self.indptr[:-1][counts == m][:, None] + np.arange(m)
+            cols, vals = self.indices[slots], self.data[slots]
+            weights = row_weights[self.row_of[slots[:, 0]]]
+            pair_index = (cols[:, :, None] * n_cols + cols[:, None, :]).ravel()
+            pair_value = (weights[:, None, None] * vals[:, :, None] * vals[:, None, :]).ravel()
+            gram += np.bincount(pair_index, weights=pair_value, minlength=n_cols * n_cols)
+        return gram.reshape(n_cols, n_cols)
+
+
+def prior_counts(student_codes: np.ndarray, concept_codes: np.ndarray, correct: np.ndarray,
+                 n_concepts: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Successes and failures on the same (student, concept) before each opportunity;
+    opportunities are in time order.
+    """
+    key = student_codes * n_concepts + concept_codes
+    order = np.argsort(key, kind="stable")
+    sorted_key, sorted_correct = key[order], correct[order].astype(np.float64)
+    group_start = np.r_[0, np.flatnonzero(np.diff(sorted_key)) + 1]
+    group_of = np.repeat(np.arange(len(group_start)), np.diff(np.r_[group_start, len(key)]))
+    seen = np.cumsum(sorted_correct) - sorted_correct       # successes before, counted from the start
+    successes = seen - seen[group_start][group_of]
+    position = np.arange(len(key)) - group_start[group_of]  # opportunities before in the group
+    out_successes, out_failures = np.empty(len(key)), np.empty(len(key))
+    out_successes[order], out_failures[order] = successes, position - successes
+    return out_successes, out_failures
+
+
+class PerformanceFactorsAnalysis:
+    def __init__(self, concept_params: Dict[str, Dict[str, float]] = None, beta_default: float = -0.5,
+                 gamma_default: float = 0.2, rho_default: float = 0.05):
+        """Concepts without fitted parameters use the defaults (a weak prior that practice helps)."""
+        self.beta_default = beta_default
+        self.gamma_default = gamma_default
+        self.rho_default = rho_default
+        self.concept_params = concept_params if concept_params is not None else load_pfa_params()
+
+    def params_for(self, concept_id: str) -> Tuple[float, float, float]:
+        fitted = self.concept_params.get(concept_id, {})
+        return (fitted.get("beta", self.beta_default), fitted.get("gamma", self.gamma_default),
+                fitted.get("rho", self.rho_default))
+
+    # ------------------------------------------------------------------
+    # Training and replay over attempt histories
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def design_matrix(student_ids: Sequence, q_matrices: Sequence[Dict[str, float]], is_correct: Sequence[bool],
+                      concepts: List[str]) -> CSRMatrix:
+        """
+        (attempts x 3C) features of attempts in time order: for each concept k of the
+        attempt's Q-matrix, w at beta_k, w * s_k at gamma_k and w * f_k at rho_k, with
+        s/f counted before the attempt. Concepts outside `concepts` are left out.
+        """
+        concept_index = {concept_id: i for i, concept_id in enumerate(concepts)}
+        _, student_codes = np.unique(np.asarray(student_ids), return_inverse=True)
+        attempt, concept, weight = [], [], []
+        for i, q_matrix in enumerate(q_matrices):
+            for concept_id, w in q_matrix.items():
+                if concept_id in concept_index:
+                    attempt.append(i)
+                    concept.append(concept_index[concept_id])
+                    weight.append(w)
+        attempt, concept = np.array(attempt, dtype=np.int64), np.array(concept, dtype=np.int64)
+        weight = np.array(weight, dtype=np.float64)
+        correct = np.asarray(is_correct, dtype=bool)[attempt]
+        successes, failures = prior_counts(student_codes.ravel()[attempt], concept, correct, len(concepts))
+        n_concepts = len(concepts)
+        return CSRMatrix.from_coo(
+            np.tile(attempt, 3),
+            np.r_[concept, concept + n_concepts, concept + 2 * n_concepts],
+            np.r_[weight, weight * successes, weight * failures],
+            (len(q_matrices), 3 * n_concepts),
+        )
+
+    def fit(self, student_ids: Sequence, q_matrices: Sequence[Dict[str, float]], is_correct: Sequence[bool],
+            l2: float = L2_PENALTY, max_iter: int = 25, tol: float = 1e-6) -> Dict[str, Dict[str, float]]:
+        """
+        Fits beta/gamma/rho for every concept in the Q-matrices from attempts in time order
+        (per student). Updates and returns self.concept_params.
+        """
+        concepts = sorted({concept_id for q_matrix in q_matrices for concept_id in q_matrix})
+        X = self.design_matrix(student_ids, q_matrices, is_correct, concepts)
+        y = np.asarray(is_correct, dtype=np.float64)
+        theta = np.zeros(X.shape[1])
+        penalty = l2 * np.eye(X.shape[1])
+        for _ in range(max_iter):
+            p = sigmoid(X.dot(theta))
+            gradient = X.rdot(p - y) + l2 * theta
+            step = np.linalg.solve(X.gram(p * (1 - p)) + penalty, gradient)
+            theta -= step
+            if np.abs(step).max() < tol:
+                break
+        n = len(concepts)
+        attempts = np.bincount(X.indices[X.indices < n], minlength=n)
+        self.concept_params = {
+            concept_id: {"beta": round(float(theta[k]), 5), "gamma": round(float(theta[n + k]), 5),
+                         "rho": round(float(theta[2 * n + k]), 5), "attempts": int(attempts[k])}
+            for k, concept_id in enumerate(concepts)
+        }
+        return self.concept_params
+
+    def theta(self, concepts: List[str]) -> np.ndarray:
+        params = np.array([self.params_for(concept_id) for concept_id in concepts], dtype=np.float64).reshape(-1, 3)
+        return params.T.ravel()
+
+    def replay_predictions(self, student_ids: Sequence, q_matrices: Sequence[Dict[str, float]],
+                           is_correct: Sequence[bool]) -> np.ndarray:
+        """P(correct) for each attempt from the counts before it (one sparse matvec)."""
+        concepts = sorted({concept_id for q_matrix in q_matrices for concept_id in q_matrix})
+        X = self.design_matrix(student_ids, q_matrices, is_correct, concepts)
+        return sigmoid(X.dot(self.theta(concepts)))
+
+    # ------------------------------------------------------------------
+    # Online prediction from count state
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def count_matrix(concepts: List[str], roster_rows: List[Dict[str, dict]]) -> CSRMatrix:
+        """(students x 2C) sparse successes | failures from mastery rows ({concept_id: row} per student)."""
+        concept_index = {concept_id: i for i, concept_id in enumerate(concepts)}
+        rows, cols, values = [], [], []
+        for student, user_rows in enumerate(roster_rows):
+            for concept_id, row in user_rows.items():
+                k = concept_index.get(concept_id)
+                attempts = row.get("attempts_count") or 0
+                if k is None or not attempts:
+                    continue
+                successes = row.get("correct_count") or 0
+                rows += [student, student]
+                cols += [k, len(concepts) + k]
+                values += [successes, attempts - successes]
+        return CSRMatrix.from_coo(rows, cols, values, (len(roster_rows), 2 * len(concepts)))
+
+    def item_weights(self, concepts: List[str], q_matrices: Sequence[Dict[str, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """(2C x items) gamma | rho weights and the items' beta terms, for predict_correct."""
+        concept_index = {concept_id: i for i, concept_id in enumerate(concepts)}
+        weights = np.zeros((2 * len(concepts), len(q_matrices)), dtype=np.float64)
+        bias = np.zeros(len(q_matrices), dtype=np.float64)
+        for j, q_matrix in enumerate(q_matrices):
+            for concept_id, w in q_matrix.items():
+                beta, gamma, rho = self.params_for(concept_id)
+                bias[j] += w * beta
+                k = concept_index.get(concept_id)
+                if k is not None:
+                    weights[k, j] += w * gamma
+                    weights[len(concepts) + k, j] += w * rho
+        return weights, bias
+
+    def predict_correct(self, counts: CSRMatrix, concepts: List[str],
+                        q_matrices: Sequence[Dict[str, float]]) -> np.ndarray:
+        """(students x items) P(correct): one sparse matmul of the count matrix and item weights."""
+        weights, bias = self.item_weights(concepts, q_matrices)
+        return sigmoid(counts.dot(weights) + bias)
+
+    def mastery(self, counts: CSRMatrix, concepts: List[str]) -> np.ndarray:
+        """(students x C) P(correct) on a single-concept item, PFA's per-concept mastery estimate."""
+        return self.predict_correct(counts, concepts, [{concept_id: 1.0} for concept_id in concepts])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_attempts_arguments(parser)
+    parser.add_argument("--output", default=PFA_PARAMS_PATH)
+    parser.add_argument("--l2", type=float, default=L2_PENALTY, help="ridge penalty on beta/gamma/rho")
+    args = parser.parse_args()
+
+    q_matrices, events = load_attempts_input(parser, args)
+
+    start = time.perf_counter()
+    student_ids, attempt_q, correct = [], [], []
+    for user_id, _, _, _, (problem_id, is_correct) in events:
+        if q_matrices.get(problem_id):
+            student_ids.append(user_id)
+            attempt_q.append(q_matrices[problem_id])
+            correct.append(is_correct)
+    concepts = PerformanceFactorsAnalysis(concept_params={}).fit(student_ids, attempt_q, correct, args.l2)
+    elapsed = time.perf_counter() - start
+
+    lookup = {
+        "fitted_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "method": "PFA, L2-regularized logistic regression (Newton)",
+        "concepts": concepts,
+    }
+    atomic_write_json(args.output, lookup, indent=2)
+    print(f"[PFA Fitting] Fitted {len(concepts)} concepts from {len(correct)} attempts in {elapsed:.1f}s "
+          f"-> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
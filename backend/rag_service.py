@@ -1,15 +1,103 @@
 import os
+import re
 import math
 import glob
 import json
-from typing import List, Dict, Any
+import contextlib
+import shutil
+import hashlib
+import threading
+import uuid
+from collections import OrderedDict
+from typing import List, Dict, Any, NamedTuple, Optional
+
+import numpy as np
+
+from vector_index import VectorIndex, create_vector_index, mmr_select
+from content_service import CONTENT_DIR
+from embedding_providers import create_embedding_provider
+from near_duplicates import MinHashIndex
+
+# Bounded sizes for the query caches (popular questions recur across students and sessions)
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("RAG_QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+QUERY_RESULT_CACHE_SIZE = int(os.environ.get("RAG_QUERY_RESULT_CACHE_SIZE", "512"))
+
+# Estimated Jaccard similarity at which a new document is collapsed onto an indexed one
+DEDUP_THRESHOLD = float(os.environ.get("RAG_DEDUP_THRESHOLD", "0.8"))
+
+# Bulk ingestion publishes one snapshot per this many documents instead of one per document
+INGEST_BATCH_SIZE = int(os.environ.get("RAG_INGEST_BATCH_SIZE", "256"))
+
+# MMR re-ranks this many nearest neighbours per requested result
+MMR_CANDIDATE_FACTOR = 4
+
+# On-disk snapshot layout version; bump when document metadata changes shape
+INDEX_FORMAT = 2
+
+# File in index_dir naming the version directory that holds the current snapshot
+INDEX_POINTER = "CURRENT"
+
+
+def normalize_query(query: str) -> str:
+    """Normalizes query text so trivially different phrasings share a cache entry."""
+    text = query.strip().lower()
+    text = re.sub(r"\s+", " ", text)
+    return text.rstrip("?!. ")
+
+
+def content_hash(content: str) -> str:
+    """Stable hash of document content, used to skip re-embedding unchanged files."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def namespace_keys(metadata: dict) -> List[tuple]:
+    """Metadata namespaces a document belongs to, used to pre-filter retrieval."""
+    keys = []
+    for field in ("course", "chapter"):
+        if metadata.get(field):
+            keys.append((field, metadata[field]))
+    for concept_id in metadata.get("concept_ids") or []:
+        keys.append(("concept_id", concept_id))
+    return keys
+
+
+def matches_filters(metadata: dict, filters: Optional[Dict[str, str]]) -> bool:
+    if not filters:
+        return True
+    keys = set(namespace_keys(metadata))
+    return all((field, value) in keys for field, value in filters.items())
+
+
+class IndexSnapshot(NamedTuple):
+    """
+    One immutable version of the index. Readers grab `RAGService._snapshot` once
+    and use only it, so a query never sees half of an update and never waits on
+    ingestion; writers build the next version and swap it in.
+    """
+    version: int
+    knowledge_base: List[Dict[str, Any]]
+    docs_by_id: Dict[str, Dict[str, Any]]
+    namespaces: Dict[tuple, frozenset]
+    lexical_corpus: List[Dict[str, Any]]
+    vector_index: VectorIndex
+    duplicates: Dict[str, str]
+
+
+def resolve_index_dir(index_dir: str) -> str:
+    """
+    Directory holding the current snapshot files: the version directory named by
+    index_dir/CURRENT, or index_dir itself for the flat layout of older releases.
+    """
+    try:
+        with open(os.path.join(index_dir, INDEX_POINTER), "r", encoding="utf-8") as f:
+            return os.path.join(index_dir, f.read().strip())
+    except FileNotFoundError:
+        return index_dir
+
+
+def _tokenize(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
 
-try:
-    from google import genai
-    from google.genai import types
-    GENAI_AVAILABLE = True
-except ImportError:
-    GENAI_AVAILABLE = False
 
 class RAGService:
     """
@@ -18,123 +106,699 @@ class RAGService:
     and biological datasets, enabling the agents to ground their answers in verifiable literature.
     """
     
-    def __init__(self, api_key: str = None):
-        """Initialize the RAG service, preparing the embedding models."""
+    def __init__(self, api_key: str = None, index_backend: str = None, index_params: dict = None,
+                 index_dir: str = None, embedding_provider: str = None):
+        """
+        Initialize the RAG service, preparing the embedding models.
+        embedding_provider selects "gemini", "local" (offline hashing) or "auto".
+        index_backend selects the nearest-neighbour index ("exact" or "ivf");
+        index_params are passed to it (e.g. {"nlist": 1024, "nprobe": 16}).
+        index_dir (or RAG_INDEX_DIR) enables the shared memory-mapped snapshot.
+        """
         self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
-        if GENAI_AVAILABLE and self.api_key:
-            self.client = genai.Client(api_key=self.api_key)
-            self.embedding_model = 'gemini-embedding-001'
-        else:
-            self.client = None
+        self.embedder = create_embedding_provider(embedding_provider, self.api_key)
+        self.embedding_model = self.embedder.name if self.embedder else 'gemini-embedding-001'
+        self.client = getattr(self.embedder, "client", None)
+        # Directory holding the persisted, memory-mappable index snapshot (optional)
+        self.index_dir = index_dir or os.environ.get("RAG_INDEX_DIR")
             
-        # In-memory vector database
-        self.knowledge_base = []
+        # In-memory vector database: embedded documents keyed by doc_id
+        self._docs_by_id = {}
+        # (field, value) -> set of doc_ids, e.g. ("course", "statics")
+        self._namespaces = {}
+        self.vector_index = create_vector_index(index_backend, **(index_params or {}))
         self._is_loaded = False
+        self._is_indexing = False
+        # Raw documents read from disk, keyed by doc_id; answers lexical queries until embeddings are ready
+        self._lexical_by_id = {}
+        self.index_stats = {"pending": 0, "failed": 0}
+        self._write_lock = threading.Lock()
+        # Bumped on every index mutation so cached results never outlive the data they came from
+        self._index_version = 0
+        # Writers mutate the fields above in place under the write lock, then _publish() copies them into a snapshot
+        self._snapshot = IndexSnapshot(0, [], {}, {}, [], self.vector_index.snapshot(), {})
+        # Threads inside batch_writes() defer their _publish() calls to the end of the batch
+        self._batching = threading.local()
+        self._publish_pending = False
+        # Near-duplicate detection: MinHash signatures of canonical documents, and
+        # collapsed doc_id -> canonical doc_id (collapsed docs stay lexical-only, never embedded)
+        self.dedup_index = MinHashIndex(threshold=DEDUP_THRESHOLD)
+        self._duplicates = {}
+
+        # LRU caches: normalized query -> embedding, (normalized query, top_k, filters, index version) -> results
+        self._query_embedding_cache = OrderedDict()
+        self._query_result_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_stats = {"embedding_hits": 0, "embedding_misses": 0, "result_hits": 0, "result_misses": 0}
         
         print("[RAG Service] Initialized.")
 
-    def load_curriculum(self, content_dir: str):
-        """Loads and embeds all .mdx files from the given curriculum directory."""
-        if self._is_loaded or not self.client:
-            return
-            
-        print(f"[RAG Service] Indexing curriculum from {content_dir}...")
-        
+    @property
+    def knowledge_base(self) -> List[Dict[str, Any]]:
+        """Embedded documents as of the last published snapshot."""
+        return self._snapshot.knowledge_base
+
+    @property
+    def lexical_corpus(self) -> List[Dict[str, Any]]:
+        """Every registered document (embedded or not) as of the last published snapshot."""
+        return self._snapshot.lexical_corpus
+
+    def _count(self, stat: str, delta: int = 1):
+        """Adjusts an index_stats counter; the indexing thread and request threads both update them."""
+        with self._write_lock:
+            self.index_stats[stat] += delta
+
+    def _read_curriculum_files(self, content_dir: str) -> List[Dict[str, Any]]:
+        """
+        Reads every .mdx file under content_dir into a document dict keyed by its
+        path relative to the content root ("<course>/<chapter>/<section>.mdx"),
+        with course, chapter, title and concept_ids metadata for namespacing.
+        """
+        content_dir = os.path.abspath(content_dir)
+        content_root = os.path.abspath(str(CONTENT_DIR))
+        if not (content_dir == content_root or content_dir.startswith(content_root + os.sep)):
+            content_root = os.path.dirname(content_dir)
         # We need an absolute path or relative from the backend script execution
         search_pattern = os.path.join(content_dir, '**', '*.mdx')
-        mdx_files = glob.glob(search_pattern, recursive=True)
-        
-        count = 0
+        # Sorted so the earliest section of a near-duplicate group becomes canonical
+        mdx_files = sorted(glob.glob(search_pattern, recursive=True))
+
+        documents = []
         for file_path in mdx_files:
             try:
                 with open(file_path, 'r', encoding='utf-8') as f:
                     content = f.read()
-                    
                 # Basic chunking (if files were large, we'd split them. These MDX are small enough to embed whole)
-                doc_id = os.path.basename(file_path)
-                self.embed_document(doc_id, content, {"filename": doc_id, "path": file_path})
-                count += 1
+                # Keyed by relative path so sections sharing a file name don't collide
+                doc_id = os.path.relpath(file_path, content_root).replace(os.sep, "/")
+                parts = doc_id.split("/")
+                section = os.path.splitext(parts[-1])[0]
+                metadata = {
+                    "filename": os.path.basename(file_path),
+                    "path": file_path,
+                    "course": parts[0] if len(parts) > 1 else "",
+                    "chapter": "/".join(parts[1:-1]),
+                    "section": section,
+                }
+                meta_path = os.path.join(os.path.dirname(file_path), f"{section}.meta.json")
+                if os.path.exists(meta_path):
+                    with open(meta_path, 'r', encoding='utf-8') as f:
+                        section_meta = json.load(f)
+                    metadata["title"] = section_meta.get("title", "")
+                    metadata["concept_ids"] = list(section_meta.get("concept_ids") or [])
+                documents.append({"doc_id": doc_id, "content": content, "metadata": metadata})
             except Exception as e:
                 print(f"[RAG Service] Failed to register {file_path}: {e}")
-                
-        self._is_loaded = True
-        print(f"[RAG Service] Curriculum loaded ({count} documents embedded).")
+                self._count("failed")
+        return documents
+
+    def load_curriculum(self, content_dir: str):
+        """
+        Loads and embeds all .mdx files from the given curriculum directory.
+        Every file is read into the lexical corpus first, so retrieval can answer
+        (lexically) while the slower embedding pass is still running.
+        """
+        if self._is_loaded or self._is_indexing:
+            return
+        self._is_indexing = True
+            
+        print(f"[RAG Service] Indexing curriculum from {content_dir}...")
+        
+        try:
+            if self.index_dir and self.load_index(self.index_dir):
+                # Only files that changed since the snapshot was written get embedded
+                summary = self.sync_directory(content_dir)
+                if self.embedder and (summary["added"] or summary["updated"] or summary["deleted"]
+                                      or summary["duplicate"]):
+                    self.save_index(self.index_dir)
+                self._is_loaded = True
+                return
+
+            documents = self._read_curriculum_files(content_dir)
+            with self.batch_writes():
+                for doc in documents:
+                    self._upsert_lexical(doc["doc_id"], doc["content"], doc["metadata"])
+                    self._link_if_duplicate(doc["doc_id"], doc["content"], doc["metadata"])
+            with self._write_lock:
+                documents = [doc for doc in documents if doc["doc_id"] not in self._duplicates]
+            if not self.embedder:
+                print(f"[RAG Service] No embedding provider; serving {len(documents)} documents lexically.")
+                self._is_loaded = True
+                return
+            with self._write_lock:
+                self.index_stats["pending"] = len(documents)
+
+            count = 0
+            # Published batch by batch, so retrieval switches to embeddings as they arrive
+            for start in range(0, len(documents), INGEST_BATCH_SIZE):
+                with self.batch_writes():
+                    for doc in documents[start:start + INGEST_BATCH_SIZE]:
+                        if self.embed_document(doc["doc_id"], doc["content"], doc["metadata"]):
+                            count += 1
+                        else:
+                            with self._write_lock:
+                                self.dedup_index.remove(doc["doc_id"])
+                                self.index_stats["failed"] += 1
+                        self._count("pending", -1)
+
+            self._is_loaded = True
+            print(f"[RAG Service] Curriculum loaded ({count} documents embedded).")
+            if self.index_dir and count:
+                self.save_index(self.index_dir)
+        finally:
+            self._is_indexing = False
+
+    def save_index(self, index_dir: str):
+        """
+        Persists the index as a packed float32 matrix (embeddings.npy) plus a
+        compact document table (documents.jsonl), so other worker processes can
+        memory-map one shared copy instead of each holding their own. Collapsed
+        near-duplicates go to duplicates.jsonl with their canonical doc_id.
+        Each save writes a fresh version directory, then publishes it by atomically
+        replacing index_dir/CURRENT: loaders see the old snapshot or the new one,
+        never a mix, and concurrent savers never share a temp name.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        snapshot = self._snapshot
+        ids = snapshot.vector_index.ids
+        matrix = np.array(snapshot.vector_index.matrix, dtype=np.float32)
+        docs_by_id = snapshot.docs_by_id
+        version = snapshot.version
+        lexical_by_id = {doc["doc_id"]: doc for doc in snapshot.lexical_corpus}
+
+        manifest = {
+            "format": INDEX_FORMAT,
+            "embedding_model": self.embedding_model,
+            "count": len(ids),
+            "dim": int(matrix.shape[1]) if len(ids) else 0,
+            "index_version": version,
+        }
+        unique = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        name = f"v{version}-{unique}"
+        version_dir = os.path.join(index_dir, name)
+        os.makedirs(version_dir)
+        previous = resolve_index_dir(index_dir)
+        np.save(os.path.join(version_dir, "embeddings.npy"), matrix)
+        with open(os.path.join(version_dir, "documents.jsonl"), "w", encoding="utf-8") as f:
+            for doc_id in ids:
+                doc = docs_by_id[doc_id]
+                f.write(json.dumps({
+                    "doc_id": doc_id,
+                    "content_hash": doc["content_hash"],
+                    "metadata": doc["metadata"],
+                    "content": doc["content"],
+                }) + "\n")
+        with open(os.path.join(version_dir, "duplicates.jsonl"), "w", encoding="utf-8") as f:
+            for doc_id, canonical in snapshot.duplicates.items():
+                doc = lexical_by_id.get(doc_id)
+                if doc is None:
+                    continue
+                f.write(json.dumps({
+                    "doc_id": doc_id,
+                    "canonical": canonical,
+                    "content_hash": doc["content_hash"],
+                    "metadata": doc["metadata"],
+                    "content": doc["content"],
+                }) + "\n")
+        with open(os.path.join(version_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        pointer_tmp = os.path.join(index_dir, f"{INDEX_POINTER}.{unique}.tmp")
+        with open(pointer_tmp, "w", encoding="utf-8") as f:
+            f.write(name)
+        os.replace(pointer_tmp, os.path.join(index_dir, INDEX_POINTER))
+        self._prune_index_versions(index_dir, keep={name, os.path.basename(previous)}, before=previous)
+        print(f"[RAG Service] Saved index snapshot ({len(ids)} documents) to {version_dir}.")
+
+    def _prune_index_versions(self, index_dir: str, keep: set, before: str):
+        """
+        Deletes complete version directories older than the one just replaced.
+        The replaced version is kept for workers still loading it, and directories
+        without a manifest may be another process's save in progress. Workers that
+        already memory-mapped a deleted version keep reading it until they reload.
+        """
+        try:
+            cutoff = os.path.getmtime(os.path.join(before, "manifest.json"))
+        except OSError:
+            return
+        for entry in os.listdir(index_dir):
+            path = os.path.join(index_dir, entry)
+            manifest_path = os.path.join(path, "manifest.json")
+            if entry in keep or not entry.startswith("v") or not os.path.isdir(path):
+                continue
+            try:
+                if os.path.getmtime(manifest_path) < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                continue
+
+    def load_index(self, index_dir: str) -> bool:
+        """
+        Loads a snapshot written by save_index. Embeddings are memory-mapped
+        read-only, so every worker on the host shares the same page-cache pages.
+        Returns False when no compatible snapshot exists.
+        """
+        index_dir = resolve_index_dir(index_dir)
+        manifest_path = os.path.join(index_dir, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return False
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("format") != INDEX_FORMAT:
+                print(f"[RAG Service] Ignoring index snapshot with format {manifest.get('format')}.")
+                return False
+            if manifest.get("embedding_model") != self.embedding_model:
+                print(f"[RAG Service] Ignoring index snapshot built with {manifest.get('embedding_model')}.")
+                return False
+
+            matrix = np.load(os.path.join(index_dir, "embeddings.npy"), mmap_mode="r")
+            documents = []
+            with open(os.path.join(index_dir, "documents.jsonl"), "r", encoding="utf-8") as f:
+                for line in f:
+                    documents.append(json.loads(line))
+            if len(documents) != len(matrix):
+                print("[RAG Service] Index snapshot is inconsistent; rebuilding.")
+                return False
+            # Snapshots saved before duplicates were persisted have no file; sync_directory relinks them
+            duplicates = []
+            duplicates_path = os.path.join(index_dir, "duplicates.jsonl")
+            if os.path.exists(duplicates_path):
+                with open(duplicates_path, "r", encoding="utf-8") as f:
+                    duplicates = [json.loads(line) for line in f]
+
+            ids = [doc["doc_id"] for doc in documents]
+            with self._write_lock:
+                self.vector_index.load_matrix(ids, matrix)
+                self._docs_by_id = {doc["doc_id"]: doc for doc in documents}
+                namespaces = {}
+                for doc in documents:
+                    for key in namespace_keys(doc["metadata"]):
+                        namespaces.setdefault(key, set()).add(doc["doc_id"])
+                self._namespaces = namespaces
+                self._lexical_by_id = dict(self._docs_by_id)
+                self.dedup_index = MinHashIndex(threshold=DEDUP_THRESHOLD)
+                for doc in documents:
+                    self.dedup_index.add(doc["doc_id"], self.dedup_index.signature(doc["content"]),
+                                         doc["metadata"].get("course", ""))
+                self._duplicates = {}
+                for doc in duplicates:
+                    canonical = doc.pop("canonical")
+                    if canonical in self._docs_by_id:
+                        self._lexical_by_id[doc["doc_id"]] = doc
+                        self._duplicates[doc["doc_id"]] = canonical
+                self._publish()
+            print(f"[RAG Service] Memory-mapped index snapshot ({len(ids)} documents) from {index_dir}.")
+            return True
+        except Exception as e:
+            print(f"[RAG Service] Failed to load index snapshot from {index_dir}: {e}")
+            return False
+
+    def sync_directory(self, content_dir: str) -> Dict[str, int]:
+        """
+        Incrementally re-indexes content_dir: new files are added, files whose
+        content hash changed are re-embedded, and entries whose file disappeared
+        are deleted. Unchanged files cost no embedding calls.
+        """
+        content_dir = os.path.abspath(content_dir)
+        summary = {"added": 0, "updated": 0, "unchanged": 0, "duplicate": 0, "deleted": 0, "failed": 0, "lexical": 0}
+
+        documents = self._read_curriculum_files(content_dir)
+        seen = set()
+        for start in range(0, len(documents), INGEST_BATCH_SIZE):
+            with self.batch_writes():
+                for doc in documents[start:start + INGEST_BATCH_SIZE]:
+                    seen.add(doc["doc_id"])
+                    outcome = self.upsert_document(doc["doc_id"], doc["content"], doc["metadata"])
+                    summary[outcome] += 1
+
+        prefix = content_dir + os.sep
+        with self._write_lock:
+            registered = list(self._lexical_by_id.values()) + list(self._docs_by_id.values())
+        stale = {
+            doc["doc_id"] for doc in registered
+            if doc["metadata"].get("path", "").startswith(prefix) and doc["doc_id"] not in seen
+        }
+        with self.batch_writes():
+            for doc_id in stale:
+                if self.delete_document(doc_id):
+                    summary["deleted"] += 1
+
+        print(f"[RAG Service] Synced {content_dir}: {summary}")
+        return summary
+
+    def start_background_indexing(self, content_dir: str) -> threading.Thread:
+        """Runs load_curriculum on a daemon thread so the app can serve immediately."""
+        thread = threading.Thread(
+            target=self.load_curriculum, args=(content_dir,), name="rag-indexer", daemon=True
+        )
+        thread.start()
+        return thread
+
+    @contextlib.contextmanager
+    def batch_writes(self):
+        """
+        Coalesces the snapshots published by this thread's writes into one at the end,
+        so a bulk load pays the per-version copies once instead of once per document.
+        Readers keep seeing the previous version until the batch completes. Batches nest.
+        """
+        self._batching.depth = getattr(self._batching, "depth", 0) + 1
+        try:
+            yield self
+        finally:
+            self._batching.depth -= 1
+            if not self._batching.depth:
+                with self._write_lock:
+                    if self._publish_pending:
+                        self._publish()
+
+    def _publish(self):
+        """
+        Swaps in an immutable snapshot of the current state; caller holds the write lock.
+        Writers mutate the builder dicts in place, so they are copied here, once per
+        version rather than once per write, and the document lists are derived.
+        Inside batch_writes() this only marks a snapshot as pending.
+        """
+        if getattr(self._batching, "depth", 0):
+            self._publish_pending = True
+            return
+        self._publish_pending = False
+        self._index_version += 1
+        self._snapshot = IndexSnapshot(
+            version=self._index_version,
+            knowledge_base=list(self._docs_by_id.values()),
+            docs_by_id=dict(self._docs_by_id),
+            namespaces={key: frozenset(ids) for key, ids in self._namespaces.items()},
+            lexical_corpus=list(self._lexical_by_id.values()),
+            vector_index=self.vector_index.snapshot(),
+            duplicates=dict(self._duplicates),
+        )
+
+    def index_status(self) -> Dict[str, Any]:
+        """Reports indexing progress for the readiness endpoint."""
+        snapshot = self._snapshot
+        if self._is_indexing:
+            state = "indexing"
+        elif self._is_loaded:
+            state = "ready"
+        else:
+            state = "idle"
+        return {
+            "state": state,
+            "embeddings_available": self.embedder is not None,
+            "embedding_provider": self.embedding_model,
+            "documents_indexed": len(snapshot.knowledge_base),
+            "documents_pending": self.index_stats["pending"],
+            "documents_failed": self.index_stats["failed"],
+            "lexical_documents": len(snapshot.lexical_corpus),
+            "index_backend": type(self.vector_index).__name__,
+            "index_version": snapshot.version,
+            "deduplication": self.dedup_report(),
+        }
+
+    def dedup_report(self) -> Dict[str, Any]:
+        """How much near-duplicate collapsing has shrunk the index."""
+        snapshot = self._snapshot
+        collapsed = snapshot.duplicates
+        contents = {doc["doc_id"]: doc["content"] for doc in snapshot.lexical_corpus}
+        documents = len(contents)
+        indexed = documents - len(collapsed)
+        return {
+            "documents": documents,
+            "indexed": indexed,
+            "duplicates_collapsed": len(collapsed),
+            "text_bytes_saved": sum(len(contents[d].encode("utf-8")) for d in collapsed if d in contents),
+            "vector_bytes_saved": len(collapsed) * snapshot.vector_index.dim * 4 if self.embedder else 0,
+            "compression_ratio": round(documents / indexed, 3) if indexed else 1.0,
+            "threshold": self.dedup_index.threshold,
+            "collapsed": dict(collapsed),
+        }
+
+    def _update_namespaces(self, doc_id: str, old_metadata: Optional[dict], new_metadata: Optional[dict]):
+        """In-place update of the namespace table; caller holds the write lock."""
+        namespaces = self._namespaces
+        for key in namespace_keys(old_metadata or {}):
+            members = namespaces.get(key)
+            if members is not None:
+                members.discard(doc_id)
+                if not members:
+                    del namespaces[key]
+        for key in namespace_keys(new_metadata or {}):
+            namespaces.setdefault(key, set()).add(doc_id)
+
+    def _filter_candidates(self, filters: Dict[str, str], snapshot: IndexSnapshot):
+        """Intersects namespace memberships so only matching documents get scored."""
+        namespaces = snapshot.namespaces
+        candidates = None
+        for field, value in filters.items():
+            members = namespaces.get((field, value), frozenset())
+            candidates = members if candidates is None else candidates & members
+        return candidates or frozenset()
+
+    def _upsert_lexical(self, doc_id: str, content: str, metadata: dict = None):
+        entry = {"doc_id": doc_id, "content": content, "content_hash": content_hash(content), "metadata": metadata or {}}
+        with self._write_lock:
+            # Replacing an existing key keeps its position; new documents append
+            self._lexical_by_id[doc_id] = entry
+            self._publish()
+
+    def _drop_vector(self, doc_id: str):
+        """Removes doc_id from the embedded index (not the lexical corpus); caller holds the write lock."""
+        previous = self._docs_by_id.get(doc_id)
+        if previous is not None:
+            self._update_namespaces(doc_id, previous["metadata"], None)
+        self._docs_by_id.pop(doc_id, None)
+        self.vector_index.remove([doc_id])
+
+    def _link_if_duplicate(self, doc_id: str, content: str, metadata: dict = None) -> bool:
+        """
+        Collapses doc_id onto an indexed near-duplicate in the same course, or
+        registers it as canonical. Returns True when it was collapsed.
+        """
+        signature = self.dedup_index.signature(content)
+        namespace = (metadata or {}).get("course", "")
+        with self._write_lock:
+            match = self.dedup_index.query(signature, namespace, exclude=doc_id)
+            if match is None:
+                self.dedup_index.add(doc_id, signature, namespace)
+                if self._duplicates.pop(doc_id, None) is not None:
+                    self._publish()
+                return False
+            canonical, similarity = match
+            print(f"[RAG Service] {doc_id} is a near-duplicate of {canonical} (Jaccard ~{similarity:.2f}); collapsed.")
+            # It may have been canonical itself before this edit
+            self.dedup_index.remove(doc_id)
+            self._drop_vector(doc_id)
+            self._duplicates[doc_id] = canonical
+            self._publish()
+            return True
 
     def embed_document(self, doc_id: str, content: str, metadata: dict = None) -> bool:
         """
-        Embeds a document text into a vector space and stores it.
+        Embeds a document text into a vector space and stores it, replacing any
+        existing entry with the same doc_id.
         """
-        if not self.client:
-            print("[RAG Service] Error: Gemini client not initialized. Cannot embed.")
+        if not self.embedder:
+            print("[RAG Service] Error: No embedding provider configured. Cannot embed.")
             return False
             
         try:
             print(f"[RAG Service] Embedding document: {doc_id}...")
             # Generate embedding
-            response = self.client.models.embed_content(
-                model=self.embedding_model,
-                contents=content
-            )
-            vector = response.embeddings[0].values
+            vector = self.embedder.embed_one(content)
             
-            # Store in local memory
-            self.knowledge_base.append({
+            # Store in local memory (the vector itself lives packed in the index, not in this dict)
+            entry = {
                 "doc_id": doc_id,
                 "content": content,
-                "metadata": metadata or {},
-                "embedding": vector
-            })
+                "content_hash": content_hash(content),
+                "metadata": metadata or {}
+            }
+            with self._write_lock:
+                previous = self._docs_by_id.get(doc_id)
+                self._update_namespaces(doc_id, previous["metadata"] if previous else None, entry["metadata"])
+                self._docs_by_id[doc_id] = entry
+                self.vector_index.add([doc_id], [vector])
+                self._publish()
             return True
         except Exception as e:
             print(f"[RAG Service] Embedding failed for {doc_id}: {e}")
             return False
 
-    def retrieve_context(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
+    def upsert_document(self, doc_id: str, content: str, metadata: dict = None) -> str:
+        """
+        Adds or updates a single document, skipping the embedding call when the
+        stored content hash already matches.
+        Near-duplicates of an indexed document are linked to it instead of embedded.
+        Returns one of "added", "updated", "unchanged", "duplicate", "lexical" or "failed".
+        """
+        new_hash = content_hash(content)
+        with self._write_lock:
+            index = self._lexical_by_id if (not self.embedder or doc_id in self._duplicates) else self._docs_by_id
+            existing = index.get(doc_id)
+        if existing is not None and existing.get("content_hash") == new_hash:
+            return "unchanged"
+
+        self._upsert_lexical(doc_id, content, metadata)
+        if self._link_if_duplicate(doc_id, content, metadata):
+            return "duplicate"
+        if not self.embedder:
+            return "lexical"
+        if not self.embed_document(doc_id, content, metadata):
+            with self._write_lock:
+                self.dedup_index.remove(doc_id)
+            return "failed"
+        return "updated" if existing is not None else "added"
+
+    def delete_document(self, doc_id: str) -> bool:
+        """
+        Removes a document from both the vector and lexical indexes. Near-duplicates
+        that were collapsed onto it are re-ingested, so the best of them becomes canonical.
+        """
+        with self._write_lock:
+            removed = doc_id in self._docs_by_id or doc_id in self._lexical_by_id
+            self._drop_vector(doc_id)
+            self.dedup_index.remove(doc_id)
+            orphan_ids = [d for d, canonical in self._duplicates.items() if canonical == doc_id]
+            orphans = [self._lexical_by_id[d] for d in orphan_ids if d in self._lexical_by_id]
+            self._lexical_by_id.pop(doc_id, None)
+            self._duplicates.pop(doc_id, None)
+            for orphan_id in orphan_ids:
+                del self._duplicates[orphan_id]
+            if removed:
+                self._publish()
+        for orphan in orphans:
+            if not self._link_if_duplicate(orphan["doc_id"], orphan["content"], orphan["metadata"]) and self.embedder:
+                self.embed_document(orphan["doc_id"], orphan["content"], orphan["metadata"])
+        return removed
+
+    def _cache_get(self, cache: OrderedDict, key, stat: str):
+        with self._cache_lock:
+            if key in cache:
+                cache.move_to_end(key)
+                self.cache_stats[f"{stat}_hits"] += 1
+                return cache[key]
+            self.cache_stats[f"{stat}_misses"] += 1
+            return None
+
+    def _cache_put(self, cache: OrderedDict, key, value, max_size: int):
+        if max_size <= 0:
+            return
+        with self._cache_lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > max_size:
+                cache.popitem(last=False)
+
+    def embed_query(self, query: str) -> Optional[List[float]]:
+        """
+        Returns the embedding for a query, skipping the provider call when the
+        normalized text has been embedded before.
+        """
+        key = normalize_query(query)
+        vector = self._cache_get(self._query_embedding_cache, key, "embedding")
+        if vector is not None:
+            return vector
+
+        vector = self.embedder.embed_one(query)
+        self._cache_put(self._query_embedding_cache, key, vector, QUERY_EMBEDDING_CACHE_SIZE)
+        return vector
+
+    def clear_query_cache(self):
+        """Drops all cached query embeddings and results."""
+        with self._cache_lock:
+            self._query_embedding_cache.clear()
+            self._query_result_cache.clear()
+
+    def _lexical_search(self, query: str, top_k: int, filters: Dict[str, str] = None,
+                        snapshot: IndexSnapshot = None) -> List[Dict[str, Any]]:
+        """Token-overlap scoring with IDF weighting; used while embeddings are unavailable."""
+        snapshot = snapshot or self._snapshot
+        query_terms = set(_tokenize(query))
+        corpus = [
+            doc for doc in snapshot.lexical_corpus
+            if doc["doc_id"] not in snapshot.duplicates and matches_filters(doc["metadata"], filters)
+        ]
+        if not query_terms or not corpus:
+            return []
+
+        doc_terms = [_tokenize(doc["content"]) for doc in corpus]
+        doc_freq = {}
+        for terms in doc_terms:
+            for term in query_terms.intersection(terms):
+                doc_freq[term] = doc_freq.get(term, 0) + 1
+
+        scored_docs = []
+        for doc, terms in zip(corpus, doc_terms):
+            if not terms:
+                continue
+            counts = {}
+            for term in terms:
+                if term in query_terms:
+                    counts[term] = counts.get(term, 0) + 1
+            score = sum(
+                (count / len(terms)) * math.log(1 + len(corpus) / doc_freq[term])
+                for term, count in counts.items()
+            )
+            if score > 0:
+                scored_docs.append((score, doc))
+
+        scored_docs.sort(key=lambda x: x[0], reverse=True)
+        return [doc for score, doc in scored_docs[:top_k]]
+
+    def retrieve_context(self, query: str, top_k: int = 3, reuse_results: bool = True,
+                         filters: Dict[str, str] = None, mmr_lambda: float = None) -> List[Dict[str, Any]]:
         """
         Searches the knowledge base for documents most relevant to the query.
+        filters restricts the search to metadata namespaces before any scoring,
+        e.g. {"course": "statics"} or {"course": "bio-inspired", "concept_id": "porosity"}
+        (supported fields: course, chapter, concept_id).
+        mmr_lambda enables maximal-marginal-relevance selection over the
+        MMR_CANDIDATE_FACTOR * top_k nearest documents: 1.0 is plain top-k, lower
+        values trade relevance for covering distinct material (0.5-0.7 is typical).
+        When reuse_results is set, identical (normalized) queries against an
+        unchanged index version return the cached top-k without rescoring.
+        Falls back to lexical search while nothing has been embedded yet.
         """
-        if not self.client:
-             print("[RAG Service] Error: Gemini client not initialized. Cannot retrieve.")
-             return []
-             
         print(f"[RAG Service] Retrieving top {top_k} contexts for query: '{query}'")
+        filters = {field: value for field, value in (filters or {}).items() if value}
+        # One consistent version for the whole query, however many writes land meanwhile
+        snapshot = self._snapshot
         
-        if not self.knowledge_base:
-            return []
+        if not self.embedder or not snapshot.knowledge_base:
+            return self._lexical_search(query, top_k, filters, snapshot)
+
+        result_key = (normalize_query(query), top_k, tuple(sorted(filters.items())), mmr_lambda, snapshot.version)
+        if reuse_results:
+            cached = self._cache_get(self._query_result_cache, result_key, "result")
+            if cached is not None:
+                return list(cached)
             
         try:
-            # Embed the query
-            response = self.client.models.embed_content(
-                model=self.embedding_model,
-                contents=query
-            )
-            query_vector = response.embeddings[0].values
-            
-            # Pure python cosine similarity
-            def cosine_similarity(v1, v2):
-                dot_product = sum(a * b for a, b in zip(v1, v2))
-                norm1 = math.sqrt(sum(a * a for a in v1))
-                norm2 = math.sqrt(sum(b * b for b in v2))
-                if norm1 == 0 or norm2 == 0:
-                    return 0.0
-                return dot_product / (norm1 * norm2)
-                
-            # Score each document
-            scored_docs = []
-            for doc in self.knowledge_base:
-                if "embedding" in doc:
-                    score = cosine_similarity(query_vector, doc["embedding"])
-                    scored_docs.append((score, doc))
+            # Embed the query (served from the LRU cache for repeated questions)
+            query_vector = self.embed_query(query)
             
-            # Sort descending by score
-            scored_docs.sort(key=lambda x: x[0], reverse=True)
-            
-            # Return top-k documents
-            return [doc for score, doc in scored_docs[:top_k]]
+            # Cosine similarity via the configured index backend (exact or approximate)
+            candidate_ids = self._filter_candidates(filters, snapshot) if filters else None
+            if mmr_lambda is None:
+                hits = snapshot.vector_index.search(query_vector, top_k, candidate_ids=candidate_ids)
+            else:
+                pool = snapshot.vector_index.search(query_vector, top_k * MMR_CANDIDATE_FACTOR,
+                                                    candidate_ids=candidate_ids)
+                pool_ids = [doc_id for doc_id, score in pool]
+                query_unit = np.asarray(query_vector, dtype=np.float32)
+                query_unit = query_unit / (np.linalg.norm(query_unit) or 1.0)
+                picks = mmr_select(query_unit, snapshot.vector_index.vectors(pool_ids), top_k, mmr_lambda)
+                hits = [pool[i] for i in picks]
+            docs_by_id = snapshot.docs_by_id
+            results = [docs_by_id[doc_id] for doc_id, score in hits if doc_id in docs_by_id]
+            if reuse_results:
+                self._cache_put(self._query_result_cache, result_key, results, QUERY_RESULT_CACHE_SIZE)
+            return results
             
         except Exception as e:
-            print(f"[RAG Service] Retrieval failed: {e}")
-            return []
+            # e.g. the embedding API is down: lexical results beat no grounding at all
+            print(f"[RAG Service] Retrieval failed, falling back to lexical search: {e}")
+            return self._lexical_search(query, top_k, filters, snapshot)
         
     def generate_grounded_answer(self, query: str, task_prompt: str) -> str:
         """
@@ -0,0 +1,217 @@
+# backend/recommender.py - Next-Problem Recommendation from BKT State
+"""
+Ranks a course's practice problems for one student by how much a single
+attempt is expected to tell us (information gain) or teach them (expected
+mastery gain), given their per-concept BKT state.
+
+The problem -> concept index is built from the content tree and cached like
+the curriculum graph (rebuilt when a *.practice.json or *.meta.json changes):
+- a problem's own `q_matrix` ({concept_id: weight}) or `concept_ids`/`concept_id` (weight 1.0);
+- otherwise its section's `concept_ids`, each at SECTION_CONCEPT_WEIGHT, since
+  we only know the problem belongs to the section, not which concept it exercises.
+
+Problems sharing a section's concepts still differ in how they respond to the
+knowledge state (item-level guess/slip, as in KT-IDEM), derived from the content:
+- multiple choice can be guessed with probability at least 1 / len(options);
+- a solution of n steps is slipped unless none of its steps is (slip compounds);
+- a `difficulty` label scales the slip rate (DIFFICULTY_SLIP_SCALE).
+So an open numeric problem, which a guess rarely answers, is more informative
+than a four-option question on the same concepts.
+
+The index is a dense (problems x concepts) weight matrix plus per-problem
+response parameters; a recommendation is one (problems x concepts) gain matrix.
+"""
+
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from curriculum_graph import course_dir_for, course_files, section_id
+
+SECTION_CONCEPT_WEIGHT = 0.5
+# problems.difficulty is easy / medium / challenging; "hard" is accepted from practice files as well
+DIFFICULTY_SLIP_SCALE = {"easy": 0.5, "medium": 1.0, "challenging": 2.0, "hard": 2.0}
+OBJECTIVES = ("information_gain", "mastery_gain")
+
+
+def binary_entropy(p: np.ndarray) -> np.ndarray:
+    p = np.clip(p, 1e-12, 1 - 1e-12)
+    return -(p * np.log2(p) + (1 - p) * np.log2(1 - p))
+
+
+def concept_gains(p_known: np.ndarray, p_guess: np.ndarray, p_slip: np.ndarray, p_transit: np.ndarray,
+                  objective: str = "information_gain") -> np.ndarray:
+    """
+    Per concept, the value of observing one answer:
+    - information_gain: mutual information (bits) between the answer and the knowledge state,
+      H(p) - E[H(posterior)]; highest near p = 0.5 with low guess/slip.
+    - mastery_gain: expected increase of p_known. The BKT posterior is a martingale
+      (E[posterior] = p), so this is the learning step (1 - p) * p_transit.
+    """
+    if objective == "mastery_gain":
+        return (1 - p_known) * p_transit
+    p_correct = p_known * (1 - p_slip) + (1 - p_known) * p_guess
+    post_correct = p_known * (1 - p_slip) / p_correct
+    post_wrong = p_known * p_slip / (1 - p_correct)
+    expected_entropy = p_correct * binary_entropy(post_correct) + (1 - p_correct) * binary_entropy(post_wrong)
+    return binary_entropy(p_known) - expected_entropy
+
+
+def problem_response_params(problem: dict) -> tuple:
+    """(guess floor, slip steps, slip scale) of a problem, from its options, steps and difficulty label."""
+    options = problem.get("options") or []
+    guess_floor = 1.0 / len(options) if problem.get("type") == "multiple_choice" and options else 0.0
+    steps = max(1, len(problem.get("steps") or []))
+    difficulty = problem.get("difficulty")
+    slip_scale = DIFFICULTY_SLIP_SCALE.get(difficulty.strip().lower(), 1.0) if isinstance(difficulty, str) else 1.0
+    return guess_floor, steps, slip_scale
+
+
+class ProblemIndex:
+    def __init__(self, course: str, problems: List[dict]):
+        """
+        problems: {"id", "section_id", "type", "stem", "q_matrix"} in reading order, optionally
+        with "response" = problem_response_params(...) (default: no guess floor, one step, scale 1).
+        """
+        self.course = course
+        self.problems = [problem for problem in problems if problem["q_matrix"]]
+        self.concepts = sorted({c for problem in self.problems for c in problem["q_matrix"]})
+        self.concept_index = {concept_id: i for i, concept_id in enumerate(self.concepts)}
+        self.row_of = {problem["id"]: i for i, problem in enumerate(self.problems)}
+        self.weights = np.zeros((len(self.problems), len(self.concepts)), dtype=np.float64)
+        for row, problem in enumerate(self.problems):
+            for concept_id, weight in problem["q_matrix"].items():
+                self.weights[row, self.concept_index[concept_id]] = weight
+        self.weight_totals = self.weights.sum(axis=1)
+        response = np.array([problem.get("response", (0.0, 1, 1.0)) for problem in self.problems],
+                            dtype=np.float64).reshape(len(self.problems), 3)
+        self.guess_floor, self.slip_steps, self.slip_scale = response[:, 0:1], response[:, 1:2], response[:, 2:3]
+        self.section_rows = {}
+        for row, problem in enumerate(self.problems):
+            self.section_rows.setdefault(problem["section_id"], []).append(row)
+
+    def recommend(self, p_known: np.ndarray, p_guess: np.ndarray, p_slip: np.ndarray, p_transit: np.ndarray,
+                  objective: str = "information_gain", k: int = 1, exclude=(),
+                  section: Optional[str] = None) -> List[dict]:
+        """Top-k problems; state arrays are aligned with self.concepts. Ties keep reading order."""
+        item_guess, item_slip = self.item_params(p_guess, p_slip)
+        gains = concept_gains(p_known, item_guess, item_slip, p_transit, objective)
+        scores = (self.weights * gains).sum(axis=1)
+        allowed = np.ones(len(self.problems), dtype=bool)
+        if section is not None:
+            allowed[:] = False
+            allowed[self.section_rows.get(section, [])] = True
+        for problem_id in exclude:
+            if problem_id in self.row_of:
+                allowed[self.row_of[problem_id]] = False
+        candidates = np.flatnonzero(allowed)
+        if len(candidates) == 0:
+            return []
+        k = min(k, len(candidates))
+        # Stable sort on the negated scores so equal scores keep reading order
+        top = candidates[np.argsort(-scores[candidates], kind="stable")[:k]]
+        p_correct = self.p_correct(p_known, p_guess, p_slip, top)
+        return [
+            {
+                "problem_id": self.problems[row]["id"],
+                "section_id": self.problems[row]["section_id"],
+                "type": self.problems[row]["type"],
+                "stem": self.problems[row]["stem"],
+                "concepts": self.problems[row]["q_matrix"],
+                "score": round(float(scores[row]), 6),
+                "p_correct": round(float(pc), 4),
+            }
+            for row, pc in zip(top.tolist(), p_correct.tolist())
+        ]
+
+    def item_params(self, p_guess: np.ndarray, p_slip: np.ndarray, rows=None):
+        """Per (problem, concept) guess and slip: the concept's, adjusted by each problem's response parameters."""
+        rows = slice(None) if rows is None else rows
+        guess = np.maximum(p_guess, self.guess_floor[rows])
+        slip = 1 - (1 - np.minimum(p_slip * self.slip_scale[rows], 0.99)) ** self.slip_steps[rows]
+        return guess, slip
+
+    def p_correct(self, p_known: np.ndarray, p_guess: np.ndarray, p_slip: np.ndarray, rows=None) -> np.ndarray:
+        """
+        Weight-averaged per-concept P(correct) of each problem. State arrays are (concepts,)
+        for one student, giving (problems,), or (users, concepts) for a roster, giving (users, problems).
+        """
+        rows = np.arange(len(self.problems)) if rows is None else np.asarray(rows)
+        guess, slip = self.item_params(p_guess[..., None, :], p_slip[..., None, :], rows)
+        correct = p_known[..., None, :] * (1 - slip) + (1 - p_known[..., None, :]) * guess
+        return (correct * self.weights[rows]).sum(axis=-1) / self.weight_totals[rows]
+
+
+def state_arrays(concepts: List[str], rows: Dict[str, dict], engine):
+    """
+    (p_known, p_guess, p_slip, p_transit) aligned with concepts, from mastery rows
+    ({concept_id: row}); missing rows or NULL columns use engine.params_for.
+    p_known is the row's forgetting-decayed effective_p_known when present (MasteryStore.get).
+    """
+    state = np.empty((4, len(concepts)), dtype=np.float64)
+    for i, concept_id in enumerate(concepts):
+        row = rows.get(concept_id) or {}
+        defaults = engine.params_for(concept_id)
+        for j, column in enumerate(("p_known", "p_guess", "p_slip", "p_transit")):
+            value = row.get("effective_p_known", row.get(column)) if j == 0 else row.get(column)
+            state[j, i] = defaults[j] if value is None else value
+    return state
+
+
+def roster_state_arrays(concepts: List[str], roster_rows: List[Dict[str, dict]], engine) -> np.ndarray:
+    """state_arrays for several users stacked as (4, users, concepts)."""
+    if not roster_rows:
+        return np.empty((4, 0, len(concepts)), dtype=np.float64)
+    return np.stack([state_arrays(concepts, rows, engine) for rows in roster_rows], axis=1)
+
+
+def problem_q_matrix(problem: dict, section_concepts: List[str]) -> Dict[str, float]:
+    if isinstance(problem.get("q_matrix"), dict) and problem["q_matrix"]:
+        return {concept_id: float(weight) for concept_id, weight in problem["q_matrix"].items()}
+    explicit = problem.get("concept_ids") or ([problem["concept_id"]] if problem.get("concept_id") else [])
+    if explicit:
+        return {concept_id: 1.0 for concept_id in explicit}
+    return {concept_id: SECTION_CONCEPT_WEIGHT for concept_id in section_concepts}
+
+
+_index_cache: Dict[str, tuple] = {}
+_index_lock = threading.Lock()
+
+
+def get_problem_index(course: str, content_dir: str = None) -> Optional[ProblemIndex]:
+    """The course's problem index, rebuilt only when its practice or meta files change."""
+    course_dir = course_dir_for(course, content_dir)
+    if course_dir is None:
+        return None
+    meta_paths = course_files(course_dir, ".meta.json")
+    practice_paths = course_files(course_dir, ".practice.json")
+    signature = tuple((path, os.path.getmtime(path)) for path in meta_paths + practice_paths)
+    with _index_lock:
+        cached = _index_cache.get(course_dir)
+        if cached and cached[0] == signature:
+            return cached[1]
+    section_concepts = {}
+    for path in meta_paths:
+        with open(path, "r", encoding="utf-8") as f:
+            section_concepts[section_id(path, ".meta.json")] = [c for c in json.load(f).get("concept_ids") or [] if c]
+    problems = []
+    for path in practice_paths:
+        sid = section_id(path, ".practice.json")
+        with open(path, "r", encoding="utf-8") as f:
+            for problem in json.load(f).get("problems") or []:
+                if problem.get("id"):
+                    problems.append({
+                        "id": problem["id"],
+                        "section_id": sid,
+                        "type": problem.get("type"),
+                        "stem": problem.get("stem") or problem.get("statement"),
+                        "q_matrix": problem_q_matrix(problem, section_concepts.get(sid, [])),
+                        "response": problem_response_params(problem),
+                    })
+    index = ProblemIndex(course, problems)
+    with _index_lock:
+        _index_cache[course_dir] = (signature, index)
+    return index
@@ -0,0 +1,315 @@
+# backend/review_scheduler.py - Spaced Review from the Forgetting Curve
+"""
+Schedules concept reviews from BKT mastery and last_practiced_at.
+
+A practiced concept is due for review when its forgetting-decayed mastery
+(knowledge_tracing.decayed_p_known) falls to REVIEW_THRESHOLD. The curve is
+deterministic until the next attempt, so the due time is closed-form:
+
+    due = last_practiced_at + half_life * log2((p - floor) / (threshold - floor))
+
+Only concepts whose stored mastery has reached the threshold are scheduled:
+one still below it is not yet learned, so reviewing it now would never end
+(it stays below until the student practices it). Those are reported as
+"learning" instead. Concepts that never decay to the threshold (or have decay
+disabled) are never due.
+
+Online, ReviewScheduler keeps one min-heap of (due_ts, concept_id) per user,
+built lazily from the MasteryStore the server passes in and updated after
+each graded attempt (push; superseded entries are skipped when they reach
+the top), so "what is due now" pops only the due items: O(k log n) for k
+of them.
+
+Nightly, `python review_scheduler.py` recomputes every user's schedule from
+the whole mastery table in a process pool (chunks of users per task) and
+writes REVIEW_SCHEDULE_PATH for roster-wide due counts.
+
+Usage:
+    python review_scheduler.py --workers 4
+    SUPABASE_URL=... SUPABASE_SERVICE_KEY=... python review_scheduler.py
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from curriculum_graph import MASTERED_THRESHOLD
+from knowledge_tracing import BayesianKnowledgeTracing
+from mastery_replay import atomic_write_json, parse_timestamp
+from mastery_store import backend_from_env
+
+REVIEW_THRESHOLD = float(os.environ.get("REVIEW_THRESHOLD", str(MASTERED_THRESHOLD)))
+REVIEW_SCHEDULE_PATH = os.environ.get(
+    "REVIEW_SCHEDULE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "review_schedule.json")
+)
+SECONDS_PER_DAY = 86400
+
+
+def review_due_times(p_known, last_practiced_ts, p_floor, half_life_days,
+                     threshold: float = REVIEW_THRESHOLD) -> np.ndarray:
+    """
+    Element-wise due time (epoch seconds) for stored p_known as of last_practiced_ts:
+    NaN where never practiced or p_known is still below the threshold (not yet
+    learned, nothing to review), inf where decay never reaches the threshold.
+    """
+    p_known = np.asarray(p_known, dtype=np.float64)
+    last = np.asarray(last_practiced_ts, dtype=np.float64)
+    p_floor = np.broadcast_to(np.asarray(p_floor, dtype=np.float64), p_known.shape)
+    half_life = np.broadcast_to(np.asarray(half_life_days, dtype=np.float64), p_known.shape)
+    decays_to_threshold = (threshold > p_floor) & (half_life > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days = half_life * np.log2((p_known - p_floor) / (threshold - p_floor))
+    days = np.where(p_known < threshold, np.nan, np.where(decays_to_threshold, days, np.inf))
+    return last + days * SECONDS_PER_DAY
+
+
+def schedule_rows(rows: List[dict], engine: BayesianKnowledgeTracing,
+                  threshold: float = REVIEW_THRESHOLD) -> Tuple[Dict[str, float], Dict[str, float]]:
+    """
+    ({concept_id: due_ts} for practiced rows that have reached the threshold and can come due,
+    {concept_id: p_known} for practiced rows still below it).
+    """
+    practiced = [row for row in rows if row.get("last_practiced_at") and row.get("p_known") is not None]
+    learning = {row["concept_id"]: row["p_known"] for row in practiced if row["p_known"] < threshold}
+    practiced = [row for row in practiced if row["p_known"] >= threshold]
+    if not practiced:
+        return {}, learning
+    due = review_due_times(
+        [row["p_known"] for row in practiced],
+        [parse_timestamp(row["last_practiced_at"]).timestamp() for row in practiced],
+        [engine.params_for(row["concept_id"])[0] for row in practiced],
+        [engine.half_life_for(row["concept_id"]) for row in practiced],
+        threshold,
+    )
+    return {row["concept_id"]: ts for row, ts in zip(practiced, due.tolist()) if np.isfinite(ts)}, learning
+
+
+def iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec="seconds")
+
+
+class ReviewScheduler:
+    def __init__(self, store, threshold: float = REVIEW_THRESHOLD, schedule_path: str = REVIEW_SCHEDULE_PATH,
+                 max_users: int = 10_000):
+        """store: a MasteryStore (get(user_id) -> {concept_id: row}, engine)."""
+        self.store = store
+        self.threshold = threshold
+        self.schedule_path = schedule_path
+        self.max_users = max_users
+        self._heaps: "OrderedDict[str, list]" = OrderedDict()  # user -> heap of (due_ts, concept_id)
+        self._due: Dict[str, Dict[str, float]] = {}            # user -> current due_ts per concept
+        self._learning: Dict[str, Dict[str, float]] = {}       # user -> p_known of concepts below the threshold
+        self._lock = threading.Lock()
+        self._snapshot = {"mtime": None, "users": {}, "generated_at": None}
+
+    def _user(self, user_id: str, schedule) -> list:
+        """The user's heap, installed from `schedule` (their schedule_rows) if not cached. Caller holds _lock."""
+        heap = self._heaps.get(user_id)
+        if heap is not None:
+            self._heaps.move_to_end(user_id)
+            return heap
+        due, learning = schedule
+        heap = [(ts, concept_id) for concept_id, ts in due.items()]
+        heapq.heapify(heap)
+        self._heaps[user_id], self._due[user_id], self._learning[user_id] = heap, due, learning
+        while len(self._heaps) > self.max_users:
+            evicted, _ = self._heaps.popitem(last=False)
+            self._due.pop(evicted, None)
+            self._learning.pop(evicted, None)
+        return heap
+
+    def refresh(self, user_id: str, concept_ids: Iterable[str]):
+        """Reschedules concepts after an attempt; users without a heap yet are built on their next read."""
+        with self._lock:
+            if user_id not in self._heaps:
+                return
+        rows = self.store.get(user_id)
+        due, learning = schedule_rows([rows[c] for c in concept_ids if c in rows], self.store.engine,
+                                      self.threshold)
+        with self._lock:
+            heap, current = self._heaps.get(user_id), self._due.get(user_id)
+            if heap is None:
+                return
+            for concept_id in concept_ids:
+                if concept_id in due:
+                    current[concept_id] = due[concept_id]
+                    heapq.heappush(heap, (due[concept_id], concept_id))
+                else:
+                    current.pop(concept_id, None)
+                if concept_id in learning:
+                    self._learning[user_id][concept_id] = learning[concept_id]
+                else:
+                    self._learning[user_id].pop(concept_id, None)
+
+    def _pop_valid(self, user_id: str, heap: list):
+        """Drops superseded entries from the top; returns the top (due_ts, concept_id) or None."""
+        current = self._due[user_id]
+        while heap and current.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def _collect_due(self, user_id: str, schedule, now_ts: float, limit: int):
+        """(due items, next valid entry, due count, learning) for due(). Caller holds _lock."""
+        heap = self._user(user_id, schedule)
+        learning = sorted(self._learning[user_id].items(), key=lambda item: item[1])
+        items = []
+        while len(items) < limit:
+            top = self._pop_valid(user_id, heap)
+            if top is None or top[0] > now_ts:
+                break
+            items.append(heapq.heappop(heap))
+        upcoming = self._pop_valid(user_id, heap)
+        for item in items:
+            heapq.heappush(heap, item)
+        if upcoming is not None and upcoming[0] <= now_ts:
+            # More are due than returned; count them (n is one user's practiced concepts)
+            due_count = sum(1 for ts in self._due[user_id].values() if ts <= now_ts)
+        else:
+            due_count = len(items)
+        return items, upcoming, due_count, learning
+
+    def due(self, user_id: str, now: datetime = None, limit: int = 10) -> dict:
+        """
+        Up to `limit` concepts due for review as of now, most overdue first, the next due time,
+        and the practiced concepts not yet at the threshold ("learning", lowest mastery first).
+        """
+        now_ts = (now or datetime.now(timezone.utc)).timestamp()
+        schedule = None
+        while True:
+            with self._lock:
+                if schedule is not None or user_id in self._heaps:
+                    items, upcoming, due_count, learning = self._collect_due(user_id, schedule, now_ts, limit)
+                    break
+            # Not cached (or evicted since the check): load the rows outside the lock, a miss may read the database
+            schedule = schedule_rows(list(self.store.get(user_id).values()), self.store.engine, self.threshold)
+        return {
+            "user_id": user_id,
+            "due": [{"concept_id": concept_id, "due_at": iso(ts),
+                     "overdue_days": round((now_ts - ts) / SECONDS_PER_DAY, 2)} for ts, concept_id in items],
+            "due_count": due_count,
+            "next_due_at": iso(upcoming[0]) if upcoming is not None else None,
+            "learning": [{"concept_id": concept_id, "p_known": round(p_known, 4)} for concept_id, p_known in learning],
+        }
+
+    def _load_snapshot(self) -> dict:
+        """The nightly schedule ({user_id: sorted due timestamps}), re-read when the file changes."""
+        try:
+            mtime = os.path.getmtime(self.schedule_path)
+        except OSError:
+            return self._snapshot
+        if mtime != self._snapshot["mtime"]:
+            with open(self.schedule_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            users = {user_id: np.array([parse_timestamp(due_at).timestamp() for _, due_at in items])
+                     for user_id, items in data.get("users", {}).items()}
+            self._snapshot = {"mtime": mtime, "users": users, "generated_at": data.get("generated_at")}
+        return self._snapshot
+
+    def roster(self, now: datetime = None) -> dict:
+        """Due counts for every user in the nightly schedule, overridden by live heaps where cached."""
+        now_ts = (now or datetime.now(timezone.utc)).timestamp()
+        snapshot = self._load_snapshot()
+        counts = {user_id: int(np.searchsorted(due, now_ts, side="right"))
+                  for user_id, due in snapshot["users"].items()}
+        with self._lock:
+            for user_id, current in self._due.items():
+                counts[user_id] = sum(1 for ts in current.values() if ts <= now_ts)
+        return {"generated_at": snapshot["generated_at"], "users": counts,
+                "users_with_reviews_due": sum(1 for count in counts.values() if count)}
+
+
+# ----------------------------------------------------------------------
+# Nightly recompute
+# ----------------------------------------------------------------------
+
+_worker_engine: Optional[BayesianKnowledgeTracing] = None
+
+
+def schedule_chunk(task) -> Dict[str, list]:
+    """
+    One pool task: {user_id: [[concept_id, due_at], ...] sorted by due} for a chunk of
+    users' rows, with one review_due_times call over the whole chunk.
+    """
+    global _worker_engine
+    if _worker_engine is None:
+        _worker_engine = BayesianKnowledgeTracing()  # one fitted-parameter load per worker
+    rows, threshold = task
+    rows = [row for row in rows if row.get("last_practiced_at") and row.get("p_known") is not None]
+    concepts = {row["concept_id"] for row in rows}
+    floor = {c: _worker_engine.params_for(c)[0] for c in concepts}
+    half_life = {c: _worker_engine.half_life_for(c) for c in concepts}
+    due = review_due_times(
+        [row["p_known"] for row in rows],
+        [parse_timestamp(row["last_practiced_at"]).timestamp() for row in rows],
+        [floor[row["concept_id"]] for row in rows],
+        [half_life[row["concept_id"]] for row in rows],
+        threshold,
+    )
+    # Rows arrive grouped by user; a stable sort on due within the chunk keeps that grouping per user
+    order = np.argsort(due, kind="stable")
+    order = order[np.isfinite(due[order])]
+    due_at = np.datetime_as_string(due[order].astype("datetime64[s]"), timezone="UTC")
+    schedules = {}
+    for i, at in zip(order.tolist(), due_at.tolist()):
+        schedules.setdefault(rows[i]["user_id"], []).append([rows[i]["concept_id"], at])
+    return schedules
+
+
+def user_chunks(rows: Iterable[dict], chunk_users: int) -> Iterable[List[dict]]:
+    """Rows ordered by user_id, cut into lists holding chunk_users whole users each."""
+    chunk, users = [], 0
+    for user_id, user_rows in itertools.groupby(rows, key=lambda row: row["user_id"]):
+        if users == chunk_users:
+            yield chunk
+            chunk, users = [], 0
+        chunk.extend(user_rows)
+        users += 1
+    if chunk:
+        yield chunk
+
+
+def recompute_all(rows: Iterable[dict], threshold: float = REVIEW_THRESHOLD, workers: int = None,
+                  chunk_users: int = 500) -> Dict[str, list]:
+    schedules = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        tasks = ((chunk, threshold) for chunk in user_chunks(rows, chunk_users))
+        for result in pool.map(schedule_chunk, tasks):
+            schedules.update(result)
+    return schedules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default=REVIEW_SCHEDULE_PATH)
+    parser.add_argument("--workers", type=int, default=None, help="process pool size (default: CPU count)")
+    parser.add_argument("--chunk-users", type=int, default=500, help="users per pool task")
+    parser.add_argument("--threshold", type=float, default=REVIEW_THRESHOLD)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    schedules = recompute_all(backend_from_env().load_all(), args.threshold, args.workers, args.chunk_users)
+    elapsed = time.perf_counter() - start
+
+    data = {
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "threshold": args.threshold,
+        "users": schedules,
+    }
+    atomic_write_json(args.output, data)
+    reviews = sum(len(items) for items in schedules.values())
+    print(f"[Review Scheduler] Scheduled {reviews} reviews for {len(schedules)} users in {elapsed:.1f}s "
+          f"-> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,13 +8,14 @@ FastAPI server providing:
 - Assist API (Rail)
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 import sys
 import os
+import math
 
 # Load .env file (do NOT override existing env vars — Render sets them at the OS level)
 from dotenv import load_dotenv
@@ -70,8 +71,19 @@ from module_hooks import (
 from content_service import load_section, generate_toc, get_fallback_toc
 from grading_service import grade_problem
 from rag_service import rag_service
+from context_compressor import context_compressor
 from agents.assessment_agent import AssessmentAgent
-from knowledge_tracing import BayesianKnowledgeTracing
+from knowledge_tracing import BayesianKnowledgeTracing, BatchKnowledgeTracing
+from mastery_store import MasteryStore, effective_mastery
+from curriculum_graph import MASTERED_THRESHOLD, get_course_graph
+from recommender import OBJECTIVES, get_problem_index, roster_state_arrays, state_arrays
+from review_scheduler import ReviewScheduler
+from pfa import PerformanceFactorsAnalysis
+from supabase_auth import SERVICE_ROLE, AuthError, can_read_users, token_verifier
+
+# Server-side mastery state (one writer per deployment, see mastery_store) and the reviews scheduled from it
+mastery_store = MasteryStore.from_env()
+review_scheduler = ReviewScheduler(mastery_store)
 
 # Initialize FastAPI
 app = FastAPI(
@@ -98,14 +110,48 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup_event():
     """Initialize systems on backend startup."""
-    print("[INFO] Application startup: Indexing Bio-Inspired curriculum for RAG...")
-    # Get absolute path to frontend/content/bio-inspired
+    print("[INFO] Application startup: Indexing all course content for RAG...")
+    # One index over frontend/content; each document is namespaced by course/chapter/concept_ids
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    content_dir = os.path.join(base_dir, "frontend", "content", "bio-inspired")
+    content_dir = os.path.join(base_dir, "frontend", "content")
     if os.path.exists(content_dir):
-        rag_service.load_curriculum(content_dir)
+        # Embedding runs in the background; retrieval falls back to lexical search until it finishes
+        rag_service.start_background_indexing(content_dir)
     else:
         print(f"[ERROR] Curriculum directory not found: {content_dir}")
+    # Write-behind flusher for server-side mastery state
+    mastery_store.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Persist mastery updates still waiting for the write-behind flush."""
+    mastery_store.stop()
+
+# ============================================================================
+# AUTH (Supabase access tokens; user ids never come from the request body)
+# ============================================================================
+
+def request_claims(authorization: Optional[str] = Header(None)) -> Optional[dict]:
+    """Verified Supabase claims of the caller, or None for an anonymous (stateless) request."""
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        raise HTTPException(status_code=401, detail="Authorization must be 'Bearer <Supabase access token>'.")
+    try:
+        return token_verifier.verify(token.strip())
+    except AuthError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
+def caller_user_id(claims: Optional[dict]) -> Optional[str]:
+    """The signed-in user whose server-side state a request may read and update."""
+    return claims.get("sub") if claims else None
+
+def require_readable(claims: Optional[dict], user_ids: List[str]):
+    if claims is None:
+        raise HTTPException(status_code=401, detail="Sign in: send 'Authorization: Bearer <Supabase access token>'.")
+    if not can_read_users(claims, user_ids):
+        raise HTTPException(status_code=403, detail="Only your own mastery can be read with this token.")
 
 # ============================================================================
 # DATA MODELS
@@ -182,6 +228,26 @@ async def root():
     return {"status": "ok", "message": "UA Intelligent Textbook API v2.0"}
 
 
+@app.get("/api/rag/status")
+async def get_rag_status():
+    """Report RAG indexing progress (documents indexed, pending and failed)."""
+    return rag_service.index_status()
+
+
+class ReindexRequest(BaseModel):
+    course: str = "bio-inspired"
+
+@app.post("/api/rag/reindex")
+async def reindex_rag(request: ReindexRequest, background_tasks: BackgroundTasks):
+    """Incrementally re-index a course's content (adds, updates and deletes by content hash)."""
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    content_dir = os.path.join(base_dir, "frontend", "content", request.course)
+    if not request.course.replace("-", "").replace("_", "").isalnum() or not os.path.isdir(content_dir):
+        raise HTTPException(status_code=404, detail=f"Unknown course: {request.course}")
+    background_tasks.add_task(rag_service.sync_directory, content_dir)
+    return {"status": "scheduled", "course": request.course}
+
+
 @app.get("/api/modules/{grade_level}")
 async def get_modules(grade_level: str):
     """Get module titles for a grade level."""
@@ -380,14 +446,23 @@ async def grade_summary(request: GradeSummaryRequest):
         raise HTTPException(status_code=500, detail=f"Grading error: {str(e)}")
 
 class GradeBKTRequest(BaseModel):
-    current_states: dict  # e.g., {"concept_A": 0.5, "concept_B": 0.2}
     q_matrix: dict        # e.g., {"concept_A": 1.0, "concept_B": 0.5}
     is_correct: bool
+    current_states: dict = {}      # anonymous (stateless) mode only, e.g. {"concept_A": 0.5, "concept_B": 0.2}
 
 @app.post("/api/grade")
-async def update_bkt_mastery(request: GradeBKTRequest):
-    """Update concept masteries using Bayesian Knowledge Tracing."""
+async def update_bkt_mastery(request: GradeBKTRequest, claims: Optional[dict] = Depends(request_claims)):
+    """
+    Update concept masteries using Bayesian Knowledge Tracing. Signed in: the server
+    loads, updates and persists the caller's mastery; anonymous: current_states in, new states out.
+    """
+    user_id = caller_user_id(claims)
     try:
+        if user_id:
+            new_states = mastery_store.apply_attempt(user_id, request.q_matrix, request.is_correct)
+            review_scheduler.refresh(user_id, list(new_states))
+            return {"new_states": new_states}
+
         bkt_engine = BayesianKnowledgeTracing()
         
         # Calculate new states based on the Q-Matrix
@@ -401,15 +476,67 @@ async def update_bkt_mastery(request: GradeBKTRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"BKT updating error: {str(e)}")
 
+class GradeBatchRequest(BaseModel):
+    # Column-oriented so a whole classroom or a replayed history stays compact:
+    # update i is (student_ids[i], concept_ids[i], is_correct[i]), applied in order per student/concept
+    student_ids: List[str]
+    concept_ids: List[str]
+    is_correct: List[bool]
+    weights: Optional[List[float]] = None      # Q-matrix weight per update (default 1.0)
+    p_guess: Optional[List[float]] = None      # per-update BKT parameters (defaults 0.2 / 0.1 / 0.1)
+    p_slip: Optional[List[float]] = None
+    p_transit: Optional[List[float]] = None
+    current_states: Dict[str, Dict[str, float]] = {}  # student_id -> {concept_id: p_known}
+
+@app.post("/api/grade/batch")
+async def update_bkt_mastery_batch(request: GradeBatchRequest):
+    """Applies many BKT updates in one vectorized pass and returns the final states per student."""
+    n = len(request.is_correct)
+    columns = {"student_ids": request.student_ids, "concept_ids": request.concept_ids, "weights": request.weights,
+               "p_guess": request.p_guess, "p_slip": request.p_slip, "p_transit": request.p_transit}
+    mismatched = [name for name, column in columns.items() if column is not None and len(column) != n]
+    if mismatched:
+        raise HTTPException(status_code=400, detail=f"Columns {mismatched} must have {n} entries, like is_correct.")
+    try:
+        current_states = {
+            (student_id, concept_id): p_known
+            for student_id, concepts in request.current_states.items()
+            for concept_id, p_known in concepts.items()
+        }
+        states = BatchKnowledgeTracing().replay(
+            request.student_ids, request.concept_ids, request.is_correct,
+            p_guess=request.p_guess, p_slip=request.p_slip, p_transit=request.p_transit,
+            weights=request.weights, current_states=current_states,
+        )
+        new_states = {}
+        for (student_id, concept_id), p_known in states.items():
+            new_states.setdefault(student_id, {})[concept_id] = p_known
+        return {"new_states": new_states, "updates_applied": n}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch BKT updating error: {str(e)}")
+
 class TelemetryFusionRequest(BaseModel):
-    current_p_slip: float
-    current_p_transit: float
     interaction_type: str
     intensity: float = 1.0
+    concept_id: Optional[str] = None  # signed in: adjust and persist the caller's stored row
+    current_p_slip: Optional[float] = None  # stateless mode only
+    current_p_transit: Optional[float] = None
 
 @app.post("/api/telemetry_fusion")
-async def fuse_telemetry(request: TelemetryFusionRequest):
+async def fuse_telemetry(request: TelemetryFusionRequest, claims: Optional[dict] = Depends(request_claims)):
     """Adjust BKT priors based on interaction telemetry (Soft Evidence)."""
+    user_id = caller_user_id(claims)
+    if user_id and request.concept_id:
+        try:
+            new_slip, new_transit = mastery_store.apply_telemetry(
+                user_id, request.concept_id, request.interaction_type, request.intensity
+            )
+            return {"new_p_slip": new_slip, "new_p_transit": new_transit}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Telemetry fusion error: {str(e)}")
+    if request.current_p_slip is None or request.current_p_transit is None:
+        raise HTTPException(status_code=400,
+                            detail="Sign in and send concept_id, or send current_p_slip and current_p_transit.")
     try:
         bkt_engine = BayesianKnowledgeTracing()
         
@@ -427,59 +554,275 @@ async def fuse_telemetry(request: TelemetryFusionRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Telemetry fusion error: {str(e)}")
 
+class TelemetryBatchRequest(BaseModel):
+    # Ordered event columns: event i is (student_ids[i] or the caller, concept_ids[i], interaction_types[i])
+    # Without student_ids the events are the signed-in caller's, applied to (and persisted in) the mastery store
+    concept_ids: List[Optional[str]]           # null (an activity with no concept tag): the event is skipped
+    interaction_types: List[str]
+    intensities: Optional[List[float]] = None  # default 1.0 each
+    student_ids: Optional[List[str]] = None    # stateless mode: several students, priors sent by the caller
+    current_priors: Dict[str, Dict[str, Dict[str, float]]] = {}  # student_id -> concept_id -> {p_slip, p_transit}
+    return_trajectory: bool = False
+
+@app.post("/api/telemetry_fusion/batch")
+async def fuse_telemetry_batch(request: TelemetryBatchRequest, claims: Optional[dict] = Depends(request_claims)):
+    """Applies an ordered batch of telemetry events in one vectorized pass; returns the final priors."""
+    n = len(request.interaction_types)
+    columns = {"concept_ids": request.concept_ids, "intensities": request.intensities,
+               "student_ids": request.student_ids}
+    mismatched = [name for name, column in columns.items() if column is not None and len(column) != n]
+    if mismatched:
+        raise HTTPException(status_code=400,
+                            detail=f"Columns {mismatched} must have {n} entries, like interaction_types.")
+    user_id = caller_user_id(claims)
+    if request.student_ids is None and not user_id:
+        raise HTTPException(status_code=401, detail="Sign in to apply your own events, or send student_ids.")
+    # Untagged events carry no evidence about any concept; drop them instead of rejecting the batch
+    keep = [i for i, concept_id in enumerate(request.concept_ids) if concept_id is not None]
+    concept_ids, interaction_types, intensities, student_ids = (
+        None if column is None else [column[i] for i in keep]
+        for column in (request.concept_ids, request.interaction_types, request.intensities, request.student_ids)
+    )
+    try:
+        if student_ids is None:
+            concepts, trajectory = mastery_store.apply_telemetry_batch(
+                user_id, concept_ids, interaction_types, intensities, trajectory=request.return_trajectory,
+            )
+            final = {(user_id, concept_id): value for concept_id, value in concepts.items()}
+        else:
+            current_priors = {
+                (student_id, concept_id): (values.get("p_slip", 0.1), values.get("p_transit", 0.1))
+                for student_id, concepts in request.current_priors.items()
+                for concept_id, values in concepts.items()
+            }
+            final, trajectory = BatchKnowledgeTracing().replay_telemetry(
+                student_ids, concept_ids, interaction_types, intensities,
+                current_priors=current_priors, trajectory=request.return_trajectory,
+            )
+        priors = {}
+        for (student_id, concept_id), (p_slip, p_transit) in final.items():
+            priors.setdefault(student_id, {})[concept_id] = {"p_slip": p_slip, "p_transit": p_transit}
+        # trajectory rows follow the applied events only
+        response = {"priors": priors, "events_applied": len(keep), "events_skipped": n - len(keep)}
+        if request.return_trajectory:
+            response["trajectory"] = {"p_slip": trajectory[:, 0].tolist(), "p_transit": trajectory[:, 1].tolist()}
+        return response
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch telemetry fusion error: {str(e)}")
+
+@app.get("/api/mastery/status")
+async def mastery_store_status():
+    """Cache size, pending write-behind rows and flush counters of the mastery store."""
+    return mastery_store.status()
+
+class EffectiveMasteryRequest(BaseModel):
+    # Columnar mastery rows, e.g. a dashboard's select from the mastery table
+    concept_ids: List[str]
+    p_known: List[float]
+    last_practiced_at: List[Optional[str]]
+
+@app.post("/api/mastery/effective")
+async def effective_mastery_batch(request: EffectiveMasteryRequest):
+    """Forgetting-decayed p_known as of now for any number of stored rows, in one vectorized pass."""
+    n = len(request.concept_ids)
+    if len(request.p_known) != n or len(request.last_practiced_at) != n:
+        raise HTTPException(status_code=400, detail="concept_ids, p_known and last_practiced_at must have the same length.")
+    try:
+        rows = [{"concept_id": c, "p_known": p, "last_practiced_at": t}
+                for c, p, t in zip(request.concept_ids, request.p_known, request.last_practiced_at)]
+        return {"effective_p_known": effective_mastery(rows, mastery_store.engine).tolist()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Effective mastery error: {str(e)}")
+
+@app.get("/api/mastery/{user_id}")
+async def get_user_mastery(user_id: str, claims: Optional[dict] = Depends(request_claims)):
+    """The user's current mastery rows (with forgetting-decayed effective_p_known), including unflushed updates."""
+    require_readable(claims, [user_id])
+    try:
+        return {"user_id": user_id, "concepts": mastery_store.get(user_id)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Mastery lookup error: {str(e)}")
+
+class PlacementRequest(BaseModel):
+    p_known: Dict[str, float]  # concept_id -> placement estimate, e.g. from the diagnostic assessment
+
+@app.post("/api/mastery/placement")
+async def set_placement_mastery(request: PlacementRequest, claims: Optional[dict] = Depends(request_claims)):
+    """Seeds the signed-in user's mastery from a placement diagnostic, via the server-side store."""
+    user_id = caller_user_id(claims)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Sign in to store placement results.")
+    if any(not 0 <= p <= 1 for p in request.p_known.values()):
+        raise HTTPException(status_code=400, detail="p_known values must be between 0 and 1.")
+    try:
+        new_states = mastery_store.apply_placement(user_id, request.p_known)
+        review_scheduler.refresh(user_id, list(new_states))
+        return {"new_states": new_states}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Placement update error: {str(e)}")
+
 class MasteryGraphRequest(BaseModel):
-    # This could take user_id and fetch from a real DB.
-    # For now, it accepts a dictionary of concept_id -> p_known scores
-    mastery_data: dict
+    course: str = "inst-design"
+    mastery_data: dict = {}        # concept_id -> p_known; empty and signed in: the caller's stored (decayed) mastery
 
 @app.post("/api/mastery_graph")
-async def generate_mastery_graph(request: MasteryGraphRequest):
-    """Generates a node-link structured JSON representing current curriculum mastery."""
+async def generate_mastery_graph(request: MasteryGraphRequest, claims: Optional[dict] = Depends(request_claims)):
+    """Node-link JSON of the course's concept prerequisite DAG with the learner's mastery overlaid."""
+    graph = get_course_graph(request.course)
+    if graph is None:
+        raise HTTPException(status_code=404, detail=f"Unknown course '{request.course}'.")
     try:
-        # Mocking hardcoded structural relationships for 'inst-design'
-        # In a generic system, this graph topology might live in a unified `q_matrix` or curriculum graph db.
-        nodes = []
-        edges = []
-        
-        # Hardcoding the curriculum structure for the mockup ID course
-        topics = [
-            {"id": "ct_1_1", "label": "Foundations of ID", "group": "core"},
-            {"id": "ct_1_2", "label": "Learning Theories", "group": "theory"},
-            {"id": "ct_1_3", "label": "Cognitive Load", "group": "theory"},
-            {"id": "ct_2_1", "label": "ADDIE Analysis", "group": "process"},
-            {"id": "ct_2_2", "label": "ADDIE Design", "group": "process"},
-            {"id": "ct_2_3", "label": "ADDIE Development", "group": "process"}
-        ]
-        
-        # Dependencies
-        links = [
-            {"source": "ct_1_1", "target": "ct_1_2"},
-            {"source": "ct_1_2", "target": "ct_1_3"},
-            {"source": "ct_1_1", "target": "ct_2_1"},
-            {"source": "ct_2_1", "target": "ct_2_2"},
-            {"source": "ct_2_2", "target": "ct_2_3"}
-        ]
-        
-        for topic in topics:
-            p_known = request.mastery_data.get(topic["id"], 0.1) # Default to 0.1
-            status = "novice"
-            if p_known > 0.8:
-                status = "mastered"
-            elif p_known > 0.5:
-                status = "emerging"
-                
-            nodes.append({
-                "id": topic["id"],
-                "label": topic["label"],
-                "group": topic["group"],
-                "p_known": round(p_known, 2),
-                "status": status
-            })
-            
-        return {"nodes": nodes, "links": links}
+        user_id = caller_user_id(claims)
+        if user_id and not request.mastery_data:
+            mastery = {concept_id: row["effective_p_known"]
+                       for concept_id, row in mastery_store.get(user_id).items()}
+        else:
+            mastery = request.mastery_data
+        # Unpracticed concepts start at their (fitted) BKT prior
+        engine = mastery_store.engine
+        default_p = {concept_id: engine.params_for(concept_id)[0] for concept_id in graph.concepts}
+        return graph.overlay(mastery, default_p)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Mastery graph generation error: {str(e)}")
 
+class MasteryForecastRequest(BaseModel):
+    user_ids: List[str]            # the roster, read from the server-side store (own id, or the service role)
+    concept_ids: List[str] = []    # or every concept of `course`
+    course: Optional[str] = None
+    mastery_data: dict = {}        # instead of the store: user_id -> {concept_id: p_known}
+    threshold: float = MASTERED_THRESHOLD
+    method: str = "closed_form"    # or "simulation" (n_sims runs per cell)
+    n_sims: int = 200
+    max_attempts: int = 100
+
+@app.post("/api/mastery/forecast")
+async def forecast_attempts_to_mastery(request: MasteryForecastRequest,
+                                       claims: Optional[dict] = Depends(request_claims)):
+    """Expected further attempts to reach the mastery threshold, for a roster x concept matrix in one call."""
+    if request.method not in ("closed_form", "simulation"):
+        raise HTTPException(status_code=400, detail="method must be 'closed_form' or 'simulation'.")
+    if not 0 < request.threshold < 1:
+        raise HTTPException(status_code=400, detail="threshold must be between 0 and 1.")
+    concepts = request.concept_ids
+    if request.course:
+        graph = get_course_graph(request.course)
+        if graph is None:
+            raise HTTPException(status_code=404, detail=f"Unknown course '{request.course}'.")
+        concepts = concepts or graph.concepts
+    if not request.mastery_data:
+        require_readable(claims, request.user_ids)
+    try:
+        engine = mastery_store.engine
+        if request.mastery_data:
+            rows = [{c: {"p_known": p} for c, p in (request.mastery_data.get(u) or {}).items()}
+                    for u in request.user_ids]
+        else:
+            rows = [mastery_store.get(u) for u in request.user_ids]
+        # (4, users, concepts): effective p_known, guess, slip, transit
+        state = roster_state_arrays(concepts, rows, engine)
+        attempts = engine.forecast_attempts_to_mastery(
+            state[0], state[3], request.threshold, state[1], state[2], method=request.method,
+            n_sims=min(max(1, request.n_sims), 1000), max_attempts=min(max(1, request.max_attempts), 1000),
+        )
+        return {
+            "user_ids": request.user_ids,
+            "concept_ids": concepts,
+            "threshold": request.threshold,
+            "method": request.method,
+            # None: never reached (no learning rate)
+            "expected_attempts": [[round(a, 2) if math.isfinite(a) else None for a in row] for row in attempts.tolist()],
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Mastery forecast error: {str(e)}")
+
+class MasteryPredictRequest(BaseModel):
+    course: str
+    user_ids: List[str]          # read from the server-side store (own id, or the service role)
+    problem_ids: List[str] = []  # default: every practice problem of the course
+    engine: str = "bkt"          # or "pfa" (Performance Factors Analysis over correct/attempt counts)
+
+@app.post("/api/mastery/predict")
+async def predict_problem_correctness(request: MasteryPredictRequest,
+                                      claims: Optional[dict] = Depends(request_claims)):
+    """P(correct) for a roster x problem matrix from each student's current state, with the chosen KT engine."""
+    if request.engine not in ("bkt", "pfa"):
+        raise HTTPException(status_code=400, detail="engine must be 'bkt' or 'pfa'.")
+    require_readable(claims, request.user_ids)
+    index = get_problem_index(request.course)
+    if index is None:
+        raise HTTPException(status_code=404, detail=f"Unknown course '{request.course}'.")
+    rows = [index.row_of[p] for p in request.problem_ids if p in index.row_of] if request.problem_ids \
+        else list(range(len(index.problems)))
+    try:
+        roster_rows = [mastery_store.get(u) for u in request.user_ids]
+        if request.engine == "pfa":
+            pfa_engine = PerformanceFactorsAnalysis()
+            counts = pfa_engine.count_matrix(index.concepts, roster_rows)
+            p_correct = pfa_engine.predict_correct(counts, index.concepts,
+                                                   [index.problems[r]["q_matrix"] for r in rows])
+        else:
+            p_known, p_guess, p_slip, _ = roster_state_arrays(index.concepts, roster_rows, mastery_store.engine)
+            # Weight-averaged per-concept P(correct) with each problem's guess/slip, as in ProblemIndex.recommend
+            p_correct = index.p_correct(p_known, p_guess, p_slip, rows)
+        return {
+            "course": request.course,
+            "engine": request.engine,
+            "user_ids": request.user_ids,
+            "problem_ids": [index.problems[r]["id"] for r in rows],
+            "p_correct": [[round(p, 4) for p in row] for row in p_correct.tolist()],
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Mastery prediction error: {str(e)}")
+
+class RecommendRequest(BaseModel):
+    course: str
+    mastery_data: dict = {}        # concept_id -> p_known; empty and signed in: the caller's stored BKT state
+    objective: str = "information_gain"  # or "mastery_gain"
+    k: int = 1
+    section_id: Optional[str] = None     # "chapter/section" to stay within one section
+    exclude: List[str] = []              # e.g. problems already answered this session
+
+@app.post("/api/recommend/next")
+async def recommend_next_problem(request: RecommendRequest, claims: Optional[dict] = Depends(request_claims)):
+    """Ranks the course's practice problems by expected information or mastery gain for this student."""
+    if request.objective not in OBJECTIVES:
+        raise HTTPException(status_code=400, detail=f"objective must be one of {list(OBJECTIVES)}.")
+    index = get_problem_index(request.course)
+    if index is None:
+        raise HTTPException(status_code=404, detail=f"Unknown course '{request.course}'.")
+    try:
+        user_id = caller_user_id(claims)
+        if user_id and not request.mastery_data:
+            rows = mastery_store.get(user_id)
+        else:
+            rows = {concept_id: {"p_known": p} for concept_id, p in request.mastery_data.items()}
+        state = state_arrays(index.concepts, rows, mastery_store.engine)
+        recommendations = index.recommend(*state, objective=request.objective, k=max(1, request.k),
+                                          exclude=request.exclude, section=request.section_id)
+        return {"course": request.course, "objective": request.objective, "recommendations": recommendations}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Recommendation error: {str(e)}")
+
+@app.get("/api/review/due")
+async def review_due(user_id: Optional[str] = None, limit: int = 10,
+                     claims: Optional[dict] = Depends(request_claims)):
+    """
+    The concepts the signed-in student (or, for the service role, user_id) should review now
+    (forgetting has taken them below the review threshold), most overdue first, plus the
+    practiced concepts not yet mastered ("learning"), which are never scheduled for review.
+    Service role without user_id: due counts per user from the nightly schedule.
+    """
+    user_id = user_id or caller_user_id(claims)
+    require_readable(claims, [user_id] if user_id else [])
+    if not user_id and claims.get("role") != SERVICE_ROLE:
+        raise HTTPException(status_code=403, detail="The review roster needs the service role.")
+    try:
+        if user_id:
+            return review_scheduler.due(user_id, limit=max(1, limit))
+        return review_scheduler.roster()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Review scheduling error: {str(e)}")
+
 @app.post("/api/generate_scenario")
 async def generate_scenario(request: ScenarioRequest):
     """Generate a dynamic scenario with a strictly enforced context to prevent hallucination."""
@@ -579,7 +922,7 @@ async def get_book_section(course: str, chapter: str, section: str):
 
 
 @app.post("/api/book/generate_custom_module")
-async def generate_custom_module(request: CurriculumGenerateRequest):
+async def generate_custom_module(request: CurriculumGenerateRequest, background_tasks: BackgroundTasks):
     """Dynamically generate and write a full textbook module from Lab context."""
     try:
         api_key = get_api_key(request)
@@ -619,6 +962,11 @@ async def generate_custom_module(request: CurriculumGenerateRequest):
             
         with open(practice_path, "w", encoding="utf-8") as f:
             json.dump(result.get("practice", {"problems": []}), f, indent=4)
+
+        # Make the new module visible to RAG without a restart (only changed files are embedded)
+        background_tasks.add_task(
+            rag_service.sync_directory, os.path.join(base_dir, "frontend", "content", "bio-inspired")
+        )
             
         return {
             "success": True,
@@ -869,8 +1217,6 @@ async def generate_and_insert_peer_note_task(req: PeerNoteRequest):
     except Exception as e:
         print(f"[AI PEER ERR] Exception during background peer note generation: {e}")
 
-from fastapi import BackgroundTasks
-
 @app.post("/api/assist/peer_note")
 async def schedule_peer_note(request: PeerNoteRequest, background_tasks: BackgroundTasks):
     """Endpoint called by frontend to trigger the stealth AI peer note generation."""
@@ -899,8 +1245,12 @@ async def chat_with_assistant(request: ChatRequest):
             role = "Student" if msg.get("role") == "user" else "Assistant"
             history_text += f"{role}: {msg.get('content', '')}\n"
         
-        # Truncate page content to fit context window (max 6000 chars)
-        page_context = request.page_content[:6000] if request.page_content else ""
+        # Pack the page passages most relevant to the question into ~1000 tokens
+        page_context = context_compressor.compress(
+            request.message,
+            [{"source": request.section_title or request.section_id, "content": request.page_content}],
+            token_budget=1000,
+        ) if request.page_content else ""
         
         # Check if this is the first message (no history)
         is_first_message = len(request.history) == 0
@@ -909,7 +1259,7 @@ async def chat_with_assistant(request: ChatRequest):
 
 REFERENCE MATERIAL (from current page):
 ---
-{page_context[:4000] if page_context else "No specific page content available."}
+{page_context if page_context else "No specific page content available."}
 ---
 
 Conversation so far:
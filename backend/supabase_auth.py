@@ -0,0 +1,152 @@
+# backend/supabase_auth.py - Supabase Access Token Verification
+"""
+The backend only touches a user's server-side state (mastery, reviews,
+recommendations) for the user proven by the caller's Supabase access token,
+never for a user_id the client put in the request: the mastery store writes
+with the service key, which bypasses row-level security.
+
+- SUPABASE_JWT_SECRET set: HS256 tokens are verified locally (signature, exp).
+- Otherwise, with SUPABASE_URL: the token is checked against Supabase Auth
+  (GET /auth/v1/user), and the answer is cached until the token expires.
+- The service key itself authenticates as role "service_role" (staff tools
+  reading other users' rows, e.g. roster forecasts).
+- Neither configured (local development only): claims are decoded without
+  verification, and always as role "authenticated" (a forged "service_role"
+  claim would otherwise read every user's rows). In production
+  (ALGET_ENV=production, or on Render) the server refuses to start without
+  Supabase settings, see require_supabase_config.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from typing import Dict, List
+
+SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
+SUPABASE_SERVICE_KEY = os.environ.get("SUPABASE_SERVICE_KEY", "")
+SUPABASE_JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET", "")
+SUPABASE_ANON_KEY = os.environ.get("SUPABASE_ANON_KEY", "")
+
+# Tokens verified against Supabase Auth, kept this long at most (revocations show up within it)
+REMOTE_VERIFY_TTL_SECONDS = 300
+REMOTE_VERIFY_CACHE_SIZE = 4096
+
+SERVICE_ROLE = "service_role"
+
+
+class AuthError(Exception):
+    """The access token is missing, malformed, expired or not signed by this Supabase project."""
+
+
+def is_production() -> bool:
+    return os.environ.get("ALGET_ENV", "").lower() == "production" or bool(os.environ.get("RENDER"))
+
+
+def require_supabase_config():
+    """Raises in production when mastery would silently fall back to SQLite or tokens go unverified."""
+    if not is_production():
+        return
+    missing = [name for name, value in (("SUPABASE_URL", SUPABASE_URL), ("SUPABASE_SERVICE_KEY", SUPABASE_SERVICE_KEY))
+               if not value]
+    if missing:
+        raise RuntimeError(f"{', '.join(missing)} must be set in production: without them mastery falls back "
+                           f"to a local SQLite file on an ephemeral disk and access tokens cannot be verified.")
+
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def decode_jwt(token: str, secret: str = None) -> Dict:
+    """Claims of a compact JWS; with secret, the HS256 signature and expiry are checked first."""
+    try:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        header = json.loads(_b64decode(header_b64))
+        claims = json.loads(_b64decode(payload_b64))
+        signature = _b64decode(signature_b64)
+    except ValueError:
+        raise AuthError("Malformed access token.")
+    if secret:
+        if header.get("alg") != "HS256":
+            raise AuthError(f"Unsupported access token algorithm {header.get('alg')!r}.")
+        expected = hmac.new(secret.encode("utf-8"), f"{header_b64}.{payload_b64}".encode("ascii"),
+                            hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, signature):
+            raise AuthError("Invalid access token signature.")
+    if claims.get("exp") is not None and claims["exp"] < time.time():
+        raise AuthError("Access token expired.")
+    return claims
+
+
+class TokenVerifier:
+    def __init__(self, url: str = SUPABASE_URL, service_key: str = SUPABASE_SERVICE_KEY,
+                 jwt_secret: str = SUPABASE_JWT_SECRET, anon_key: str = SUPABASE_ANON_KEY):
+        self.url = url.rstrip("/")
+        self.service_key = service_key
+        self.jwt_secret = jwt_secret
+        self.api_key = anon_key or service_key
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()  # token -> (claims, cached until)
+        self._lock = threading.Lock()
+        self._warned = False
+
+    def verify(self, token: str) -> Dict:
+        """
+        Verified claims: "sub" (the user id) and "role" ("authenticated", or
+        "service_role" for the service key). Raises AuthError.
+        """
+        if self.service_key and hmac.compare_digest(token, self.service_key):
+            return {"role": SERVICE_ROLE}
+        if self.jwt_secret:
+            claims = decode_jwt(token, self.jwt_secret)
+        elif self.url and self.api_key:
+            claims = self._verify_remote(token)
+        else:
+            if not self._warned:
+                print("[Auth] WARNING: no SUPABASE_JWT_SECRET or SUPABASE_URL; trusting unverified access tokens.")
+                self._warned = True
+            # Anyone can forge an unverified token, so it never carries the service role
+            claims = {**decode_jwt(token), "role": "authenticated"}
+        if claims.get("role") != SERVICE_ROLE and not claims.get("sub"):
+            raise AuthError("Access token has no subject.")
+        return claims
+
+    def _verify_remote(self, token: str) -> Dict:
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(token)
+            if cached is not None and cached[1] > now:
+                self._cache.move_to_end(token)
+                return cached[0]
+        # Expiry and shape are checked locally first, so junk never costs a round trip
+        unverified = decode_jwt(token)
+        request = urllib.request.Request(f"{self.url}/auth/v1/user",
+                                         headers={"apikey": self.api_key, "Authorization": f"Bearer {token}"})
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                user = json.loads(response.read())
+        except urllib.error.HTTPError:
+            raise AuthError("Access token rejected by Supabase Auth.")
+        if user.get("id") != unverified.get("sub"):
+            raise AuthError("Access token subject mismatch.")
+        claims = {**unverified, "sub": user["id"], "role": unverified.get("role", "authenticated")}
+        expires = min(unverified.get("exp", now), now + REMOTE_VERIFY_TTL_SECONDS)
+        with self._lock:
+            self._cache[token] = (claims, expires)
+            while len(self._cache) > REMOTE_VERIFY_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return claims
+
+
+def can_read_users(claims: Dict, user_ids: List[str]) -> bool:
+    """A signed-in user may read only their own rows; the service role may read anyone's."""
+    return claims.get("role") == SERVICE_ROLE or all(u == claims.get("sub") for u in user_ids)
+
+
+token_verifier = TokenVerifier()
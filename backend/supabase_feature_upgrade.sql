@@ -70,5 +70,12 @@ DROP POLICY IF EXISTS "Users can manage own chat history" ON chat_history;
 CREATE POLICY "Users can manage own chat history" ON chat_history
     FOR ALL USING (auth.uid() = user_id);
 
+-- 4. MASTERY TELEMETRY OFFSETS (텔레메트리 보정)
+-- ============================================================================
+-- p_guess/p_slip/p_transit follow the concept's fitted parameters (bkt_params.json);
+-- only the per-user telemetry adjustments are stored.
+ALTER TABLE mastery ADD COLUMN IF NOT EXISTS p_slip_offset FLOAT DEFAULT 0.0;
+ALTER TABLE mastery ADD COLUMN IF NOT EXISTS p_transit_offset FLOAT DEFAULT 0.0;
+
 -- Success message
 SELECT 'All tables created successfully!' as status;
@@ -178,6 +178,8 @@ CREATE TABLE IF NOT EXISTS mastery (
     p_guess FLOAT DEFAULT 0.2,        -- BKT: Probability of correct answer without knowing
     p_slip FLOAT DEFAULT 0.1,         -- BKT: Probability of mistake despite knowing
     p_transit FLOAT DEFAULT 0.1,      -- BKT: Probability of learning after attempt
+    p_slip_offset FLOAT DEFAULT 0.0,     -- Telemetry adjustment on top of the concept's fitted p_slip
+    p_transit_offset FLOAT DEFAULT 0.0,  -- Telemetry adjustment on top of the concept's fitted p_transit
     attempts_count INT DEFAULT 0,
     correct_count INT DEFAULT 0,
     last_practiced_at TIMESTAMPTZ,
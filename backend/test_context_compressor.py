@@ -0,0 +1,70 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from context_compressor import ContextCompressor, estimate_tokens, split_passages
+
+CHAPTER = """# Friction
+
+<Callout>
+Dry friction opposes sliding between two surfaces in contact.
+</Callout>
+
+The friction force never exceeds the static coefficient times the normal force.
+
+# Trusses
+
+A truss is built from two-force members joined at pins.
+
+The method of joints balances the forces at each pin in turn.
+
+---
+
+# Beams
+
+Shear and moment diagrams show the internal forces along a beam.
+"""
+
+FILLER = "Historical notes on the engineers who first tabulated these values. " * 8
+
+
+def _text_tokens(context: str) -> int:
+    """Tokens of the emitted passages and headings, leaving out the per-document source labels."""
+    return sum(estimate_tokens(part) for part in context.split("\n\n") if not part.startswith("Excerpt from "))
+
+
+def test_split_passages_tracks_headings_and_drops_markup():
+    passages = split_passages(CHAPTER)
+    assert [p["heading"] for p in passages] == ["Friction", "Friction", "Trusses", "Trusses", "Beams"]
+    assert passages[0]["text"] == "Dry friction opposes sliding between two surfaces in contact."
+    assert all("<" not in p["text"] and p["text"] != "---" for p in passages)
+
+
+def test_small_documents_pass_through_in_reading_order():
+    context = ContextCompressor(token_budget=1000).compress("friction", [{"content": CHAPTER, "source": "ch1"}])
+    assert context.startswith("Excerpt from ch1:\n\n## Friction")
+    assert context.index("method of joints") < context.index("moment diagrams")
+
+
+def test_compression_keeps_relevant_passages_within_budget():
+    documents = [{"content": FILLER + "\n\n" + CHAPTER, "source": "ch1"},
+                 {"content": FILLER, "metadata": {"filename": "history.mdx"}}]
+    compressor = ContextCompressor(token_budget=60, lexical_weight=1.0)
+    context = compressor.compress("How does the method of joints solve a truss?", documents)
+    assert "method of joints" in context
+    assert "Historical notes" not in context
+    assert _text_tokens(context) <= 60
+    # A per-call budget overrides the default
+    assert _text_tokens(compressor.compress("friction force", documents, token_budget=25)) <= 25
+
+
+def test_oversized_best_passage_is_truncated_at_a_word_boundary():
+    long_passage = "Friction " + "depends on the normal force and the coefficient of friction. " * 20
+    context = ContextCompressor(token_budget=20).compress("friction", [{"content": long_passage, "source": "ch1"}])
+    body = context.split("\n\n", 1)[1]
+    assert 0 < estimate_tokens(body) <= 20
+    assert long_passage.startswith(body) and long_passage[len(body)] == " "
+
+
+def test_no_content_gives_empty_context():
+    assert ContextCompressor().compress("friction", [{"content": ""}, {"content": "<div></div>"}]) == ""
@@ -0,0 +1,121 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from knowledge_tracing import BatchKnowledgeTracing, BayesianKnowledgeTracing, decayed_p_known
+
+
+def _attempts(n: int = 400, seed: int = 0):
+    """Interleaved attempts by several students on several concepts, with per-update parameters."""
+    rng = np.random.default_rng(seed)
+    return {
+        "students": [f"s{i}" for i in rng.integers(0, 7, n)],
+        "concepts": [f"c{i}" for i in rng.integers(0, 4, n)],
+        "correct": (rng.random(n) < 0.6).tolist(),
+        "guess": rng.uniform(0.05, 0.3, n).tolist(),
+        "slip": rng.uniform(0.05, 0.2, n).tolist(),
+        "transit": rng.uniform(0.02, 0.3, n).tolist(),
+        "weight": rng.choice([1.0, 0.5, 0.25], n).tolist(),
+    }
+
+
+def test_batch_replay_matches_scalar_updates():
+    a = _attempts()
+    batch = BatchKnowledgeTracing(concept_params={})
+    states = batch.replay(a["students"], a["concepts"], a["correct"], p_guess=a["guess"], p_slip=a["slip"],
+                          p_transit=a["transit"], weights=a["weight"], current_states={("s0", "c0"): 0.6})
+
+    scalar = BayesianKnowledgeTracing(concept_params={})
+    expected = {("s0", "c0"): 0.6}
+    for i in range(len(a["correct"])):
+        key = (a["students"][i], a["concepts"][i])
+        prior = expected.get(key, scalar.p_init_default)
+        updated = scalar.update_p_known(prior, a["correct"][i], a["guess"][i], a["slip"][i], a["transit"][i])
+        expected[key] = prior + a["weight"][i] * (updated - prior)
+
+    assert states.keys() == expected.keys()
+    for key, p_known in expected.items():
+        assert np.isclose(states[key], p_known, rtol=0, atol=1e-12)
+
+
+def test_batch_replay_uses_fitted_concept_parameters():
+    fitted = {"c1": {"p_init": 0.3, "p_guess": 0.25, "p_slip": 0.05, "p_transit": 0.2}}
+    batch = BatchKnowledgeTracing(concept_params=fitted)
+    scalar = BayesianKnowledgeTracing(concept_params=fitted)
+    answers = [True, False, True, True]
+    states = batch.replay(["s"] * 4, ["c1"] * 4, answers)
+    p_init, guess, slip, transit = scalar.params_for("c1")
+    p_known = p_init
+    for is_correct in answers:
+        p_known = scalar.update_p_known(p_known, is_correct, guess, slip, transit)
+    assert np.isclose(states[("s", "c1")], p_known)
+
+
+def test_batch_telemetry_matches_scalar_fusion():
+    rng = np.random.default_rng(1)
+    n = 300
+    types = ["hint_request", "chat_engagement", "simulation_play", "affect_confused", "affect_insight",
+             "affect_disengaged", "not_a_rule"]
+    students = [f"s{i}" for i in rng.integers(0, 5, n)]
+    concepts = [f"c{i}" for i in rng.integers(0, 3, n)]
+    interaction_types = [str(t) for t in rng.choice(types, n)]
+    intensities = rng.uniform(0.2, 2.0, n).tolist()
+    batch = BatchKnowledgeTracing(concept_params={"c2": {"p_slip": 0.2, "p_transit": 0.3}})
+    priors, trajectory = batch.replay_telemetry(students, concepts, interaction_types, intensities,
+                                                current_priors={("s0", "c0"): (0.3, 0.05)}, trajectory=True)
+
+    scalar = BayesianKnowledgeTracing(concept_params={"c2": {"p_slip": 0.2, "p_transit": 0.3}})
+    expected = {("s0", "c0"): (0.3, 0.05)}
+    for i in range(n):
+        key = (students[i], concepts[i])
+        slip, transit = expected.get(key, scalar.params_for(concepts[i])[2:])
+        expected[key] = scalar.apply_telemetry_fusion(slip, transit, interaction_types[i], intensities[i])
+        assert np.allclose(trajectory[i], expected[key])
+
+    assert priors.keys() == expected.keys()
+    for key, value in expected.items():
+        assert np.allclose(priors[key], value)
+
+
+def test_decayed_p_known_halves_the_distance_to_the_floor_per_half_life():
+    p = decayed_p_known([0.9, 0.9, 0.9, 0.05, 0.9, 0.9, 0.9], [0.0, 10.0, 20.0, 10.0, np.nan, 10.0, -5.0], 0.1,
+                        [10.0, 10.0, 10.0, 10.0, 10.0, 0.0, 10.0])
+    assert np.allclose(p, [0.9, 0.5, 0.3, 0.05, 0.9, 0.9, 0.9])
+    # Monotone in elapsed time, and never below the floor
+    later = decayed_p_known(0.8, np.linspace(0, 365, 50), 0.2, 14.0)
+    assert np.all(np.diff(later) < 0) and np.all(later > 0.2)
+
+
+def test_closed_form_forecast_matches_simulated_learning():
+    engine = BayesianKnowledgeTracing(concept_params={})
+    p_known = np.array([[0.1, 0.3, 0.5], [0.7, 0.85, 0.2]])
+    p_transit = np.array([[0.1, 0.2, 0.3], [0.1, 0.3, 0.05]])
+    closed = engine.forecast_attempts_to_mastery(p_known, p_transit)
+    assert closed.shape == p_known.shape
+    assert closed[1, 1] == 0.0  # already mastered
+
+    # Latent-state Monte Carlo of what the closed form counts: attempts until P(learned) >= threshold
+    rng = np.random.default_rng(0)
+    learned = rng.random((20_000,) + p_known.shape) < p_known
+    first_crossing = np.where(learned.mean(axis=0) >= 0.8, 0, -1)
+    for n in range(1, 200):
+        learned |= rng.random(learned.shape) < p_transit
+        first_crossing = np.where((first_crossing < 0) & (learned.mean(axis=0) >= 0.8), n, first_crossing)
+    assert np.all(np.abs(first_crossing - closed) <= 1)
+
+    # The traced-estimate simulation counts something slightly different, but ranks students the same way
+    simulated = engine.forecast_attempts_to_mastery(p_known, p_transit, method="simulation", n_sims=2000, seed=7)
+    assert simulated.shape == p_known.shape
+    assert simulated[1, 1] == 0.0
+    assert np.array_equal(np.argsort(simulated, axis=None), np.argsort(closed, axis=None))
+    assert np.array_equal(simulated, engine.forecast_attempts_to_mastery(p_known, p_transit, method="simulation",
+                                                                         n_sims=2000, seed=7))
+
+
+def test_forecast_without_learning_never_reaches_mastery():
+    engine = BayesianKnowledgeTracing(concept_params={})
+    assert np.isinf(engine.forecast_attempts_to_mastery([0.3], [0.0])[0])
+    assert engine.forecast_attempts_to_mastery([0.3], [0.0], method="simulation", n_sims=50, max_attempts=40,
+                                               seed=1)[0] <= 40
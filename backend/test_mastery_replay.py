@@ -0,0 +1,78 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from knowledge_tracing import BayesianKnowledgeTracing
+from mastery_replay import MasteryReplay, attempt_events, merge_events, telemetry_events
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+Q_MATRICES = {"p1": {"statics": 1.0}, "p2": {"statics": 0.5, "friction": 1.0}}
+
+
+def _history(seed: int = 0):
+    """Attempts and telemetry rows for three users, each export sorted by (user_id, timestamp)."""
+    rng = np.random.default_rng(seed)
+    attempts, events = [], []
+    for user_id in ("u1", "u2", "u3"):
+        ts = START
+        for i in range(12):
+            ts += timedelta(hours=float(rng.uniform(1, 72)))
+            attempts.append({"id": len(attempts), "user_id": user_id, "problem_id": str(rng.choice(["p1", "p2"])),
+                             "is_correct": bool(rng.random() < 0.6), "created_at": ts.isoformat()})
+            if i % 3 == 0:
+                events.append({"id": len(events), "user_id": user_id, "event_type": "telemetry_fusion",
+                               "event_data": {"concept_id": "friction", "interaction_type": "hint_request"},
+                               "client_ts": (ts - timedelta(minutes=5)).isoformat()})
+    return attempts, events
+
+
+def _expected(attempts, events):
+    """The same history applied one event at a time through the scalar engine."""
+    engine = BayesianKnowledgeTracing(concept_params={})
+    timeline = sorted([(e["user_id"], e["client_ts"], 0, e) for e in events]
+                      + [(a["user_id"], a["created_at"], 1, a) for a in attempts], key=lambda item: item[:3])
+    state = {}  # (user_id, concept_id) -> [p_known, slip, transit, last practiced]
+    for user_id, ts, kind, row in timeline:
+        ts = datetime.fromisoformat(ts)
+        if kind == 0:
+            s = state.setdefault((user_id, row["event_data"]["concept_id"]), [0.1, 0.1, 0.1, None])
+            s[1], s[2] = engine.apply_telemetry_fusion(s[1], s[2], row["event_data"]["interaction_type"])
+            continue
+        for concept_id, weight in Q_MATRICES[row["problem_id"]].items():
+            s = state.setdefault((user_id, concept_id), [0.1, 0.1, 0.1, None])
+            prior = s[0]
+            if s[3] is not None:
+                elapsed_days = (ts - s[3]).total_seconds() / 86400
+                prior = 0.1 + (prior - 0.1) * 2.0 ** (-elapsed_days / engine.half_life_days_default)
+            updated = engine.update_p_known(prior, row["is_correct"], 0.2, s[1], s[2])
+            s[0], s[3] = prior + weight * (updated - prior), ts
+    return state
+
+
+def _replay(attempts, events, chunk_updates):
+    replay = MasteryReplay(Q_MATRICES, chunk_updates=chunk_updates, engine=BayesianKnowledgeTracing(concept_params={}))
+    stream = merge_events(attempt_events(attempts), telemetry_events(events))
+    return {(row["user_id"], row["concept_id"]): row for rows in replay.run(stream) for row in rows}
+
+
+def test_replay_matches_sequential_updates():
+    attempts, events = _history()
+    expected = _expected(attempts, events)
+    for chunk_updates in (1, 10, 200_000):
+        rows = _replay(attempts, events, chunk_updates)
+        assert rows.keys() == expected.keys()
+        for key, (p_known, slip, transit, _) in expected.items():
+            assert np.isclose(rows[key]["p_known"], p_known)
+            assert np.isclose(rows[key]["p_slip"], slip)
+            assert np.isclose(rows[key]["p_transit"], transit)
+
+
+def test_unsorted_attempts_are_rejected():
+    attempts, _ = _history()
+    attempts[0], attempts[1] = attempts[1], attempts[0]
+    with pytest.raises(ValueError, match="not sorted"):
+        list(attempt_events(attempts))
@@ -0,0 +1,123 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from knowledge_tracing import BayesianKnowledgeTracing
+from mastery_store import MasteryStore, effective_mastery
+
+
+class FlakyBackend:
+    """In-memory mastery table whose next `failures` writes raise; on_write runs inside each write."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.rows = {}
+        self.writes = []
+        self.on_write = None
+
+    def load(self, user_id):
+        return [dict(row) for (u, _), row in self.rows.items() if u == user_id]
+
+    def write(self, rows):
+        if self.on_write is not None:
+            self.on_write()
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("backend unavailable")
+        self.writes.append(len(rows))
+        for row in rows:
+            self.rows[(row["user_id"], row["concept_id"])] = dict(row)
+
+
+def _store(backend, **kwargs) -> MasteryStore:
+    return MasteryStore(backend, BayesianKnowledgeTracing(concept_params={}), **kwargs)
+
+
+def test_failed_flush_requeues_rows():
+    backend = FlakyBackend(failures=1)
+    store = _store(backend)
+    store.apply_attempt("u1", {"statics": 1.0, "friction": 0.5}, True)
+    assert store.flush() == 0
+    assert store.status()["pending_writes"] == 2
+    assert store.stats["flush_errors"] == 1
+
+    assert store.flush() == 2
+    assert store.status()["pending_writes"] == 0
+    assert backend.rows[("u1", "statics")]["p_known"] == store.get("u1")["statics"]["p_known"]
+
+
+def test_retry_writes_updates_made_during_a_failed_flush():
+    backend = FlakyBackend(failures=1)
+    store = _store(backend)
+    store.apply_attempt("u1", {"statics": 1.0}, True)
+    # Another request lands while the (failing) write is in flight
+    backend.on_write = lambda: store.apply_attempt("u1", {"statics": 1.0}, True)
+    store.flush()
+    backend.on_write = None
+
+    assert store.flush() == 1
+    row = backend.rows[("u1", "statics")]
+    assert row["attempts_count"] == 2
+    assert row["p_known"] == store.get("u1")["statics"]["p_known"]
+
+
+def test_users_with_pending_writes_are_not_evicted():
+    backend = FlakyBackend(failures=1)
+    store = _store(backend, max_users=1)
+    store.apply_attempt("u1", {"statics": 1.0}, True)
+    store.flush()
+    store.get("u2")
+    store.get("u3")
+    assert store.status()["pending_writes"] == 1
+    assert store.flush() == 1
+    assert backend.rows[("u1", "statics")]["attempts_count"] == 1
+
+
+def test_refit_parameters_reach_existing_rows_and_keep_telemetry_offsets():
+    backend = FlakyBackend()
+    # A row written with the schema defaults before any fit
+    backend.rows[("u1", "statics")] = {"user_id": "u1", "concept_id": "statics", "p_known": 0.3, "p_guess": 0.2,
+                                       "p_slip": 0.1, "p_transit": 0.1, "attempts_count": 1, "correct_count": 1}
+    fitted = {}
+    store = MasteryStore(backend, BayesianKnowledgeTracing(concept_params=fitted))
+    store.apply_telemetry("u1", "statics", "hint_request")  # slip +0.05, transit +0.02
+
+    fitted["statics"] = {"p_init": 0.1, "p_guess": 0.3, "p_slip": 0.2, "p_transit": 0.25}
+    row = store.get("u1")["statics"]
+    assert row["p_guess"] == 0.3
+    assert abs(row["p_slip"] - 0.25) < 1e-9
+    assert abs(row["p_transit"] - 0.27) < 1e-9
+
+    store.apply_attempt("u1", {"statics": 1.0}, True)
+    store.flush()
+    stored = backend.rows[("u1", "statics")]
+    assert abs(stored["p_slip_offset"] - 0.05) < 1e-9
+    assert abs(stored["p_transit_offset"] - 0.02) < 1e-9
+
+
+def test_effective_mastery_uses_each_concepts_floor_and_half_life():
+    now = datetime(2026, 3, 1, tzinfo=timezone.utc)
+    engine = BayesianKnowledgeTracing(concept_params={"fast": {"p_init": 0.2, "half_life_days": 5.0}})
+    rows = [
+        {"concept_id": "fast", "p_known": 0.8, "last_practiced_at": (now - timedelta(days=5)).isoformat()},
+        {"concept_id": "slow", "p_known": 0.8,
+         "last_practiced_at": (now - timedelta(days=engine.half_life_days_default)).isoformat()},
+        {"concept_id": "slow", "p_known": 0.8, "last_practiced_at": None},
+    ]
+    assert np.allclose(effective_mastery(rows, engine, now), [0.5, 0.45, 0.8])
+
+
+def test_get_reports_decayed_mastery_without_rewriting_rows():
+    backend = FlakyBackend()
+    practiced = datetime.now(timezone.utc) - timedelta(days=30)
+    backend.rows[("u1", "statics")] = {"user_id": "u1", "concept_id": "statics", "p_known": 0.9,
+                                       "attempts_count": 3, "correct_count": 3,
+                                       "last_practiced_at": practiced.isoformat()}
+    store = _store(backend)
+    row = store.get("u1")["statics"]
+    assert row["p_known"] == 0.9
+    assert 0.1 < row["effective_p_known"] < 0.9
+    assert store.status()["pending_writes"] == 0
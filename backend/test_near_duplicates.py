@@ -0,0 +1,63 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from near_duplicates import MinHashIndex, shingles
+
+WORDS = [f"w{i}" for i in range(200)]
+BASE = " ".join(WORDS)
+
+
+def _edited(n_changed: int) -> str:
+    """BASE with the last n_changed words replaced."""
+    return " ".join(WORDS[:len(WORDS) - n_changed] + [f"x{i}" for i in range(n_changed)])
+
+
+def _jaccard(a: str, b: str) -> float:
+    sa, sb = shingles(a), shingles(b)
+    return len(sa & sb) / len(sa | sb)
+
+
+def test_signature_similarity_estimates_jaccard():
+    index = MinHashIndex(num_perm=256, bands=32)
+    base = index.signature(BASE)
+    for n_changed in (0, 10, 40, 100, 200):
+        other = _edited(n_changed)
+        assert abs(index.similarity(base, index.signature(other)) - _jaccard(BASE, other)) < 0.1
+    # Signatures depend only on the shingles, not on case or punctuation
+    assert np.array_equal(base, index.signature(BASE.upper().replace(" ", ", ")))
+
+
+def test_query_returns_the_best_match_above_the_threshold():
+    index = MinHashIndex(threshold=0.8)
+    index.add("chapter", index.signature(BASE))
+    index.add("unrelated", index.signature(" ".join(f"y{i}" for i in range(200))))
+
+    key, score = index.query(index.signature(_edited(5)))
+    assert key == "chapter" and score >= 0.8
+    assert index.query(index.signature(_edited(100))) is None
+    assert index.query(index.signature(BASE), exclude="chapter") is None
+
+
+def test_namespaces_are_isolated_and_remove_drops_buckets():
+    index = MinHashIndex()
+    signature = index.signature(BASE)
+    index.add("statics", signature, namespace="statics")
+    assert index.query(signature, namespace="bio-inspired") is None
+    assert index.query(signature, namespace="statics")[0] == "statics"
+
+    # Re-adding a key moves it rather than duplicating it
+    index.add("statics", signature, namespace="bio-inspired")
+    assert len(index) == 1
+    assert index.query(signature, namespace="statics") is None
+    index.remove("statics")
+    index.remove("missing")
+    assert len(index) == 0 and index._buckets == {}
+
+
+def test_bands_must_divide_the_signature():
+    with pytest.raises(ValueError):
+        MinHashIndex(num_perm=100, bands=16)
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from pfa import CSRMatrix
+
+
+def _random_csr(seed: int = 0, shape=(60, 12), nnz: int = 200):
+    """A CSR matrix with empty rows, uneven row lengths and repeated (row, column) entries, plus its dense twin."""
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, shape[0] - 5, nnz)  # the last rows stay empty
+    cols = rng.integers(0, shape[1], nnz)
+    values = rng.normal(size=nnz)
+    dense = np.zeros(shape)
+    np.add.at(dense, (rows, cols), values)
+    return CSRMatrix.from_coo(rows, cols, values, shape), dense
+
+
+def test_dot_matches_dense():
+    matrix, dense = _random_csr()
+    rng = np.random.default_rng(1)
+    vector = rng.normal(size=dense.shape[1])
+    weights = rng.normal(size=(dense.shape[1], 7))
+    assert np.allclose(matrix.dot(vector), dense @ vector)
+    assert np.allclose(matrix.dot(weights), dense @ weights)
+    # Row blocks smaller than the matrix, including a remainder block
+    assert np.allclose(matrix.dot(weights, block_cells=50), dense @ weights)
+    assert np.allclose(matrix.dot(weights, block_cells=1), dense @ weights)
+
+
+def test_rdot_matches_dense_transpose():
+    matrix, dense = _random_csr(seed=2)
+    vector = np.random.default_rng(3).normal(size=dense.shape[0])
+    assert np.allclose(matrix.rdot(vector), dense.T @ vector)
+
+
+def test_gram_matches_dense():
+    matrix, dense = _random_csr(seed=4)
+    row_weights = np.random.default_rng(5).uniform(0.1, 1.0, dense.shape[0])
+    gram = matrix.gram(row_weights)
+    assert np.allclose(gram, dense.T @ (row_weights[:, None] * dense))
+    assert np.allclose(gram, gram.T)
@@ -0,0 +1,248 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from rag_service import RAGService, resolve_index_dir
+
+TRUSSES = "Trusses carry loads through axial members joined at pins; the method of joints solves each pin in turn. " * 3
+SECTIONS = {
+    "statics/01/01.mdx": ("statics", ["trusses"], TRUSSES),
+    "statics/01/02.mdx": ("statics", ["friction"],
+                          "Dry friction opposes sliding; the friction force is at most the coefficient times the normal force."),
+    "statics/02/01.mdx": ("statics", ["beams"],
+                          "Beams resist bending; shear and moment diagrams show internal forces along the span."),
+    "bio-inspired/01/01.mdx": ("bio-inspired", ["porosity"],
+                               "Bone is porous; trabecular struts align with load paths like the members of a truss."),
+}
+
+
+def _service() -> RAGService:
+    return RAGService(embedding_provider="local", index_dir="")
+
+
+def _indexed(sections=SECTIONS) -> RAGService:
+    service = _service()
+    for doc_id, (course, concept_ids, content) in sections.items():
+        chapter = doc_id.split("/")[1]
+        service.upsert_document(doc_id, content, {"course": course, "chapter": chapter, "concept_ids": concept_ids})
+    return service
+
+
+def test_repeated_queries_reuse_results_until_the_index_changes():
+    service = _indexed()
+    embed_calls = []
+    embed_one = service.embedder.embed_one
+    service.embedder.embed_one = lambda text: embed_calls.append(text) or embed_one(text)
+
+    first = service.retrieve_context("How does dry friction oppose sliding?", top_k=2)
+    again = service.retrieve_context("  how does DRY friction oppose sliding ", top_k=2)
+    assert [d["doc_id"] for d in again] == [d["doc_id"] for d in first]
+    assert service.cache_stats["result_hits"] == 1
+    assert len(embed_calls) == 1
+
+    # A write publishes a new snapshot version, so the cached top-k no longer applies
+    service.upsert_document("statics/01/03.mdx", "Wedges use dry friction to lift heavy loads by sliding.",
+                            {"course": "statics", "chapter": "01"})
+    embed_calls.clear()
+    refreshed = service.retrieve_context("How does dry friction oppose sliding?", top_k=2)
+    assert service.cache_stats["result_hits"] == 1
+    assert service.cache_stats["result_misses"] == 2
+    assert "statics/01/03.mdx" in [d["doc_id"] for d in refreshed]
+    assert embed_calls == []  # the query embedding itself is still cached
+
+
+def test_duplicate_links_survive_load_index():
+    service = _service()
+    service.upsert_document("statics/01/01.mdx", TRUSSES, {"course": "statics"})
+    assert service.upsert_document("statics/01/02.mdx", TRUSSES + " Review.", {"course": "statics"}) == "duplicate"
+    index_dir = tempfile.mkdtemp()
+    service.save_index(index_dir)
+
+    loaded = _service()
+    assert loaded.load_index(index_dir)
+    assert loaded.dedup_report()["collapsed"] == {"statics/01/02.mdx": "statics/01/01.mdx"}
+    assert len(loaded.lexical_corpus) == 2
+    # A re-sync of the unchanged duplicate costs nothing
+    assert loaded.upsert_document("statics/01/02.mdx", TRUSSES + " Review.", {"course": "statics"}) == "unchanged"
+
+
+def _write_content(content_dir, sections=SECTIONS):
+    for doc_id, (_, _, content) in sections.items():
+        path = os.path.join(content_dir, *doc_id.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+
+def test_upsert_embeds_only_new_or_changed_content():
+    service = _service()
+    embedded = []
+    embed_one = service.embedder.embed_one
+    service.embedder.embed_one = lambda text: embedded.append(text) or embed_one(text)
+    content = SECTIONS["statics/01/02.mdx"][2]
+    assert service.upsert_document("friction", content) == "added"
+    assert service.upsert_document("friction", content) == "unchanged"
+    assert service.upsert_document("friction", content + " Static friction exceeds kinetic.") == "updated"
+    assert len(embedded) == 2
+    assert len(service.knowledge_base) == 1
+
+
+def test_sync_directory_reindexes_by_content_hash():
+    content_dir = os.path.join(tempfile.mkdtemp(), "content")
+    _write_content(content_dir)
+    service = _service()
+    assert service.sync_directory(content_dir)["added"] == len(SECTIONS)
+    summary = service.sync_directory(content_dir)
+    assert summary["unchanged"] == len(SECTIONS) and summary["added"] == summary["updated"] == 0
+
+    with open(os.path.join(content_dir, "statics", "02", "01.mdx"), "a", encoding="utf-8") as f:
+        f.write("\nA cantilever carries its largest moment at the wall.")
+    os.remove(os.path.join(content_dir, "bio-inspired", "01", "01.mdx"))
+    summary = service.sync_directory(content_dir)
+    assert (summary["updated"], summary["deleted"], summary["unchanged"]) == (1, 1, len(SECTIONS) - 2)
+    assert sorted(doc["doc_id"] for doc in service.knowledge_base) == [
+        "content/statics/01/01.mdx", "content/statics/01/02.mdx", "content/statics/02/01.mdx"]
+
+
+def _versions(index_dir):
+    return sorted(entry for entry in os.listdir(index_dir) if entry.startswith("v"))
+
+
+def test_load_index_follows_current_and_prunes_old_versions():
+    service = _indexed()
+    index_dir = tempfile.mkdtemp()
+    assert not _service().load_index(index_dir)  # nothing saved yet
+
+    service.save_index(index_dir)
+    first = resolve_index_dir(index_dir)
+    os.utime(os.path.join(first, "manifest.json"), (0, 0))
+    service.upsert_document("statics/01/03.mdx", "Wedges use dry friction to lift heavy loads.", {"course": "statics"})
+    service.save_index(index_dir)
+    second = resolve_index_dir(index_dir)
+    os.utime(os.path.join(second, "manifest.json"), (1, 1))
+    assert _versions(index_dir) == sorted(os.path.basename(p) for p in (first, second))
+
+    service.upsert_document("statics/01/04.mdx", "Belts wrap around drums; tension grows with the wrap angle.",
+                            {"course": "statics"})
+    service.save_index(index_dir)
+    # The replaced version stays for workers still reading it; the one before that is pruned
+    assert os.path.basename(first) not in _versions(index_dir)
+    assert len(_versions(index_dir)) == 2
+
+    loaded = _service()
+    assert loaded.load_index(index_dir)
+    assert len(loaded.knowledge_base) == len(SECTIONS) + 2
+    assert loaded._snapshot.vector_index.matrix.shape[0] == len(SECTIONS) + 2
+
+
+def test_load_index_rejects_incompatible_snapshots():
+    index_dir = tempfile.mkdtemp()
+    _indexed().save_index(index_dir)
+    version_dir = resolve_index_dir(index_dir)
+    manifest_path = os.path.join(version_dir, "manifest.json")
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    for change in ({"format": 1}, {"embedding_model": "another-model"}):
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump({**manifest, **change}, f)
+        assert not _service().load_index(index_dir)
+
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    with open(os.path.join(version_dir, "documents.jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps({"doc_id": "extra", "content_hash": "", "metadata": {}, "content": "extra"}) + "\n")
+    assert not _service().load_index(index_dir)
+
+
+def test_load_index_reads_the_flat_layout():
+    index_dir = tempfile.mkdtemp()
+    _indexed().save_index(index_dir)
+    flat_dir = tempfile.mkdtemp()
+    version_dir = resolve_index_dir(index_dir)
+    for name in os.listdir(version_dir):
+        shutil.copy(os.path.join(version_dir, name), flat_dir)
+    loaded = _service()
+    assert loaded.load_index(flat_dir)
+    assert sorted(doc["doc_id"] for doc in loaded.knowledge_base) == sorted(SECTIONS)
+
+
+def test_filters_restrict_vector_search_to_matching_namespaces():
+    service = _indexed()
+    query = "Which members carry loads like a truss?"
+    assert "bio-inspired/01/01.mdx" in [d["doc_id"] for d in service.retrieve_context(query, top_k=4)]
+    statics = service.retrieve_context(query, top_k=4, filters={"course": "statics"})
+    assert statics and all(d["metadata"]["course"] == "statics" for d in statics)
+    beams = service.retrieve_context(query, top_k=4, filters={"course": "statics", "concept_id": "beams"})
+    assert [d["doc_id"] for d in beams] == ["statics/02/01.mdx"]
+    assert service.retrieve_context(query, filters={"course": "bio-inspired", "concept_id": "beams"}) == []
+    # Empty filter values are ignored rather than matching nothing
+    assert len(service.retrieve_context(query, top_k=4, filters={"chapter": ""})) == 4
+
+
+def test_filters_apply_to_the_lexical_fallback(monkeypatch):
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    service = RAGService(embedding_provider="gemini", index_dir="")
+    assert service.embedder is None
+    for doc_id, (course, concept_ids, content) in SECTIONS.items():
+        assert service.upsert_document(doc_id, content, {"course": course, "concept_ids": concept_ids}) == "lexical"
+    results = service.retrieve_context("truss members carry loads", top_k=4, filters={"course": "bio-inspired"})
+    assert [d["doc_id"] for d in results] == ["bio-inspired/01/01.mdx"]
+
+
+def test_namespaces_follow_updated_metadata():
+    service = _indexed()
+    content = SECTIONS["statics/01/02.mdx"][2] + " Belt friction grows with the wrap angle."
+    service.upsert_document("statics/01/02.mdx", content, {"course": "dynamics", "concept_ids": ["belts"]})
+    query = "dry friction opposes sliding"
+    assert "statics/01/02.mdx" not in [d["doc_id"] for d in
+                                       service.retrieve_context(query, top_k=4, filters={"course": "statics"})]
+    assert [d["doc_id"] for d in service.retrieve_context(query, filters={"concept_id": "belts"})] == [
+        "statics/01/02.mdx"]
+    service.delete_document("statics/01/02.mdx")
+    assert service.retrieve_context(query, filters={"course": "dynamics"}) == []
+
+
+def test_snapshots_are_immutable_and_batches_publish_once():
+    service = _indexed()
+    before = service._snapshot
+    matrix = before.vector_index.matrix.copy()
+    new_docs = {"statics/03/01.mdx": "Centroids locate the resultant of a distributed load.",
+                "statics/03/02.mdx": "Moments of inertia measure how area resists bending."}
+
+    with service.batch_writes():
+        for doc_id, content in new_docs.items():
+            assert service.upsert_document(doc_id, content, {"course": "statics"}) == "added"
+        service.delete_document("bio-inspired/01/01.mdx")
+        # Readers keep the previous version until the batch ends
+        assert service._snapshot is before
+        assert "statics/03/01.mdx" not in [d["doc_id"] for d in service.retrieve_context("centroids", top_k=6)]
+
+    after = service._snapshot
+    assert after.version == before.version + 1
+    assert sorted(after.docs_by_id) == sorted(set(SECTIONS) - {"bio-inspired/01/01.mdx"} | set(new_docs))
+    # The snapshot grabbed before the writes still describes the old index
+    assert sorted(before.docs_by_id) == sorted(SECTIONS)
+    assert before.namespaces[("course", "bio-inspired")] == frozenset({"bio-inspired/01/01.mdx"})
+    assert np.array_equal(before.vector_index.matrix, matrix)
+    assert "statics/03/01.mdx" in [d["doc_id"] for d in service.retrieve_context("centroids", top_k=6)]
+
+
+def test_near_duplicates_collapse_and_are_promoted_when_the_canonical_goes():
+    service = _service()
+    service.upsert_document("statics/01/01.mdx", TRUSSES, {"course": "statics"})
+    assert service.upsert_document("custom/trusses.mdx", TRUSSES + " Review.", {"course": "statics"}) == "duplicate"
+    # Only the same course counts as a duplicate
+    assert service.upsert_document("bio-inspired/01/01.mdx", TRUSSES, {"course": "bio-inspired"}) == "added"
+    assert len(service.knowledge_base) == 2
+    assert [d["doc_id"] for d in service.retrieve_context("method of joints", top_k=3,
+                                                          filters={"course": "statics"})] == ["statics/01/01.mdx"]
+
+    service.delete_document("statics/01/01.mdx")
+    assert service.dedup_report()["collapsed"] == {}
+    assert sorted(doc["doc_id"] for doc in service.knowledge_base) == ["bio-inspired/01/01.mdx", "custom/trusses.mdx"]
@@ -0,0 +1,67 @@
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from knowledge_tracing import BayesianKnowledgeTracing
+from recommender import get_problem_index, state_arrays
+
+
+def _course(problems) -> str:
+    """A one-section course whose problems carry no concept tags of their own."""
+    content_dir = tempfile.mkdtemp()
+    section_dir = os.path.join(content_dir, "mechanics", "01")
+    os.makedirs(section_dir)
+    with open(os.path.join(section_dir, "01.meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"title": "Friction", "concept_ids": ["friction", "equilibrium"]}, f)
+    with open(os.path.join(section_dir, "01.practice.json"), "w", encoding="utf-8") as f:
+        json.dump({"problems": problems}, f)
+    return content_dir
+
+
+def _recommend(content_dir, **kwargs):
+    index = get_problem_index("mechanics", content_dir)
+    state = state_arrays(index.concepts, {}, BayesianKnowledgeTracing(concept_params={}))
+    return index.recommend(*state, section="01/01", **kwargs)
+
+
+def test_untagged_section_problems_are_ranked_not_tied():
+    content_dir = _course([
+        {"id": "mc_direction", "type": "multiple_choice", "stem": "Which way?", "options": ["a", "b", "c", "d"]},
+        {"id": "mc_true_false", "type": "multiple_choice", "stem": "Slips?", "options": ["yes", "no"]},
+        {"id": "numeric_force", "type": "numeric", "stem": "Find F."},
+        {"id": "stepwise_incline", "type": "step_based", "stem": "Solve.", "steps": [{}, {}, {}, {}]},
+    ])
+    recommendations = _recommend(content_dir, k=4, exclude=["mc_true_false"])
+    ranked = [r["problem_id"] for r in recommendations]
+    # The first unanswered problem in reading order is mc_direction; a guessable item tells us less
+    assert ranked[0] == "numeric_force"
+    assert ranked[0] != "mc_direction"
+    assert "mc_true_false" not in ranked
+    scores = [r["score"] for r in recommendations]
+    assert len(set(scores)) == len(scores)
+    assert recommendations[ranked.index("mc_direction")]["p_correct"] > recommendations[0]["p_correct"]
+
+
+def test_difficulty_label_changes_the_ranking():
+    content_dir = _course([
+        {"id": "easy_force", "type": "numeric", "stem": "Find F.", "difficulty": "easy"},
+        {"id": "hard_force", "type": "numeric", "stem": "Find F again.", "difficulty": "hard"},
+    ])
+    scores = {r["problem_id"]: r["score"] for r in _recommend(content_dir, k=2)}
+    assert not np.isclose(scores["easy_force"], scores["hard_force"])
+
+
+def test_schema_difficulty_labels_scale_slip():
+    content_dir = _course([
+        {"id": "medium_force", "type": "numeric", "stem": "Find F.", "difficulty": "medium"},
+        {"id": "challenging_force", "type": "numeric", "stem": "Find F again.", "difficulty": "Challenging"},
+        {"id": "hard_force", "type": "numeric", "stem": "Find F once more.", "difficulty": "hard"},
+    ])
+    scores = {r["problem_id"]: r["score"] for r in _recommend(content_dir, k=3)}
+    # 'challenging' is the schema's label for the hardest problems, not an unknown one
+    assert not np.isclose(scores["challenging_force"], scores["medium_force"])
+    assert np.isclose(scores["challenging_force"], scores["hard_force"])
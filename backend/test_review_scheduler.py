@@ -0,0 +1,93 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from knowledge_tracing import BayesianKnowledgeTracing, decayed_p_known
+from review_scheduler import ReviewScheduler, review_due_times
+
+NOW = datetime(2026, 3, 1, tzinfo=timezone.utc)
+HALF_LIFE = 10.0
+
+
+class RowStore:
+    """The slice of MasteryStore the scheduler uses; get() checks it is never called under the scheduler lock."""
+
+    def __init__(self, rows):
+        self.rows = rows  # user_id -> {concept_id: row}
+        self.engine = BayesianKnowledgeTracing(concept_params={}, half_life_days_default=HALF_LIFE)
+        self.scheduler = None
+        self.loads = 0
+
+    def get(self, user_id):
+        assert not self.scheduler._lock.locked()
+        self.loads += 1
+        return {concept_id: dict(row) for concept_id, row in self.rows.get(user_id, {}).items()}
+
+
+def _row(concept_id, p_known, days_ago):
+    return {"concept_id": concept_id, "p_known": p_known,
+            "last_practiced_at": (NOW - timedelta(days=days_ago)).isoformat() if days_ago is not None else None}
+
+
+def _scheduler(rows, **kwargs) -> ReviewScheduler:
+    store = RowStore(rows)
+    store.scheduler = ReviewScheduler(store, threshold=0.8, schedule_path=os.devnull, **kwargs)
+    return store.scheduler
+
+
+def test_due_time_is_when_decay_reaches_the_threshold():
+    due = review_due_times([0.95, 0.5, 0.99], [0.0, 0.0, 0.0], 0.1, [HALF_LIFE, HALF_LIFE, 0.0], threshold=0.8)
+    elapsed_days = due[0] / 86400
+    assert np.isclose(decayed_p_known(0.95, elapsed_days, 0.1, HALF_LIFE), 0.8)
+    assert np.isnan(due[1])  # not learned yet: nothing to review
+    assert np.isinf(due[2])  # never decays
+
+
+def test_due_lists_overdue_concepts_first_and_learning_separately():
+    scheduler = _scheduler({"u1": {
+        "trusses": _row("trusses", 0.95, 30),
+        "beams": _row("beams", 0.95, 10),
+        "friction": _row("friction", 0.95, 1),
+        "wedges": _row("wedges", 0.4, 2),
+        "moments": _row("moments", 0.95, None),
+    }})
+    result = scheduler.due("u1", now=NOW)
+    assert [item["concept_id"] for item in result["due"]] == ["trusses", "beams"]
+    assert result["due"][0]["overdue_days"] > result["due"][1]["overdue_days"] > 0
+    assert result["due_count"] == 2
+    # friction comes due later; wedges is still being learned and never scheduled
+    friction_due = datetime.fromisoformat(result["next_due_at"])
+    assert NOW < friction_due < NOW + timedelta(days=HALF_LIFE)
+    assert result["learning"] == [{"concept_id": "wedges", "p_known": 0.4}]
+
+
+def test_due_count_covers_items_beyond_the_limit():
+    scheduler = _scheduler({"u1": {c: _row(c, 0.95, 20 + i) for i, c in enumerate(["a", "b", "c"])}})
+    result = scheduler.due("u1", now=NOW, limit=2)
+    assert [item["concept_id"] for item in result["due"]] == ["c", "b"]
+    assert result["due_count"] == 3
+    # Returned items stay scheduled until the concept is practiced again
+    assert scheduler.due("u1", now=NOW, limit=2)["due_count"] == 3
+
+
+def test_refresh_reschedules_a_practiced_concept():
+    rows = {"u1": {"trusses": _row("trusses", 0.95, 30)}}
+    scheduler = _scheduler(rows)
+    assert scheduler.due("u1", now=NOW)["due_count"] == 1
+    rows["u1"]["trusses"] = _row("trusses", 0.97, 0)
+    scheduler.refresh("u1", ["trusses"])
+    result = scheduler.due("u1", now=NOW)
+    assert result["due_count"] == 0
+    assert datetime.fromisoformat(result["next_due_at"]) > NOW
+
+
+def test_evicted_users_are_reloaded_outside_the_lock():
+    rows = {user_id: {"trusses": _row("trusses", 0.95, 30)} for user_id in ("u1", "u2")}
+    scheduler = _scheduler(rows, max_users=1)
+    assert scheduler.due("u1", now=NOW)["due_count"] == 1
+    assert scheduler.due("u2", now=NOW)["due_count"] == 1
+    assert scheduler.due("u1", now=NOW)["due_count"] == 1
+    assert scheduler.store.loads == 3
@@ -0,0 +1,37 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from rag_service import RAGService
+
+
+def _saved_index(quantization: str) -> str:
+    service = RAGService(embedding_provider="local", index_backend=quantization, index_dir="")
+    for i in range(20):
+        service.upsert_document(f"doc{i}", f"section {i} on beams trusses and load path {i * 31}", {"course": "statics"})
+    index_dir = tempfile.mkdtemp()
+    service.save_index(index_dir)
+    return index_dir
+
+
+def test_quantized_load_keeps_embeddings_memory_mapped():
+    for quantization in ("int8", "binary"):
+        index_dir = _saved_index(quantization)
+        service = RAGService(embedding_provider="local", index_backend=quantization, index_dir="")
+        assert service.load_index(index_dir)
+        assert isinstance(service.vector_index._buffer, np.memmap)
+        assert len(service.vector_index._codes) == 20
+        assert service.retrieve_context("beams trusses load path 31", top_k=1)[0]["doc_id"] == "doc1"
+
+
+def test_quantized_index_copies_memmap_on_first_write():
+    index_dir = _saved_index("int8")
+    service = RAGService(embedding_provider="local", index_backend="int8", index_dir="")
+    assert service.load_index(index_dir)
+    service.upsert_document("doc20", "a new section on friction and wedges", {"course": "statics"})
+    assert not isinstance(service.vector_index._buffer, np.memmap)
+    assert service.retrieve_context("friction and wedges", top_k=1)[0]["doc_id"] == "doc20"
+    assert service.retrieve_context("beams trusses load path 31", top_k=1)[0]["doc_id"] == "doc1"
@@ -0,0 +1,503 @@
+# backend/vector_index.py - Vector Index Backends for RAG
+"""
+Pluggable nearest-neighbour indexes used by RAGService.
+
+- ExactIndex: brute-force cosine similarity over a packed float32 matrix.
+- IVFIndex: inverted-file approximate search (k-means coarse quantizer).
+  Only the `nprobe` closest clusters are scanned, trading recall for latency.
+- QuantizedIndex: scans int8 or binary codes, then rescores a shortlist in float32.
+
+All indexes store L2-normalized vectors, so inner product == cosine similarity.
+
+snapshot() returns a frozen, searchable view for concurrent readers. Views share
+the arrays with the live index; the live index copies them only before it
+overwrites a row a view can see (appends land past every view's row count).
+"""
+
+import copy
+import os
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest scores, sorted descending."""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, k)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def mmr_select(query: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float = 0.7) -> List[int]:
+    """
+    Maximal marginal relevance over normalized candidate vectors: each pick
+    maximizes lambda * sim(query, c) - (1 - lambda) * max sim(c, already picked).
+    The pairwise similarity matrix is computed once; each step is one vectorized
+    max update, so selection is O(k * n) after an O(n^2 * d) matmul.
+    Returns positions into `candidates`, in pick order.
+    """
+    n = len(candidates)
+    if n == 0 or k <= 0:
+        return []
+    relevance = candidates @ query
+    pairwise = candidates @ candidates.T
+    picked = [int(np.argmax(relevance))]
+    redundancy = pairwise[picked[0]].copy()
+    available = np.ones(n, dtype=bool)
+    available[picked[0]] = False
+    while len(picked) < min(k, n):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+    return picked
+
+
+class VectorIndex:
+    """
+    Interface every index backend implements.
+    Vectors are identified by string ids; adding an existing id replaces its vector.
+    """
+
+    def add(self, ids: Sequence[str], vectors) -> None:
+        raise NotImplementedError
+
+    def remove(self, ids: Sequence[str]) -> None:
+        raise NotImplementedError
+
+    def search(self, query_vector, top_k: int, candidate_ids=None) -> List[Tuple[str, float]]:
+        """
+        Returns (id, cosine similarity) pairs, best first. When candidate_ids is
+        given, only those vectors are scored (metadata pre-filtering).
+        """
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def snapshot(self) -> "VectorIndex":
+        """Frozen view of the current contents; later writes to this index do not affect it."""
+        raise NotImplementedError
+
+    def vectors(self, ids: Sequence[str]) -> np.ndarray:
+        """Stored (normalized) float32 vectors for ids, one row per id."""
+        raise NotImplementedError
+
+
+class ExactIndex(VectorIndex):
+    """Brute-force search: one matrix-vector product over every stored vector."""
+
+    def __init__(self):
+        self._buffer = None          # (capacity, dim) float32, rows [0, count) are live
+        self._ids: List[str] = []
+        self._row_of: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # Rows [0, _shared_rows) are visible to a snapshot and must not be overwritten in place
+        self._shared_rows = 0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def dim(self) -> int:
+        return 0 if self._buffer is None else self._buffer.shape[1]
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Live rows of the packed float32 matrix (a view, not a copy)."""
+        if self._buffer is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self._buffer[:len(self._ids)]
+
+    @property
+    def ids(self) -> List[str]:
+        return list(self._ids)
+
+    def load_matrix(self, ids: Sequence[str], matrix: np.ndarray):
+        """
+        Adopts an existing normalized float32 matrix without copying it, e.g. a
+        read-only np.memmap shared by several worker processes through the page cache.
+        The first mutation copies it into a private writable buffer.
+        """
+        if len(ids) != len(matrix):
+            raise ValueError(f"{len(ids)} ids for {len(matrix)} vectors")
+        with self._lock:
+            self._buffer = matrix
+            self._ids = list(ids)
+            self._row_of = {doc_id: row for row, doc_id in enumerate(self._ids)}
+            self._shared_rows = 0
+            self._on_matrix_loaded()
+
+    def _on_matrix_loaded(self):
+        """Hook for subclasses that keep per-row bookkeeping."""
+
+    def snapshot(self) -> "ExactIndex":
+        with self._lock:
+            view = copy.copy(self)
+            view._ids = list(self._ids)
+            view._row_of = dict(self._row_of)
+            view._lock = threading.Lock()
+            self._shared_rows = len(self._ids)
+            return view
+
+    def vectors(self, ids: Sequence[str]) -> np.ndarray:
+        rows = [self._row_of[doc_id] for doc_id in ids]
+        return np.asarray(self.matrix[rows], dtype=np.float32).reshape(len(rows), self.dim)
+
+    def _detach(self):
+        """Takes private copies of the shared arrays before an in-place row write."""
+        self._buffer = np.array(self._buffer, dtype=np.float32)
+        self._on_detach()
+        self._shared_rows = 0
+
+    def _on_detach(self):
+        """Hook for subclasses that keep per-row arrays."""
+
+    def _ensure_capacity(self, needed: int, dim: int):
+        if self._buffer is None:
+            self._buffer = np.zeros((max(needed, 64), dim), dtype=np.float32)
+        elif needed > self._buffer.shape[0] or not self._buffer.flags.writeable:
+            # Amortized doubling keeps one-document-at-a-time ingestion linear overall
+            grown = np.zeros((max(needed, self._buffer.shape[0] * 2), dim), dtype=np.float32)
+            grown[:len(self._ids)] = self._buffer[:len(self._ids)]
+            self._buffer = grown
+
+    def add(self, ids: Sequence[str], vectors) -> None:
+        vectors = _normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1))
+        with self._lock:
+            if self._buffer is not None and vectors.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension {vectors.shape[1]} does not match index dimension {self.dim}")
+            if self._shared_rows and any(self._row_of.get(i, self._shared_rows) < self._shared_rows for i in ids):
+                self._detach()
+            self._ensure_capacity(len(self._ids) + len(ids), vectors.shape[1])
+            for doc_id, vector in zip(ids, vectors):
+                row = self._row_of.get(doc_id)
+                if row is None:
+                    row = len(self._ids)
+                    self._ids.append(doc_id)
+                    self._row_of[doc_id] = row
+                self._buffer[row] = vector
+                self._on_row_written(row, vector)
+
+    def remove(self, ids: Sequence[str]) -> None:
+        with self._lock:
+            if self._buffer is not None and not self._buffer.flags.writeable:
+                self._ensure_capacity(len(self._ids), self.dim)
+            if self._shared_rows and any(i in self._row_of for i in ids):
+                # Swap-with-last removal moves rows that snapshots still read
+                self._detach()
+            for doc_id in ids:
+                row = self._row_of.pop(doc_id, None)
+                if row is None:
+                    continue
+                # Swap the last live row into the hole to keep rows contiguous
+                last = len(self._ids) - 1
+                if row != last:
+                    moved_id = self._ids[last]
+                    self._buffer[row] = self._buffer[last]
+                    self._ids[row] = moved_id
+                    self._row_of[moved_id] = row
+                    self._on_row_moved(last, row)
+                self._ids.pop()
+
+    def _on_row_written(self, row: int, vector: np.ndarray):
+        """Hook for subclasses that keep per-row bookkeeping."""
+
+    def _on_row_moved(self, src: int, dst: int):
+        """Hook for subclasses that keep per-row bookkeeping."""
+
+    def _prepare_query(self, query_vector) -> np.ndarray:
+        query = np.asarray(query_vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        return query / norm if norm > 0 else query
+
+    def _candidate_rows(self, candidate_ids) -> np.ndarray:
+        row_of = self._row_of
+        return np.fromiter((row_of[i] for i in candidate_ids if i in row_of), dtype=np.int64)
+
+    def _score_rows(self, query: np.ndarray, rows: np.ndarray, top_k: int) -> List[Tuple[str, float]]:
+        if len(rows) == 0:
+            return []
+        scores = self.matrix[rows] @ query
+        return [(self._ids[rows[i]], float(scores[i])) for i in _top_k(scores, top_k)]
+
+    def search(self, query_vector, top_k: int, candidate_ids=None) -> List[Tuple[str, float]]:
+        if not self._ids or top_k <= 0:
+            return []
+        query = self._prepare_query(query_vector)
+        if candidate_ids is not None:
+            return self._score_rows(query, self._candidate_rows(candidate_ids), top_k)
+        scores = self.matrix @ query
+        return [(self._ids[i], float(scores[i])) for i in _top_k(scores, top_k)]
+
+
+class IVFIndex(ExactIndex):
+    """
+    Inverted-file approximate index.
+
+    nlist:  number of k-means clusters (coarse cells). More cells = smaller scans.
+    nprobe: cells scanned per query. Higher nprobe = better recall, higher latency.
+    Until `min_train_size` vectors exist the index falls back to exact search; it
+    retrains its centroids whenever the corpus has doubled since the last training.
+    """
+
+    def __init__(self, nlist: int = 256, nprobe: int = 8, min_train_size: int = None,
+                 train_iterations: int = 10, seed: int = 0):
+        super().__init__()
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size if min_train_size is not None else nlist * 39
+        self.train_iterations = train_iterations
+        self.seed = seed
+        self._centroids = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._trained_size = 0
+
+    def _ensure_capacity(self, needed: int, dim: int):
+        super()._ensure_capacity(needed, dim)
+        if len(self._assignments) < self._buffer.shape[0]:
+            grown = np.full(self._buffer.shape[0], -1, dtype=np.int32)
+            grown[:len(self._assignments)] = self._assignments
+            self._assignments = grown
+
+    def _on_row_written(self, row: int, vector: np.ndarray):
+        if self._centroids is not None:
+            self._assignments[row] = int(np.argmax(self._centroids @ vector))
+
+    def _on_row_moved(self, src: int, dst: int):
+        self._assignments[dst] = self._assignments[src]
+
+    def _on_detach(self):
+        self._assignments = self._assignments.copy()
+
+    def _on_matrix_loaded(self):
+        self._centroids = None
+        self._trained_size = 0
+        self._assignments = np.full(len(self._buffer), -1, dtype=np.int32)
+
+    @property
+    def is_trained(self) -> bool:
+        return self._centroids is not None
+
+    def _needs_training(self) -> bool:
+        n = len(self._ids)
+        return n >= self.min_train_size and (not self.is_trained or n >= 2 * self._trained_size)
+
+    def snapshot(self) -> "IVFIndex":
+        # Train the live index first so every snapshot inherits the centroids instead of refitting them
+        if self._needs_training():
+            self.train()
+        return super().snapshot()
+
+    def train(self):
+        """Fits the coarse quantizer with spherical k-means and reassigns every row."""
+        with self._lock:
+            data = self.matrix
+            n = len(data)
+            if n == 0:
+                return
+            rng = np.random.default_rng(self.seed)
+            nlist = min(self.nlist, n)
+            sample = data[rng.choice(n, size=min(n, nlist * 256), replace=False)]
+            centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+            for _ in range(self.train_iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, sample)
+                empty = np.bincount(labels, minlength=nlist) == 0
+                # Re-seed empty cells from random samples so every list stays useful
+                sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+                centroids = _normalize_rows(sums)
+
+            assignments = np.empty(n, dtype=np.int32)
+            for start in range(0, n, 8192):
+                assignments[start:start + 8192] = np.argmax(data[start:start + 8192] @ centroids.T, axis=1)
+            # Fresh array: the old one may be shared with snapshots
+            grown = self._assignments.copy()
+            grown[:n] = assignments
+            self._centroids = centroids
+            self._assignments = grown
+            self._trained_size = n
+
+    def search(self, query_vector, top_k: int, candidate_ids=None) -> List[Tuple[str, float]]:
+        n = len(self._ids)
+        if self._needs_training():
+            self.train()
+        if not self.is_trained:
+            return super().search(query_vector, top_k, candidate_ids)
+        if n == 0 or top_k <= 0:
+            return []
+
+        query = self._prepare_query(query_vector)
+        candidate_rows = None
+        if candidate_ids is not None:
+            candidate_rows = self._candidate_rows(candidate_ids)
+            # A narrow filter is already cheaper to scan exactly than to probe
+            if len(candidate_rows) <= self.min_train_size:
+                return self._score_rows(query, candidate_rows, top_k)
+
+        probes = _top_k(self._centroids @ query, min(self.nprobe, len(self._centroids)))
+        probe_mask = np.zeros(len(self._centroids) + 1, dtype=bool)
+        probe_mask[probes] = True
+        # Rows added before training carry -1, which indexes the always-False sentinel slot
+        if candidate_rows is None:
+            rows = np.flatnonzero(probe_mask[self._assignments[:n]])
+        else:
+            rows = candidate_rows[probe_mask[self._assignments[candidate_rows]]]
+        return self._score_rows(query, rows, top_k)
+
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(codes: np.ndarray) -> np.ndarray:
+        return _POPCOUNT_TABLE[codes]
+
+
+class QuantizedIndex(ExactIndex):
+    """
+    Scans compact codes instead of float32 vectors, then rescores a shortlist exactly.
+
+    quantization: "int8"   - per-vector symmetric scalar quantization (4x smaller)
+                  "binary" - one sign bit per dimension, Hamming distance (32x smaller)
+    rescore:      shortlist size rescored against the float32 vectors. Larger = better
+                  recall, slower queries. The float32 matrix is only touched for the
+                  shortlist, so it can stay memory-mapped on disk.
+    """
+
+    def __init__(self, quantization: str = "int8", rescore: int = 256, block_rows: int = None):
+        if quantization not in ("int8", "binary"):
+            raise ValueError(f"Unknown quantization '{quantization}'. Choose int8 or binary.")
+        super().__init__()
+        self.quantization = quantization
+        self.rescore = rescore
+        # int8 blocks are upcast to float32 before the matmul, so keep them cache-sized
+        self.block_rows = block_rows or (256 if quantization == "int8" else 8192)
+        self._codes = None
+        self._scales = None
+
+    def _encode(self, vectors: np.ndarray):
+        """Returns (codes, scales) for a 2-D block of normalized vectors."""
+        if self.quantization == "binary":
+            return np.packbits(vectors > 0, axis=1), None
+        scales = np.abs(vectors).max(axis=1)
+        scales[scales == 0] = 1.0
+        codes = np.round(vectors / scales[:, None] * 127).astype(np.int8)
+        return codes, (scales / 127).astype(np.float32)
+
+    def _allocate_codes(self, capacity: int, dim: int):
+        width = (dim + 7) // 8 if self.quantization == "binary" else dim
+        dtype = np.uint8 if self.quantization == "binary" else np.int8
+        return np.zeros((capacity, width), dtype=dtype), np.ones(capacity, dtype=np.float32)
+
+    def _ensure_capacity(self, needed: int, dim: int):
+        super()._ensure_capacity(needed, dim)
+        capacity = self._buffer.shape[0]
+        if self._codes is None or len(self._codes) < capacity:
+            codes, scales = self._allocate_codes(capacity, dim)
+            if self._codes is not None:
+                codes[:len(self._codes)] = self._codes
+                scales[:len(self._scales)] = self._scales
+            self._codes, self._scales = codes, scales
+
+    def _on_row_written(self, row: int, vector: np.ndarray):
+        codes, scales = self._encode(vector[None, :])
+        self._codes[row] = codes[0]
+        if scales is not None:
+            self._scales[row] = scales[0]
+
+    def _on_row_moved(self, src: int, dst: int):
+        self._codes[dst] = self._codes[src]
+        self._scales[dst] = self._scales[src]
+
+    def _on_detach(self):
+        if self._codes is not None:
+            self._codes, self._scales = self._codes.copy(), self._scales.copy()
+
+    def _on_matrix_loaded(self):
+        self._codes, self._scales = None, None
+        if self._buffer is None or len(self._buffer) == 0:
+            return
+        # Codes only: the float32 buffer may be a read-only memmap that must stay on disk
+        self._codes, self._scales = self._allocate_codes(len(self._ids), self.dim)
+        for start in range(0, len(self._ids), self.block_rows):
+            block = np.asarray(self._buffer[start:start + self.block_rows])
+            codes, scales = self._encode(block)
+            self._codes[start:start + len(block)] = codes
+            if scales is not None:
+                self._scales[start:start + len(block)] = scales
+
+    def code_bytes(self) -> int:
+        """Bytes scanned per query (codes + scales) for every live vector."""
+        n = len(self._ids)
+        if self._codes is None:
+            return 0
+        return self._codes[:n].nbytes + (self._scales[:n].nbytes if self.quantization == "int8" else 0)
+
+    def _approximate_scores(self, query: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        n = len(self._ids)
+        codes = self._codes[:n] if rows is None else self._codes[rows]
+        if self.quantization == "binary":
+            query_bits = np.packbits(query > 0)
+            scores = np.empty(len(codes), dtype=np.int32)
+            for start in range(0, len(codes), self.block_rows):
+                block = codes[start:start + self.block_rows]
+                # Fewer differing sign bits = more similar
+                scores[start:start + len(block)] = -_popcount(block ^ query_bits).sum(axis=1, dtype=np.int32)
+            return scores
+        scales = self._scales[:n] if rows is None else self._scales[rows]
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), self.block_rows):
+            block = codes[start:start + self.block_rows]
+            scores[start:start + len(block)] = (block.astype(np.float32) @ query) * scales[start:start + len(block)]
+        return scores
+
+    def search(self, query_vector, top_k: int, candidate_ids=None) -> List[Tuple[str, float]]:
+        if not self._ids or top_k <= 0:
+            return []
+        query = self._prepare_query(query_vector)
+        rows = self._candidate_rows(candidate_ids) if candidate_ids is not None else None
+        if rows is not None and len(rows) == 0:
+            return []
+        approx = self._approximate_scores(query, rows)
+        shortlist = _top_k(approx, max(self.rescore, top_k))
+        if rows is not None:
+            shortlist = rows[shortlist]
+        return self._score_rows(query, np.sort(shortlist), top_k)
+
+
+INDEX_BACKENDS = {
+    "exact": ExactIndex,
+    "ivf": IVFIndex,
+    "int8": lambda **params: QuantizedIndex(quantization="int8", **params),
+    "binary": lambda **params: QuantizedIndex(quantization="binary", **params),
+}
+
+
+def create_vector_index(backend: str = None, **params) -> VectorIndex:
+    """
+    Builds an index backend by name. Defaults come from the environment:
+    RAG_INDEX_BACKEND (exact | ivf | int8 | binary), RAG_IVF_NLIST, RAG_IVF_NPROBE,
+    RAG_QUANT_RESCORE.
+    """
+    backend = (backend or os.environ.get("RAG_INDEX_BACKEND", "exact")).lower()
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown vector index backend '{backend}'. Choose from {sorted(INDEX_BACKENDS)}")
+    if backend == "ivf":
+        params.setdefault("nlist", int(os.environ.get("RAG_IVF_NLIST", "256")))
+        params.setdefault("nprobe", int(os.environ.get("RAG_IVF_NPROBE", "8")))
+    if backend in ("int8", "binary"):
+        params.setdefault("rescore", int(os.environ.get("RAG_QUANT_RESCORE", "256")))
+    return INDEX_BACKENDS[backend](**params)
@@ -1,8 +1,26 @@
 import { useState, useEffect } from 'react';
-import { supabase } from '../lib/supabase';
 import API_BASE from '../lib/apiConfig';
+import { authHeaders } from '../lib/knowledgeService';
+
+// Lays the prerequisite DAG out left to right by level, spreading each level vertically
+const layoutByLevel = (nodes, width = 800, height = 500) => {
+    const levels = {};
+    nodes.forEach(node => {
+        (levels[node.level] = levels[node.level] || []).push(node);
+    });
+    const depth = Math.max(0, ...nodes.map(node => node.level));
+    return nodes.map(node => {
+        const column = levels[node.level];
+        const row = column.indexOf(node);
+        return {
+            ...node,
+            x: 60 + (depth ? node.level * (width - 260) / depth : 0),
+            y: (row + 1) * height / (column.length + 1)
+        };
+    });
+};
 
-export default function KnowledgeGraph() {
+export default function KnowledgeGraph({ course = 'inst-design' }) {
     const [graphData, setGraphData] = useState(null);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
@@ -11,29 +29,11 @@ export default function KnowledgeGraph() {
     useEffect(() => {
         const fetchGraph = async () => {
             try {
-                // 1. Fetch user mastery from Supabase
-                const { data: { session } } = await supabase.auth.getSession();
-                const userId = session?.user?.id;
-
-                let masteryMap = {};
-                if (userId) {
-                    const { data: masteryRecords } = await supabase
-                        .from('mastery')
-                        .select('concept_id, p_known')
-                        .eq('user_id', userId);
-
-                    if (masteryRecords) {
-                        masteryRecords.forEach(record => {
-                            masteryMap[record.concept_id] = record.p_known;
-                        });
-                    }
-                }
-
-                // 2. Fetch the graph topology from our new backend endpoint
+                // The backend reads the signed-in user's mastery from its store and overlays it on the course DAG
                 const response = await fetch(`${API_BASE}/mastery_graph`, {
                     method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ mastery_data: masteryMap })
+                    headers: await authHeaders(),
+                    body: JSON.stringify({ course })
                 });
 
                 if (!response.ok) {
@@ -41,19 +41,7 @@ export default function KnowledgeGraph() {
                     throw new Error(`Failed to load graph data: ${response.status} ${errText}`);
                 }
                 const data = await response.json();
-
-                // Add layout positions mechanically for our 6 hardcoded nodes
-                const layedOutNodes = data.nodes.map(node => {
-                    const positions = {
-                        "ct_1_1": { x: 400, y: 100 },
-                        "ct_1_2": { x: 250, y: 200 },
-                        "ct_1_3": { x: 250, y: 350 },
-                        "ct_2_1": { x: 550, y: 200 },
-                        "ct_2_2": { x: 550, y: 300 },
-                        "ct_2_3": { x: 550, y: 400 },
-                    };
-                    return { ...node, ...positions[node.id] };
-                });
+                const layedOutNodes = layoutByLevel(data.nodes);
 
                 setGraphData({ nodes: layedOutNodes, links: data.links });
             } catch (err) {
@@ -65,7 +53,7 @@ export default function KnowledgeGraph() {
         };
 
         fetchGraph();
-    }, []);
+    }, [course]);
 
     if (loading) return <div className="text-center p-8 text-slate-500 animate-pulse">Loading Brain Network...</div>;
     if (error) return <div className="text-center p-8 text-red-500">Failed to load graph.</div>;
@@ -1,6 +1,6 @@
 import { useState, useEffect, useRef } from 'react'
 import API_BASE from '../lib/apiConfig'
-import { fuseTelemetry } from '../lib/knowledgeService'
+import { fuseTelemetry, recommendNextProblem } from '../lib/knowledgeService'
 
 const STUCK_RULES = {
     IDLE_TIMEOUT_MS: 90000,
@@ -127,6 +127,13 @@ export default function PracticeBlock({ practice, sectionId, onStuckEvent }) {
         }
     }
 
+    // Jump to the problem the BKT recommender expects to be most informative
+    const handleSuggestNext = async () => {
+        const recommendation = await recommendNextProblem(sectionId, Object.keys(gradeResults))
+        const index = problems.findIndex(p => p.id === recommendation?.problem_id)
+        if (index >= 0) setCurrentIndex(index)
+    }
+
     // Update answer value
     const updateAnswer = (problemId, field, value) => {
         setAnswers(prev => ({
@@ -300,6 +307,13 @@ export default function PracticeBlock({ practice, sectionId, onStuckEvent }) {
                 >
                     ← Previous
                 </button>
+                <button
+                    onClick={handleSuggestNext}
+                    disabled={totalAnswered === problems.length}
+                    className="px-4 py-2 text-[#9E1B32] font-medium hover:text-[#7A1527] disabled:opacity-50"
+                >
+                    🎯 Suggested next
+                </button>
                 <button
                     onClick={() => setCurrentIndex(Math.min(problems.length - 1, currentIndex + 1))}
                     disabled={currentIndex === problems.length - 1}
@@ -189,7 +189,7 @@ export default function ReadingPane({ sectionData, loading, onStuckEvent, onAskA
                 {/* Knowledge Graph Overlay */}
                 {showGraph && (
                     <div className="mb-8 animate-fade-in origin-top">
-                        <KnowledgeGraph />
+                        <KnowledgeGraph course={meta?.course} />
                     </div>
                 )}
 
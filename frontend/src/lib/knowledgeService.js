@@ -1,5 +1,17 @@
 import API_BASE from './apiConfig';
 import { supabase } from './supabase';
+import { logTelemetryFusion } from './loggingService';
+
+/**
+ * JSON headers carrying the user's Supabase access token. The backend takes the user id from the
+ * verified token, never from the request body, so anonymous calls get stateless behaviour only.
+ */
+export const authHeaders = async () => {
+    const { data: { session } } = await supabase.auth.getSession();
+    const headers = { 'Content-Type': 'application/json' };
+    if (session?.access_token) headers.Authorization = `Bearer ${session.access_token}`;
+    return headers;
+};
 
 /**
  * Generates a formative assessment based on current context.
@@ -66,42 +78,22 @@ export const gradeSummary = async (question, studentAnswer, rubric) => {
 };
 
 /**
- * Updates the user's mastery score in Supabase for a set of concepts using the BKT Engine on the backend.
+ * Applies a graded attempt to the user's mastery with the BKT engine on the backend.
+ * The backend owns the mastery rows (load, update and persist), so this is one request.
  * Expects a q_matrix like {"concept1": 1.0, "concept2": 0.5}
  */
 export const updateMastery = async (qMatrix, isCorrect) => {
     try {
         const { data: { session } } = await supabase.auth.getSession();
-        let userId = session?.user?.id;
-
-        if (!userId) {
+        if (!session?.user?.id) {
             console.warn('No active user session for mastery update.');
             return null;
         }
 
-        // 1. Fetch current states for all concepts in the Q-Matrix
-        const conceptIds = Object.keys(qMatrix);
-        const { data: existingRecords, error: fetchError } = await supabase
-            .from('mastery')
-            .select('*')
-            .eq('user_id', userId)
-            .in('concept_id', conceptIds);
-
-        if (fetchError) throw fetchError;
-
-        // Build current state dictionary
-        let currentStates = {};
-        conceptIds.forEach(cid => {
-            const record = existingRecords?.find(r => r.concept_id === cid);
-            currentStates[cid] = record ? record.p_known : 0.1; // Default prior
-        });
-
-        // 2. Call Python backend BKT engine
         const response = await fetch(`${API_BASE}/grade`, {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: { 'Content-Type': 'application/json', Authorization: `Bearer ${session.access_token}` },
             body: JSON.stringify({
-                current_states: currentStates,
                 q_matrix: qMatrix,
                 is_correct: isCorrect
             })
@@ -109,37 +101,6 @@ export const updateMastery = async (qMatrix, isCorrect) => {
 
         if (!response.ok) throw new Error('BKT grading failed');
         const { new_states } = await response.json();
-
-        // 3. Upsert the new values back to Supabase
-        const upsertData = Object.entries(new_states).map(([cid, newPKnown]) => {
-            const record = existingRecords?.find(r => r.concept_id === cid);
-            let attempts = (record ? record.attempts_count : 0) + 1;
-            let correctCount = (record ? record.correct_count : 0) + (isCorrect ? 1 : 0);
-
-            // Map p_known to a legacy confidence level or mastery score
-            let confidence = 'low';
-            if (newPKnown > 0.8 && attempts > 2) confidence = 'high';
-            else if (newPKnown > 0.5) confidence = 'medium';
-
-            return {
-                user_id: userId,
-                concept_id: cid,
-                p_known: newPKnown,
-                mastery_score: newPKnown, // using p_known as mastery score proxy
-                attempts_count: attempts,
-                correct_count: correctCount,
-                confidence_level: confidence,
-                updated_at: new Date().toISOString(),
-                last_practiced_at: new Date().toISOString()
-            };
-        });
-
-        const { error: upsertError } = await supabase
-            .from('mastery')
-            .upsert(upsertData, { onConflict: 'user_id,concept_id' });
-
-        if (upsertError) throw upsertError;
-
         return new_states;
 
     } catch (error) {
@@ -149,47 +110,159 @@ export const updateMastery = async (qMatrix, isCorrect) => {
 };
 
 /**
- * Adjust BKT priors based on interaction telemetry (Soft Evidence)
+ * Seeds the signed-in user's mastery from a placement diagnostic ({concept_id: p_known}).
+ * Goes through the backend store so its cached rows and write-behind flush stay authoritative.
  */
-export const fuseTelemetry = async (conceptId, interactionType, intensity = 1.0) => {
-    try {
-        const { data: { session } } = await supabase.auth.getSession();
-        let userId = session?.user?.id;
-        if (!userId) return null;
+export const setPlacementMastery = async (pKnown) => {
+    const response = await fetch(`${API_BASE}/mastery/placement`, {
+        method: 'POST',
+        headers: await authHeaders(),
+        body: JSON.stringify({ p_known: pKnown })
+    });
+    if (!response.ok) throw new Error(`Placement update failed: ${response.status}`);
+    const { new_states } = await response.json();
+    return new_states;
+};
 
-        const { data: records } = await supabase
-            .from('mastery')
-            .select('*')
-            .eq('user_id', userId)
-            .eq('concept_id', conceptId)
-            .single();
+/**
+ * Reads the user's mastery rows from the backend, including updates not yet flushed to Supabase.
+ * Returns {concept_id: row}; effective_p_known is p_known with forgetting since last_practiced_at applied.
+ */
+export const getMastery = async (userId) => {
+    const response = await fetch(`${API_BASE}/mastery/${encodeURIComponent(userId)}`, {
+        headers: await authHeaders()
+    });
+    if (!response.ok) throw new Error(`Mastery lookup failed: ${response.status}`);
+    const { concepts } = await response.json();
+    return concepts;
+};
 
-        let currentSlip = records?.p_slip ?? 0.1;
-        let currentTransit = records?.p_transit ?? 0.1;
+/**
+ * Concepts the user should review now (forgetting has taken them below the review threshold),
+ * most overdue first. Returns { due: [{ concept_id, due_at, overdue_days }], due_count, next_due_at,
+ * learning: [{ concept_id, p_known }] } where learning lists practiced concepts not yet mastered.
+ */
+export const getReviewsDue = async (limit = 10) => {
+    const params = new URLSearchParams({ limit: String(limit) });
+    const response = await fetch(`${API_BASE}/review/due?${params}`, { headers: await authHeaders() });
+    if (!response.ok) throw new Error(`Review lookup failed: ${response.status}`);
+    return response.json();
+};
 
-        const response = await fetch(`${API_BASE}/telemetry_fusion`, {
+/**
+ * Expected further practice attempts to mastery for a roster x concept matrix (instructor dashboards).
+ * Pass concept ids, or a course to use all of its concepts. Other students' rows need a
+ * service-role token; a signed-in student can forecast only their own. Returns
+ * { user_ids, concept_ids, expected_attempts: [[n or null per concept] per user] }.
+ */
+export const forecastAttemptsToMastery = async (userIds, { conceptIds = [], course = null } = {}) => {
+    const response = await fetch(`${API_BASE}/mastery/forecast`, {
+        method: 'POST',
+        headers: await authHeaders(),
+        body: JSON.stringify({ user_ids: userIds, concept_ids: conceptIds, course })
+    });
+    if (!response.ok) throw new Error(`Mastery forecast failed: ${response.status}`);
+    return response.json();
+};
+
+/**
+ * Asks the backend which practice problem is most informative for the user right now.
+ * sectionId ("course/chapter/section") keeps the pick within one section; exclude skips problem ids.
+ */
+export const recommendNextProblem = async (sectionId, exclude = []) => {
+    try {
+        const [course, chapter, section] = sectionId.split('/');
+
+        const response = await fetch(`${API_BASE}/recommend/next`, {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: await authHeaders(),
             body: JSON.stringify({
-                current_p_slip: currentSlip,
-                current_p_transit: currentTransit,
-                interaction_type: interactionType,
-                intensity: intensity
+                course,
+                section_id: `${chapter}/${section}`,
+                exclude
             })
         });
 
-        if (!response.ok) throw new Error('Telemetry fusion failed');
-        const { new_p_slip, new_p_transit } = await response.json();
+        if (!response.ok) throw new Error(`Recommendation failed: ${response.status}`);
+        const { recommendations } = await response.json();
+        return recommendations[0] || null;
+    } catch (error) {
+        console.error('Error recommending next problem:', error);
+        return null;
+    }
+};
+
+// Telemetry events are queued and sent as one ordered batch, like loggingService's event queue
+const TELEMETRY_FLUSH_INTERVAL_MS = 5000;
+let telemetryQueue = []; // { userId, accessToken, conceptId, interactionType, intensity, resolve }
+let telemetryTimer = null;
 
-        await supabase.from('mastery').upsert({
-            user_id: userId,
-            concept_id: conceptId,
-            p_slip: new_p_slip,
-            p_transit: new_p_transit,
-            updated_at: new Date().toISOString()
-        }, { onConflict: 'user_id,concept_id' });
+const flushTelemetry = async ({ keepalive = false } = {}) => {
+    clearTimeout(telemetryTimer);
+    telemetryTimer = null;
+    if (telemetryQueue.length === 0) return;
 
-        return { new_p_slip, new_p_transit };
+    // One request per user (normally one); the backend applies each user's events in order
+    const queued = telemetryQueue;
+    telemetryQueue = [];
+    const byUser = new Map();
+    queued.forEach(event => {
+        if (!byUser.has(event.userId)) byUser.set(event.userId, []);
+        byUser.get(event.userId).push(event);
+    });
+
+    await Promise.all([...byUser.entries()].map(async ([userId, events]) => {
+        try {
+            // The freshest token among the user's events (tokens refresh while events queue)
+            const accessToken = events[events.length - 1].accessToken;
+            const response = await fetch(`${API_BASE}/telemetry_fusion/batch`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', Authorization: `Bearer ${accessToken}` },
+                keepalive,
+                body: JSON.stringify({
+                    concept_ids: events.map(e => e.conceptId),
+                    interaction_types: events.map(e => e.interactionType),
+                    intensities: events.map(e => e.intensity)
+                })
+            });
+
+            if (!response.ok) throw new Error('Telemetry fusion failed');
+            const { priors } = await response.json();
+            events.forEach(e => {
+                const prior = priors[userId]?.[e.conceptId];
+                e.resolve(prior ? { new_p_slip: prior.p_slip, new_p_transit: prior.p_transit } : null);
+            });
+        } catch (error) {
+            console.error('Error fusing telemetry:', error);
+            events.forEach(e => e.resolve(null));
+        }
+    }));
+};
+
+if (typeof window !== 'undefined') {
+    window.addEventListener('pagehide', () => flushTelemetry({ keepalive: true }));
+}
+
+/**
+ * Adjust BKT priors based on interaction telemetry (Soft Evidence).
+ * Events are batched; resolves with the concept's priors after the batch is applied.
+ * Events with no concept (untagged problems or activities) are dropped and resolve with null.
+ */
+export const fuseTelemetry = async (conceptId, interactionType, intensity = 1.0) => {
+    if (!conceptId) return null;
+    try {
+        const { data: { session } } = await supabase.auth.getSession();
+        const userId = session?.user?.id;
+        if (!userId) return null;
+
+        logTelemetryFusion(conceptId, interactionType, intensity);
+
+        return await new Promise(resolve => {
+            telemetryQueue.push({
+                userId, accessToken: session.access_token, conceptId, interactionType, intensity, resolve
+            });
+            if (!telemetryTimer) telemetryTimer = setTimeout(flushTelemetry, TELEMETRY_FLUSH_INTERVAL_MS);
+        });
 
     } catch (error) {
         console.error('Error fusing telemetry:', error);
@@ -229,6 +229,17 @@ export function logTimeOnTask(durationMs, sectionId) {
     }, sectionId)
 }
 
+/**
+ * Log a telemetry fusion (soft BKT evidence) so mastery can be rebuilt by replay
+ */
+export function logTelemetryFusion(conceptId, interactionType, intensity, sectionId = null) {
+    return logEvent('telemetry_fusion', conceptId, {
+        concept_id: conceptId,
+        interaction_type: interactionType,
+        intensity: intensity
+    }, sectionId)
+}
+
 /**
  * Log specific interactions like opening accordions or tabs
  */
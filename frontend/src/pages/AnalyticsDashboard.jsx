@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react'
 import { useNavigate } from 'react-router-dom'
 import { supabase } from '../lib/supabase'
+import { getMastery } from '../lib/knowledgeService'
 import '../index.css'
 
 export default function AnalyticsDashboard({ user }) {
@@ -40,16 +41,13 @@ export default function AnalyticsDashboard({ user }) {
                 return
             }
 
-            // Fetch mastery scores
-            const { data, error } = await supabase
-                .from('mastery')
-                .select('concept_id, mastery_score, confidence_level, correct_count, attempts_count')
-                .eq('user_id', userIdToFetch)
-                .order('mastery_score', { ascending: false })
+            // Fetch mastery scores as of now (forgetting decay is applied by the backend on read)
+            const concepts = await getMastery(userIdToFetch)
+            const data = Object.values(concepts)
+                .map(row => ({ ...row, mastery_score: row.effective_p_known ?? row.mastery_score }))
+                .sort((a, b) => b.mastery_score - a.mastery_score)
 
-            if (data) {
-                setMasteryData(data)
-            }
+            setMasteryData(data)
         } catch (err) {
             console.error('Error fetching analytics:', err)
         } finally {
@@ -2,6 +2,7 @@ import { useState, useEffect } from 'react'
 import { useParams, useNavigate } from 'react-router-dom'
 import { supabase } from '../lib/supabase'
 import API_BASE from '../lib/apiConfig'
+import { setPlacementMastery } from '../lib/knowledgeService'
 import '../index.css'
 
 // ============================================================================
@@ -93,28 +94,14 @@ export default function DiagnosticAssessment() {
             }
         })
 
-        // Attempt to sync with Supabase Knowledge Graph stats
+        // Seed mastery through the backend store, which owns (and write-behind caches) the rows
         const { data: { session } } = await supabase.auth.getSession();
-        if (session?.user?.id) {
-            const userId = session.user.id;
-
-            const recordsToUpsert = Object.entries(conceptUpdates).map(([conceptId, p_known]) => {
-                return {
-                    user_id: userId,
-                    concept_id: conceptId,
-                    p_known: p_known
-                };
-            });
-
-            if (recordsToUpsert.length > 0) {
-                const { error } = await supabase
-                    .from('mastery')
-                    .upsert(recordsToUpsert, { onConflict: 'user_id, concept_id' });
-
-                if (error) {
-                    console.error("Failed to update mastery from diagnostic. Supabase might need 'concepts' table updated with the new bio-inspired keys: ", error);
-                    // Do not block the user from proceeding if the database insert fails
-                }
+        if (session?.user?.id && Object.keys(conceptUpdates).length > 0) {
+            try {
+                await setPlacementMastery(conceptUpdates);
+            } catch (error) {
+                console.error("Failed to update mastery from diagnostic: ", error);
+                // Do not block the user from proceeding if the update fails
             }
         }
 